@@ -0,0 +1,153 @@
+"""
+This Python module loads the images of the interface.
+
+An AssetManager loads each image file once, converts it to the format of the display, and keeps every scaled
+variant of it that has been asked for, so that widgets sharing an image also share its surfaces. It can
+optionally pack the images it hands out into texture atlases: a few large surfaces that the images are
+subsurfaces of.
+"""
+
+from __future__ import annotations
+from typing import Optional
+
+import pygame
+
+
+class _AtlasPage:
+    """A surface that images are packed into in shelves: rows as tall as the tallest image placed in them.
+
+    Instance Attributes:
+        - surface: the surface the images are packed into
+    """
+    # Private Instance Attributes:
+    #     - _shelf_y: the top of the current shelf
+    #     - _shelf_height: the height of the current shelf
+    #     - _x: where the next image on the current shelf starts
+    surface: pygame.Surface
+    _shelf_y: int
+    _shelf_height: int
+    _x: int
+
+    def __init__(self, size: int) -> None:
+        """Initialize an empty square page with the given width and height."""
+        self.surface = pygame.Surface((size, size), pygame.SRCALPHA).convert_alpha()
+        self.surface.fill((0, 0, 0, 0))
+        self._shelf_y = 0
+        self._shelf_height = 0
+        self._x = 0
+
+    def place(self, image: pygame.Surface) -> Optional[pygame.Surface]:
+        """Copy the given image into this page and return the subsurface holding it, or return None if there is
+        no room for it.
+        """
+        width, height = image.get_size()
+        page_width, page_height = self.surface.get_size()
+        if self._x + width > page_width:
+            self._shelf_y += self._shelf_height
+            self._shelf_height = 0
+            self._x = 0
+        if width > page_width or self._shelf_y + height > page_height:
+            return None
+
+        rect = pygame.Rect(self._x, self._shelf_y, width, height)
+        # the page is transparent black, so taking the maximum of each channel copies the image exactly
+        self.surface.blit(image, rect, special_flags=pygame.BLEND_RGBA_MAX)
+        self._x += width
+        self._shelf_height = max(self._shelf_height, height)
+        return self.surface.subsurface(rect)
+
+
+class AssetManager:
+    """Loads, converts and scales the images of the interface, doing each only once.
+
+    Images are loaded with image(path), and scaled with scaled(image, size). A scaled variant is keyed on the
+    path the image was loaded from and the size, so every widget that scales the same image to the same size
+    gets the same surface.
+
+    A display mode must be set before any image is loaded.
+
+    Instance Attributes:
+        - atlas_size: the width and height of each atlas page, or None if images are not packed into atlases.
+          Only images no larger than half a page in either direction are packed; larger ones, like the
+          backgrounds, are kept as separate surfaces.
+    """
+    # Private Instance Attributes:
+    #     - _images: maps the path of each loaded image to its surface
+    #     - _scaled: maps (path, size) to the scaled variant of the image at path
+    #     - _paths: maps each surface handed out by image() to the path it was loaded from
+    #     - _pages: the atlas pages, the last of which is being filled
+    atlas_size: Optional[int]
+    _images: dict[str, pygame.Surface]
+    _scaled: dict[tuple[str, tuple[int, int]], pygame.Surface]
+    _paths: dict[pygame.Surface, str]
+    _pages: list[_AtlasPage]
+
+    def __init__(self, atlas_size: Optional[int] = None) -> None:
+        """Initialize an asset manager that has not loaded any images.
+
+        Preconditions:
+            - atlas_size is None or atlas_size > 0
+        """
+        self.atlas_size = atlas_size
+        self._images = {}
+        self._scaled = {}
+        self._paths = {}
+        self._pages = []
+
+    def image(self, path: str) -> pygame.Surface:
+        """Return the image at the given path, converted to the format of the display."""
+        if path not in self._images:
+            image = self._packed(pygame.image.load(path).convert_alpha())
+            self._images[path] = image
+            self._paths[image] = path
+        return self._images[path]
+
+    def scaled(self, image: pygame.Surface, size: tuple[float, float]) -> pygame.Surface:
+        """Return the given image smoothly scaled to the given size.
+
+        The result is only memoized if the image was returned by image(); other images are scaled every time.
+        """
+        size = (int(size[0]), int(size[1]))
+        path = self._paths.get(image)
+        if path is None:
+            return pygame.transform.smoothscale(image, size)
+
+        if (path, size) not in self._scaled:
+            if image.get_size() == size:
+                self._scaled[(path, size)] = image
+            else:
+                self._scaled[(path, size)] = self._packed(pygame.transform.smoothscale(image, size))
+        return self._scaled[(path, size)]
+
+    def memory_usage(self) -> int:
+        """Return the number of bytes of pixel data held by this manager's surfaces.
+
+        Packed images are counted through their atlas pages, so unused space on the pages is included.
+        """
+        surfaces = {surface for surface in list(self._images.values()) + list(self._scaled.values())
+                    if surface.get_parent() is None}
+        surfaces.update(page.surface for page in self._pages)
+        return sum(surface.get_width() * surface.get_height() * surface.get_bytesize() for surface in surfaces)
+
+    def _packed(self, image: pygame.Surface) -> pygame.Surface:
+        """Return the given image packed into an atlas page, or the image itself if it is not to be packed."""
+        if self.atlas_size is None or max(image.get_size()) > self.atlas_size // 2:
+            return image
+
+        if self._pages:
+            packed = self._pages[-1].place(image)
+            if packed is not None:
+                return packed
+        self._pages.append(_AtlasPage(self.atlas_size))
+        return self._pages[-1].place(image)
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['pygame'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,519 @@
+"""
+This Python module contains benchmarks for the recipe network and the app.
+
+Each benchmark returns its measurements as a dictionary, so they can be printed or compared between runs.
+Running this module runs every benchmark on recipes.json and prints the results.
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Optional
+import itertools
+import os
+import random
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import assets
+import compact_graph
+import graphs
+import ingredients
+import nutrition
+import similarity
+import snapshot
+import text_search
+
+
+class _UnslottedVertex:
+    """A dict-backed vertex laid out like graphs._Vertex was before it used __slots__.
+
+    This is only used to measure how much memory the slotted representation saves.
+    """
+    item: Any
+    kind: str
+    neighbours: set
+    index: int
+
+    def __init__(self, item: Any, kind: str) -> None:
+        self.item = item
+        self.kind = kind
+        self.neighbours = set()
+        self.index = -1
+
+
+class _UnslottedFoodVertex(_UnslottedVertex):
+    """A dict-backed food vertex laid out like graphs._FoodVertex was before it used __slots__."""
+    recipe_id: Any
+    url: str
+    image: str
+    description: str
+    rating: int
+
+    def __init__(self, item: Any, kind: str, url: str, image: str, description: str, rating: int,
+                 source: Any = None, locator: Any = None, recipe_id: Any = None) -> None:
+        super().__init__(item, kind)
+        self.recipe_id = item if recipe_id is None else recipe_id
+        self.url = url
+        self.image = image
+        self.description = description
+        self.rating = rating
+
+
+def _traced_memory(build: Callable[[], Any]) -> int:
+    """Return the number of bytes still allocated by build() once it has returned.
+
+    The result of build() is kept alive until the measurement is taken.
+    """
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def benchmark_graph_memory(recipes_file: str) -> dict[str, int]:
+    """Return the number of bytes held by graphs built from the given recipes file with:
+        - 'unslotted': dict-backed vertices, as before the vertices used __slots__
+        - 'slotted': slotted vertices that keep their text fields
+        - 'slotted_lazy_text': slotted vertices that read their text fields from the file on access
+        - 'compact': a compact_graph.CompactGraph, whose text columns are UTF-8 blobs
+    """
+    vertex_classes = (graphs._Vertex, graphs._FoodVertex)
+    graphs._Vertex, graphs._FoodVertex = _UnslottedVertex, _UnslottedFoodVertex
+    try:
+        unslotted = _traced_memory(lambda: graphs.build_graph(recipes_file, use_snapshot=False))
+    finally:
+        graphs._Vertex, graphs._FoodVertex = vertex_classes
+
+    slotted = _traced_memory(lambda: graphs.build_graph(recipes_file, use_snapshot=False))
+    slotted_lazy_text = _traced_memory(lambda: graphs.build_graph(recipes_file, lazy_text=True, use_snapshot=False))
+    compact = _traced_memory(lambda: compact_graph.build_compact_graph(recipes_file))
+
+    return {'unslotted': unslotted, 'slotted': slotted, 'slotted_lazy_text': slotted_lazy_text, 'compact': compact}
+
+
+def benchmark_snapshot_startup(recipes_file: str) -> dict[str, float]:
+    """Return the number of seconds taken to build a graph from the given recipes file:
+        - 'no_snapshot': without using a snapshot at all
+        - 'cold': with no snapshot yet, so the graph is built from the file and a snapshot is written
+        - 'warm': with the snapshot written by the cold build
+    """
+    path = snapshot.snapshot_path(recipes_file)
+    if os.path.exists(path):
+        os.remove(path)
+
+    timings = {}
+    for name, use_snapshot in [('no_snapshot', False), ('cold', True), ('warm', True)]:
+        start = time.perf_counter()
+        graphs.build_graph(recipes_file, use_snapshot=use_snapshot)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def _legacy_calc_time(time: str) -> int:
+    """Return the number of minutes in the given string of time, as graphs.calc_time did before it used a
+    compiled, cached parser.
+    """
+    if 'No Time' in time:
+        return 0
+
+    if '-' in time:
+        time = time.split(' - ')[-1]
+
+    if 'and' in time:
+        hrs, mins = time.split(' and ')[0], time.split(' and ')[1]
+        total_mins = 60 * int(hrs.split()[0]) + int(mins.split()[0])
+        return total_mins
+
+    if 'hr' in time:
+        return int(time.split()[0]) * 60
+
+    return int(time.split()[0])
+
+
+def benchmark_duration_parser(recipes_file: str, repeat: int = 20) -> dict[str, float]:
+    """Return the number of seconds taken to parse every 'times' value in the given recipes file, repeat times:
+        - 'legacy': with the parser graphs.calc_time used before
+        - 'calc_time_cold': with graphs.calc_time, clearing its cache before every repetition
+        - 'calc_time_warm': with graphs.calc_time and its cache kept between repetitions
+        - 'calc_times': with the batch API graphs.calc_times, clearing the cache of graphs.calc_time before every
+          repetition
+    """
+    times = [t for line, _, _ in graphs.iter_recipes(recipes_file, ['times']) for t in line['times'].values()]
+
+    def timed(parse: Callable[[], Any], clear_cache: bool) -> float:
+        graphs.calc_time.cache_clear()
+        total = 0.0
+        for _ in range(repeat):
+            if clear_cache:
+                graphs.calc_time.cache_clear()
+            start = time.perf_counter()
+            parse()
+            total += time.perf_counter() - start
+        return total
+
+    return {
+        'legacy': timed(lambda: [_legacy_calc_time(t) for t in times], False),
+        'calc_time_cold': timed(lambda: [graphs.calc_time(t) for t in times], True),
+        'calc_time_warm': timed(lambda: [graphs.calc_time(t) for t in times], False),
+        'calc_times': timed(lambda: graphs.calc_times(times), True)
+    }
+
+
+def benchmark_query_cache(recipes_file: str, repeat: int = 20) -> dict[str, float]:
+    """Return the number of seconds taken to answer get_food_options for every combination of options, repeat
+    times, on a graph built from the given recipes file:
+        - 'uncached': with the query cache turned off
+        - 'cached': with every combination precomputed into the query cache
+        - 'precompute': to precompute every combination once
+    """
+    combinations = [list(c) for c in itertools.product(graphs.CATEGORIES, graphs.DIFFICULTIES, graphs.SERVES,
+                                                        graphs.TIMES)]
+    g = graphs.build_graph(recipes_file, use_snapshot=False)
+
+    g.query_cache_size = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for choices in combinations:
+            g.get_food_options(choices)
+    uncached = time.perf_counter() - start
+
+    g.query_cache_size = len(combinations)
+    start = time.perf_counter()
+    g.precompute_food_options()
+    precompute = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for choices in combinations:
+            g.get_food_options(choices)
+    cached = time.perf_counter() - start
+
+    return {'uncached': uncached, 'cached': cached, 'precompute': precompute}
+
+
+def benchmark_dedup(recipes_file: str) -> dict[str, float]:
+    """Return the measurements of the deduplication stage of building a graph from the given recipes file:
+        - 'records': the number of records in the file
+        - 'foods': the number of foods they make, once repeated recipes are merged
+        - 'merged': the number of records merged into the food of an earlier record
+        - 'shared_names': the number of names that more than one food has, which a graph keyed by name would
+          have merged
+        - 'dedup_seconds': the time spent in the stage
+        - 'build_seconds': the time taken to build the whole graph, without a snapshot
+    """
+    dedup = graphs.Deduplicator()
+    names = {}
+    for line, _, _ in graphs.iter_recipes(recipes_file, ['id', 'name', 'url']):
+        recipe_id = dedup.first_id(graphs.recipe_key(line), line['name'], line['url'])
+        names.setdefault(line['name'], set()).add(recipe_id)
+
+    start = time.perf_counter()
+    graphs.build_graph(recipes_file, use_snapshot=False)
+    build_seconds = time.perf_counter() - start
+
+    return {'records': dedup.records,
+            'foods': dedup.records - len(dedup.aliases),
+            'merged': len(dedup.aliases),
+            'shared_names': sum(1 for ids in names.values() if len(ids) > 1),
+            'dedup_seconds': dedup.seconds,
+            'build_seconds': build_seconds}
+
+
+def benchmark_pantry(recipes_file: str, scale: int = 100, queries: int = 200) -> dict[str, float]:
+    """Return the measurements of pantry queries over an index of the recipes in the given file, repeated scale
+    times under new ids so the index is about as large as a real recipe site's:
+        - 'foods': the number of foods in the index
+        - 'build_seconds': the time taken to build the index from canonical ingredients
+        - 'mean_us', 'p99_us': the mean and 99th percentile microseconds taken by PantryIndex.query for the
+          top 10 foods of a random pantry of 8 ingredients, one must term and one exclude term
+        - 'scan_mean_us': the mean microseconds taken to answer the same queries by scanning the ingredient set of
+          every food, matching terms exactly
+    """
+    records = [ingredients.recipe_ingredients(line['ingredients'] or [])
+               for line, _, _ in graphs.iter_recipes(recipes_file, ['ingredients'])]
+    food_ingredients = records * scale
+    foods = list(range(len(food_ingredients)))
+
+    start = time.perf_counter()
+    index = ingredients.PantryIndex(foods, food_ingredients)
+    build_seconds = time.perf_counter() - start
+
+    rnd = random.Random(0)
+    common = [ingredient for ingredient in index.ingredients if len(index.foods_with(ingredient)) >= scale * 10]
+    workload = [(rnd.sample(common, 8), [rnd.choice(common)], [rnd.choice(common)]) for _ in range(queries)]
+
+    times = []
+    for pantry, must, exclude in workload:
+        start = time.perf_counter()
+        index.query(pantry, must, exclude, 10)
+        times.append((time.perf_counter() - start) * 1e6)
+    times.sort()
+
+    sets = [set(food) for food in food_ingredients]
+    start = time.perf_counter()
+    for pantry, must, exclude in workload[:max(1, queries // 20)]:
+        have, need, avoid = set(pantry) | set(must), set(must), set(exclude)
+        scored = [(-len(food & have) / len(food), i) for i, food in enumerate(sets)
+                  if food & have and need <= food and not food & avoid]
+        sorted(scored)[:10]
+    scan_mean = (time.perf_counter() - start) * 1e6 / max(1, queries // 20)
+
+    return {'foods': len(foods),
+            'build_seconds': build_seconds,
+            'mean_us': sum(times) / len(times),
+            'p99_us': times[int(len(times) * 0.99) - 1],
+            'scan_mean_us': scan_mean}
+
+
+def benchmark_nutrient_ranges(recipes_file: str, scale: int = 100, queries: int = 200) -> dict[str, float]:
+    """Return the measurements of nutrient range filters over the nutrients of the recipes in the given file,
+    repeated scale times so there are about as many as on a real recipe site:
+        - 'foods': the number of foods filtered
+        - 'matches': the mean number of foods in the ranges of a query
+        - 'index_us': the mean microseconds taken by NutrientColumns.matching for a random range of calories
+          and a random lower bound of protein, including sorting the two columns once
+        - 'scan_us': the mean microseconds taken to answer the same queries by checking the amounts of every food
+    """
+    rows = [nutrition.nutrient_values(line['nutrients'])
+            for line, _, _ in graphs.iter_recipes(recipes_file, ['nutrients'])] * scale
+    columns = nutrition.NutrientColumns()
+    for row in rows:
+        columns.append(row)
+
+    rnd = random.Random(0)
+    workload = []
+    for _ in range(queries):
+        low = rnd.randrange(0, 600, 50)
+        workload.append({'kcal': (low, low + rnd.randrange(50, 300, 50)), 'protein': (rnd.randrange(0, 40, 5), None)})
+    kcal, protein = nutrition.NUTRIENTS.index('kcal'), nutrition.NUTRIENTS.index('protein')
+
+    start = time.perf_counter()
+    matches = sum(len(columns.matching(ranges)) for ranges in workload)
+    index_us = (time.perf_counter() - start) * 1e6 / queries
+
+    start = time.perf_counter()
+    for ranges in workload:
+        (low, high), (least, _) = ranges['kcal'], ranges['protein']
+        [i for i, row in enumerate(rows) if low <= row[kcal] <= high and row[protein] >= least]
+    scan_us = (time.perf_counter() - start) * 1e6 / queries
+
+    return {'foods': len(rows), 'matches': matches / queries, 'index_us': index_us, 'scan_us': scan_us}
+
+
+def benchmark_search(recipes_file: str, scale: int = 1000, queries: int = 200) -> dict[str, float]:
+    """Return the measurements of full-text search over the recipes in the given file, repeated scale times under
+    new ids so there are about as many documents as on a large recipe site:
+        - 'documents': the number of documents in the index
+        - 'postings': the number of postings in the index
+        - 'build_seconds': the time taken to sort and score the postings into an index
+        - 'mean_us', 'p99_us': the mean and 99th percentile microseconds taken by TextIndex.search for the top 10
+          documents matching two words from the name of a random recipe
+        - 'prefix_mean_us', 'prefix_p99_us': the same, with the second word cut short and taken as a prefix
+    """
+    names = []
+    term_numbers = {}
+    term_column, doc_column, frequency_column = [], [], []
+    for number, (line, _, _) in enumerate(graphs.iter_recipes(recipes_file, list(text_search.FIELD_WEIGHTS))):
+        names.append(text_search.tokenise(line['name']))
+        for term, frequency in text_search.document_terms(line).items():
+            term_column.append(term_numbers.setdefault(term, len(term_numbers)))
+            doc_column.append(number)
+            frequency_column.append(frequency)
+
+    count = len(names)
+    postings = len(term_column)
+    start = time.perf_counter()
+    index = text_search.TextIndex.from_postings(
+        list(range(count * scale)), list(term_numbers),
+        np.tile(np.array(term_column, dtype=np.int32), scale),
+        (np.repeat(np.arange(scale, dtype=np.int32) * count, postings)
+         + np.tile(np.array(doc_column, dtype=np.int32), scale)),
+        np.tile(np.array(frequency_column, dtype=np.float32), scale))
+    build_seconds = time.perf_counter() - start
+
+    rnd = random.Random(0)
+    workload = [rnd.sample(words, 2) for words in rnd.choices([words for words in names if len(words) >= 2],
+                                                              k=queries)]
+
+    def timed(prefix: bool) -> list[float]:
+        times = []
+        for first, second in workload:
+            query = f'{first} {second[:max(1, len(second) // 2)]}' if prefix else f'{first} {second}'
+            query_start = time.perf_counter()
+            index.search(query, 10, prefix)
+            times.append((time.perf_counter() - query_start) * 1e6)
+        return sorted(times)
+
+    exact, prefixed = timed(False), timed(True)
+    return {'documents': count * scale,
+            'postings': postings * scale,
+            'build_seconds': build_seconds,
+            'mean_us': sum(exact) / len(exact),
+            'p99_us': exact[int(len(exact) * 0.99) - 1],
+            'prefix_mean_us': sum(prefixed) / len(prefixed),
+            'prefix_p99_us': prefixed[int(len(prefixed) * 0.99) - 1]}
+
+
+def benchmark_similarity(recipes_file: str, scale: int = 100, lookups: int = 200,
+                         processes: Optional[int] = None) -> dict[str, float]:
+    """Return the measurements of finding similar recipes among the foods of the graph of the given file, with
+    ingredients, repeated scale times under new ids. Each copy keeps a random 80% of the features of its food and
+    gains one of its own, so the copies are near duplicates rather than exact ones:
+        - 'documents': the number of documents in the index
+        - 'build_seconds': the time taken to work out the signatures and buckets of every document
+        - 'precompute_seconds': the time taken by SimilarityIndex.precompute in processes processes
+        - 'mean_us', 'p99_us': the mean and 99th percentile microseconds taken by a lookup through the buckets of
+          a random document, without its precomputed neighbours
+        - 'scan_us': the mean microseconds taken to score that document against every other one instead
+        - 'recall': the fraction of the 10 documents with the highest estimated similarity to it, found by that
+          scan, that the lookup finds
+    """
+    g = graphs.build_graph(recipes_file, use_snapshot=False, with_ingredients=True)
+    features = [sorted(graphs.Graph._food_features(v)) for v in g._ranked_foods_of(None)]
+    rnd = random.Random(0)
+    documents = [(copy * len(features) + number, [feature for feature in food if rnd.random() < 0.8]
+                  + [f'copy {copy} {number}'])
+                 for copy in range(scale) for number, food in enumerate(features)]
+
+    start = time.perf_counter()
+    index = similarity.SimilarityIndex.build(documents)
+    build_seconds = time.perf_counter() - start
+
+    workload = rnd.sample(range(len(documents)), lookups)
+    times, scans, found = [], [], 0
+    for recipe_id in workload:
+        lookup_start = time.perf_counter()
+        near = index.similar(recipe_id, 10)
+        times.append((time.perf_counter() - lookup_start) * 1e6)
+
+        scan_start = time.perf_counter()
+        scores = (index._signatures == index._signatures[recipe_id]).mean(axis=1)
+        scores[recipe_id] = -1
+        best = np.lexsort((np.arange(len(scores)), -scores))[:10]
+        scans.append((time.perf_counter() - scan_start) * 1e6)
+        found += len(set(best.tolist()) & {other for other, _ in near})
+    times.sort()
+
+    start = time.perf_counter()
+    index.precompute(10, processes)
+    precompute_seconds = time.perf_counter() - start
+    return {'documents': len(documents),
+            'build_seconds': build_seconds,
+            'precompute_seconds': precompute_seconds,
+            'mean_us': sum(times) / len(times),
+            'p99_us': times[int(len(times) * 0.99) - 1],
+            'scan_us': sum(scans) / len(scans),
+            'recall': found / (10 * lookups)}
+
+
+# The images interface.run_game loads at startup
+_INTERFACE_IMAGES = ['assets/logo.png', 'assets/logo_hover.png', 'assets/no_image.png', 'assets/nofood.png',
+                     'assets/bg_img3.png', 'assets/bg_img_food.png', 'assets/subcat_bg.png', 'assets/difficulty_bg.png',
+                     'assets/servings_bg.png', 'assets/time_bg.png', 'assets/food_bg.png', 'assets/last_bg.png'] + \
+                    [f'assets/buttons/{name}.png' for name in
+                     ['next_btn', 'next_btn_hover', 'food_btn', 'food_btn_hover', 'food_name_btn', 'food_desc_btn',
+                      'recipe_btn', 'recipe_btn_hover', 'back_btn', 'back_btn_hover', 'close_btn', 'close_btn_hover',
+                      'back_btn_food', 'back_btn_food_hover', 'next_btn_food', 'next_btn_food_hover', 'toggle_btn',
+                      'toggle_btn_hover', 'toggle_btn_clicked', 'toggle_btn_clicked_hover']]
+
+# The images each kind of widget of the interface scales, the factor it scales them by, and how many of those
+# widgets a session creates. A toggle scales its normal and pressed images once more in Button.__init__.
+_WIDGET_IMAGES = [
+    (['assets/buttons/toggle_btn.png', 'assets/buttons/toggle_btn_clicked.png', 'assets/buttons/toggle_btn.png',
+      'assets/buttons/toggle_btn_hover.png', 'assets/buttons/toggle_btn_clicked.png',
+      'assets/buttons/toggle_btn_clicked_hover.png'], 1 / 2, 14),
+    (['assets/buttons/food_btn.png', 'assets/buttons/food_btn_hover.png'], 1, 10),
+    (['assets/logo.png', 'assets/logo_hover.png'], 1, 1),
+    (['assets/buttons/next_btn.png', 'assets/buttons/next_btn_hover.png'], 1 / 2, 1),
+    (['assets/buttons/back_btn.png', 'assets/buttons/back_btn_hover.png'], 1, 1),
+    (['assets/buttons/close_btn.png', 'assets/buttons/close_btn_hover.png'], 1, 1),
+    (['assets/buttons/back_btn_food.png', 'assets/buttons/back_btn_food_hover.png'], 1, 1),
+    (['assets/buttons/next_btn_food.png', 'assets/buttons/next_btn_food_hover.png'], 1, 1),
+    (['assets/buttons/food_name_btn.png', 'assets/buttons/food_name_btn.png'], 1, 2),
+    (['assets/buttons/food_desc_btn.png', 'assets/buttons/food_desc_btn.png'], 1, 2),
+    (['assets/buttons/recipe_btn.png', 'assets/buttons/recipe_btn_hover.png'], 1, 2)
+]
+# The number of widgets that load the star images, which every food button did for itself
+_STAR_LOADS = 10
+
+
+def _surface_bytes(surfaces: list[pygame.Surface]) -> int:
+    """Return the number of bytes of pixel data of the given surfaces, counting each surface once and
+    subsurfaces through their parents.
+    """
+    unique = {}
+    for surface in surfaces:
+        while surface.get_parent() is not None:
+            surface = surface.get_parent()
+        unique[id(surface)] = surface
+    return sum(s.get_width() * s.get_height() * s.get_bytesize() for s in unique.values())
+
+
+def benchmark_interface_assets(atlas_size: int = 1024) -> dict[str, dict[str, float]]:
+    """Return the seconds taken and bytes of surfaces held to load and scale the images of the interface:
+        - 'legacy': as run_game did before, loading every image and then scaling it again for every widget
+          and loading the star images for every food button
+        - 'asset_manager': through an assets.AssetManager
+        - 'asset_manager_atlas': through an assets.AssetManager that packs images into atlases of atlas_size
+
+    A hidden display is opened if none is, since images are converted to the display format.
+    """
+    pygame.init()
+    if pygame.display.get_surface() is None:
+        pygame.display.set_mode((700, 700), pygame.HIDDEN)
+
+    def legacy() -> list[pygame.Surface]:
+        loaded = {path: pygame.image.load(path).convert_alpha() for path in _INTERFACE_IMAGES}
+        surfaces = list(loaded.values())
+        for paths, scale, count in _WIDGET_IMAGES:
+            for _ in range(count):
+                for path in paths:
+                    image = loaded[path]
+                    size = (int(image.get_width() * scale), int(image.get_height() * scale))
+                    surfaces.append(pygame.transform.smoothscale(image, size))
+        for _ in range(_STAR_LOADS):
+            surfaces.append(pygame.image.load('assets/buttons/stars_full.png'))
+            surfaces.append(pygame.image.load('assets/buttons/stars_empty.png'))
+        return surfaces
+
+    def managed(manager: assets.AssetManager) -> list[pygame.Surface]:
+        loaded = {path: manager.image(path) for path in _INTERFACE_IMAGES}
+        surfaces = list(loaded.values())
+        for paths, scale, count in _WIDGET_IMAGES:
+            for _ in range(count):
+                for path in paths:
+                    image = loaded[path]
+                    size = (int(image.get_width() * scale), int(image.get_height() * scale))
+                    surfaces.append(manager.scaled(image, size))
+        for _ in range(_STAR_LOADS):
+            surfaces.append(manager.image('assets/buttons/stars_full.png'))
+            surfaces.append(manager.image('assets/buttons/stars_empty.png'))
+        return surfaces
+
+    results = {}
+    for name, run in [('legacy', legacy),
+                      ('asset_manager', lambda: managed(assets.AssetManager())),
+                      ('asset_manager_atlas', lambda: managed(assets.AssetManager(atlas_size)))]:
+        start = time.perf_counter()
+        surfaces = run()
+        results[name] = {'seconds': time.perf_counter() - start, 'surface_bytes': _surface_bytes(surfaces)}
+    return results
+
+
+if __name__ == '__main__':
+    print('Graph memory (bytes):', benchmark_graph_memory('recipes.json'))
+    print('Graph build time (s):', benchmark_snapshot_startup('recipes.json'))
+    print('Duration parsing time (s):', benchmark_duration_parser('recipes.json'))
+    print('Query time (s):', benchmark_query_cache('recipes.json'))
+    print('Deduplication:', benchmark_dedup('recipes.json'))
+    print('Pantry queries:', benchmark_pantry('recipes.json'))
+    print('Nutrient range filters:', benchmark_nutrient_ranges('recipes.json'))
+    print('Full-text search:', benchmark_search('recipes.json'))
+    print('Similar recipes:', benchmark_similarity('recipes.json'))
+    print('Interface assets:', benchmark_interface_assets())
@@ -0,0 +1,264 @@
+"""
+This Python module contains a compact, NumPy-backed engine for the recipe network.
+
+It answers the same queries as graphs.Graph, but instead of keeping a Python object per vertex with a set of
+neighbours, foods are stored as dense integer ids. Numeric attributes are kept in columnar NumPy arrays, text
+attributes are kept as one UTF-8 blob per column with an array of offsets into it, and every option vertex
+(subcategory, difficulty, serves, times) is a packed bitmap over the food ids, so a query is a handful of
+vectorized bitwise ANDs.
+
+Food ids are assigned in rating order (highest to lowest, ties broken by name and then by recipe id), so the
+first k set bits of a query mask are exactly its k highest rated foods.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable, Optional
+import sys
+import numpy as np
+
+import graphs
+
+
+class TextColumn:
+    """A read-only column of strings, stored as their UTF-8 encodings concatenated into a single bytes object.
+
+    A string is decoded each time it is accessed, so a column holds no Python object per string. A missing value
+    (None), such as the image of a user-added recipe, is stored as an empty string and read back as None.
+
+    Instance Attributes:
+        - blob: the UTF-8 encodings of the strings of this column, one after the other
+        - offsets: the offset into blob of the start of each string, followed by len(blob)
+
+    Representation Invariants:
+        - len(self.offsets) >= 1 and self.offsets[0] == 0 and self.offsets[-1] == len(self.blob)
+        - all(self.offsets[i] <= self.offsets[i + 1] for i in range(len(self.offsets) - 1))
+    """
+    __slots__ = ('blob', 'offsets')
+
+    blob: bytes
+    offsets: np.ndarray
+
+    def __init__(self, strings: Iterable[Optional[str]]) -> None:
+        """Initialize a column of the given strings, in order."""
+        encoded = [(string or '').encode('utf-8') for string in strings]
+        self.blob = b''.join(encoded)
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(string) for string in encoded], out=self.offsets[1:])
+
+    def __len__(self) -> int:
+        """Return the number of strings in this column."""
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        """Return the string at the given index of this column, or None if it is missing.
+
+        Preconditions:
+            - 0 <= index < len(self)
+        """
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].decode('utf-8') or None
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes held by this column."""
+        return sys.getsizeof(self.blob) + self.offsets.nbytes
+
+
+class CompactFood:
+    """A read-only view of one food in a CompactGraph.
+
+    It exposes the same attributes as graphs._FoodVertex, so the interface can display it unchanged.
+
+    Instance Attributes:
+        - food_id: the dense integer id of this food in its graph
+
+    Representation Invariants:
+        - 0 <= self.food_id < len(self._graph)
+    """
+    __slots__ = ('_graph', 'food_id')
+    kind = graphs.FOOD
+
+    _graph: CompactGraph
+    food_id: int
+
+    def __init__(self, graph: CompactGraph, food_id: int) -> None:
+        """Initialize a view of the food with the given id in the given graph."""
+        self._graph = graph
+        self.food_id = food_id
+
+    @property
+    def item(self) -> str:
+        """The name of the food."""
+        return self._graph.names[self.food_id]
+
+    @property
+    def recipe_id(self) -> Any:
+        """The stable id of the recipe of the food."""
+        return self._graph.recipe_ids[self.food_id]
+
+    @property
+    def url(self) -> Optional[str]:
+        """The url of the website the recipe is on."""
+        return self._graph.urls[self.food_id]
+
+    @property
+    def image(self) -> Optional[str]:
+        """The url of the image of the recipe."""
+        return self._graph.images[self.food_id]
+
+    @property
+    def description(self) -> Optional[str]:
+        """The food description."""
+        return self._graph.descriptions[self.food_id]
+
+    @property
+    def rating(self) -> int:
+        """The rating of the food given by the user."""
+        return int(self._graph.ratings[self.food_id])
+
+
+class CompactGraph:
+    """A columnar representation of the recipes network.
+
+    Instance Attributes:
+        - recipe_ids: the stable recipe id of each food, indexed by food id
+        - names: the name of each food, indexed by food id
+        - urls: the url of each food's recipe, indexed by food id
+        - images: the url of each food's image, indexed by food id
+        - descriptions: the description of each food, indexed by food id
+        - ratings: the rating of each food, indexed by food id
+        - serves: the number of servings of each food, indexed by food id
+        - minutes: the combined preparation and cooking time of each food in minutes, indexed by food id
+        - category_codes: the index into graphs.CATEGORIES of each food's subcategory, indexed by food id
+
+    Representation Invariants:
+        - all(len(column) == len(self.names) for column in
+              [self.recipe_ids, self.urls, self.images, self.descriptions, self.ratings, self.serves, self.minutes,
+               self.category_codes])
+        - the foods are ordered by rating (highest to lowest), then by name, and then by recipe id
+    """
+    # Private Instance Attributes:
+    #     - _bitmaps:
+    #         Maps the item of each option vertex to a packed bitmap (see numpy.packbits) with bit i
+    #         set if and only if the food with id i is adjacent to that option.
+    recipe_ids: list[Any]
+    names: TextColumn
+    urls: TextColumn
+    images: TextColumn
+    descriptions: TextColumn
+    ratings: np.ndarray
+    serves: np.ndarray
+    minutes: np.ndarray
+    category_codes: np.ndarray
+    _bitmaps: dict[str, np.ndarray]
+
+    def __init__(self, records: list[dict[str, Any]]) -> None:
+        """Initialize a compact graph of the given foods.
+
+        Each record maps 'recipe_id', 'name', 'url', 'image', 'description', 'rating', 'serves', 'minutes' and
+        'subcategory' to the corresponding attribute, and 'options' to the set of items of the option vertices the
+        food is adjacent to.
+
+        Preconditions:
+            - the recipe ids of the records are distinct
+        """
+        records = sorted(records, key=lambda r: (-r['rating'], r['name'], r['recipe_id']))
+        size = len(records)
+
+        self.recipe_ids = [r['recipe_id'] for r in records]
+        self.names = TextColumn(r['name'] for r in records)
+        self.urls = TextColumn(r['url'] for r in records)
+        self.images = TextColumn(r['image'] for r in records)
+        self.descriptions = TextColumn(r['description'] for r in records)
+        self.ratings = np.fromiter((r['rating'] for r in records), dtype=np.int8, count=size)
+        self.serves = np.fromiter((r['serves'] for r in records), dtype=np.int16, count=size)
+        self.minutes = np.fromiter((r['minutes'] for r in records), dtype=np.int32, count=size)
+        self.category_codes = np.fromiter((graphs.CATEGORIES.index(r['subcategory']) for r in records),
+                                          dtype=np.uint8, count=size)
+
+        bits = {option: np.zeros(size, dtype=bool)
+                for option in graphs.CATEGORIES + graphs.DIFFICULTIES + graphs.SERVES + graphs.TIMES}
+        for food_id, r in enumerate(records):
+            for option in r['options']:
+                bits[option][food_id] = True
+        self._bitmaps = {option: np.packbits(bits[option]) for option in bits}
+
+    def __len__(self) -> int:
+        """Return the number of foods in this graph."""
+        return len(self.names)
+
+    def get_food_options(self, choices: list[str], k: Optional[int] = 10) -> list[CompactFood]:
+        """Return a list of foods from this graph based on the given choices.
+
+        This has the same contract as graphs.Graph.get_food_options: the list is sorted based on rating
+        (highest to lowest) with ties broken by name, and holds at most k foods (every match if k is None).
+
+        Preconditions:
+            - k is None or k >= 0
+        """
+        if any(choice not in self._bitmaps for choice in choices):
+            return []
+
+        if choices:
+            mask = np.bitwise_and.reduce([self._bitmaps[choice] for choice in set(choices)])
+            food_ids = np.flatnonzero(np.unpackbits(mask, count=len(self)))
+        else:
+            food_ids = np.arange(len(self))
+
+        if k is not None:
+            food_ids = food_ids[:k]
+        return [CompactFood(self, int(food_id)) for food_id in food_ids]
+
+    def memory_usage(self) -> int:
+        """Return the number of bytes held by the columns and option bitmaps of this graph.
+
+        The recipe ids are counted as their list and the objects in it, which may be shared with other objects.
+        """
+        columns = [self.names, self.urls, self.images, self.descriptions, self.ratings, self.serves, self.minutes,
+                   self.category_codes]
+        recipe_ids = sys.getsizeof(self.recipe_ids) + sum(sys.getsizeof(recipe_id) for recipe_id in self.recipe_ids)
+        return (recipe_ids + sum(column.nbytes for column in columns)
+                + sum(bitmap.nbytes for bitmap in self._bitmaps.values()))
+
+
+def build_compact_graph(recipes_file: str) -> CompactGraph:
+    """Build a compact recipe graph using the given recipes file.
+
+    Like graphs.build_graph, records that repeat a recipe are recognised by a graphs.Deduplicator: the attributes
+    of a food come from the first record of its recipe, and the options of every record of it are merged into it.
+    """
+    records = {}
+
+    dedup = graphs.Deduplicator()
+    for line, _, _ in graphs.iter_recipes(recipes_file, graphs.GRAPH_FIELDS):
+        recipe_id = dedup.first_id(graphs.recipe_key(line), line['name'], line['url'])
+        if recipe_id not in records:
+            records[recipe_id] = {
+                'recipe_id': recipe_id,
+                'name': line['name'],
+                'url': line['url'],
+                'image': line['image'],
+                'description': line['description'],
+                'rating': line['rattings'],
+                'serves': line['serves'],
+                'minutes': graphs.combine_times(line['times']),
+                'subcategory': graphs.category_option(line['subcategory']),
+                'options': set()
+            }
+
+        records[recipe_id]['options'].update({graphs.category_option(line['subcategory']),
+                                              graphs.difficulty_option(line['difficult']),
+                                              graphs.serves_option(line['serves']),
+                                              graphs.times_option(line['times'])})
+
+    return CompactGraph(list(records.values()))
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['sys', 'numpy', 'graphs'],
+        'max-line-length': 120
+    })
@@ -8,46 +8,90 @@ The graph class a recipe network where food items are connected based on their a
 """
 
 from __future__ import annotations
-from typing import Any
+from collections import OrderedDict
+from typing import Any, Collection, Iterable, Iterator, Optional, Sequence, TextIO, Union
+import bisect
+import concurrent.futures
+import functools
+import glob
+import heapq
+import itertools
 import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import ingredients
+import nutrition
+import recipe_store
+import similarity
+import snapshot
+import text_search
+
+# The kinds of vertices. Every vertex of a kind shares the same interned string object.
+SUBCATEGORY = sys.intern('subcategory')
+DIFFICULT = sys.intern('difficult')
+SERVINGS = sys.intern('serves')
+DURATION = sys.intern('times')
+FOOD = sys.intern('food')
+INGREDIENT = sys.intern('ingredient')
+KINDS = {kind: kind for kind in [SUBCATEGORY, DIFFICULT, SERVINGS, DURATION, FOOD, INGREDIENT]}
+
+# The items of the option vertices, by kind
+CATEGORIES = ['Recipes with Animal Products',
+              'Vegan Recipes',
+              'Vegetarian Recipes',
+              'Meal-Specific Recipes',
+              'Miscellaneous']
+DIFFICULTIES = ['Easy', 'Challenging']
+SERVES = ['1 ~ 2', '3 ~ 4', '5+']
+TIMES = ['Quick (0 ~ 20 mins)', 'Moderate (20 ~ 40 mins)', 'Lengthy (40 ~ 60 mins)', 'More than 1 hr']
 
 
 class _Vertex:
-    """A vertex in a recipes graph, used to represent a subcategory, diffculty, serves, times and food.
+    """A vertex in a recipes graph, used to represent a subcategory, diffculty, serves, times, food and ingredient.
 
     Each vertex represents any value
 
     Instance Attributes:
         - item: The data stored in this vertex, representing any value
-        - kind: The type of this vertex: 'subcategory', 'difficult', 'serves', 'times', 'food'.
+        - kind: The type of this vertex: 'subcategory', 'difficult', 'serves', 'times', 'food', 'ingredient'.
         - neighbours: The vertices that are adjacent to this vertex.
+        - index: The dense integer id of this vertex in its graph, or -1 if it has not been added to a graph.
+          Query engines can use it to index arrays and bitmaps by vertex.
 
     Representation Invariants:
         - self not in self.neighbours
         - all(self in u.neighbours for u in self.neighbours)
-        - self.kind in {'subcategory', 'difficult', 'serves', 'times', 'food'}
+        - self.kind in KINDS
     """
+    __slots__ = ('item', 'kind', 'neighbours', 'index')
     item: Any
     kind: str
     neighbours: set[_Vertex]
+    index: int
 
     def __init__(self, item: Any, kind: str) -> None:
         """Initialize a new vertex with the given item and kind.
 
-        This vertex is initialized with no neighbours.
+        This vertex is initialized with no neighbours. kind is stored as the shared constant from KINDS.
 
         Preconditions:
-            - kind in {'subcategory', 'difficult', 'serves', 'times'}
+            - kind in {'subcategory', 'difficult', 'serves', 'times', 'ingredient'}
         """
         self.item = item
-        self.kind = kind
+        self.kind = KINDS[kind]
         self.neighbours = set()
+        self.index = -1
 
     def match_choices(self, choices: list[str]) -> bool:
         """Return whether the food matches the choices. choices is a list of user inputs that describe the food.
         This function returns true if the food vertex matches the given choices.
         """
-        if self.kind != 'food':
+        if self.kind is not FOOD:
             return False
 
         for choice in choices:
@@ -59,10 +103,15 @@ class _Vertex:
 class _FoodVertex(_Vertex):
     """A vertex in a recipes graph of kind 'food'.
 
+    The url, image and description of the food are either kept on the vertex, or, if the vertex was given a
+    source, read from the source every time they are accessed so that they are never kept resident.
+
     Instance Attributes:
-        - item: The name of the food, represented by a string
+        - item: The name of the food, represented by a string. Several foods may have the same name.
         - kind: The type of this vertex: 'food'
         - neighbours: The vertices that are adjacent to this vertex.
+        - index: The dense integer id of this vertex in its graph, or -1 if it has not been added to a graph.
+        - recipe_id: The stable id of the recipe of this food (its 'id' field), which identifies it in its graph
         - url: the url of the website the recipe is on, rerpesented by a string
         - image: the url of the image of the recipe, represented by a string
         - description: the food description, represented by a string
@@ -73,87 +122,706 @@ class _FoodVertex(_Vertex):
         - 0 <= self.rating <= 5
 
     """
-    url: str
-    image: str
-    description: str
+    # Private Instance Attributes:
+    #     - _url, _image, _description:
+    #         The text fields of this food, or None if they are read from _source.
+    #     - _source:
+    #         The source the text fields of this food are read from, or None if they are kept on this vertex.
+    #     - _locator:
+    #         Where the text fields of this food are in _source.
+    __slots__ = ('recipe_id', 'rating', '_url', '_image', '_description', '_source', '_locator')
+    recipe_id: Any
     rating: int
-
-    def __init__(self, item: Any, kind: str, url: str, image: str, description: str,
-                 rating: int) -> None:
+    _url: Optional[str]
+    _image: Optional[str]
+    _description: Optional[str]
+    _source: Optional[RecordSource]
+    _locator: Any
+
+    def __init__(self, item: Any, kind: str, url: Optional[str], image: Optional[str], description: Optional[str],
+                 rating: int, source: Optional[RecordSource] = None, locator: Any = None,
+                 recipe_id: Any = None) -> None:
         """Initialize a new vertex with the given item, kind, url, image, description and rating.
 
         This vertex is initialized with no neighbours. (It uses the _Vertex class initializer for item, kind).
+        If a source is given, url, image and description are ignored and are instead read from the source at
+        the given locator when accessed. If no recipe_id is given, the name of the food is used.
 
         Preconditions:
             - kind == 'food'
         """
         super().__init__(item, kind)
-        self.url = url
-        self.image = image
-        self.description = description
+        self.recipe_id = item if recipe_id is None else recipe_id
         self.rating = rating
+        self._source = source
+        self._locator = locator
+        if source is None:
+            self._url, self._image, self._description = url, image, description
+        else:
+            self._url, self._image, self._description = None, None, None
+
+    @property
+    def url(self) -> str:
+        """The url of the website the recipe is on."""
+        if self._source is None:
+            return self._url
+        return self._source.load(self._locator)[0]
+
+    @property
+    def image(self) -> str:
+        """The url of the image of the recipe."""
+        if self._source is None:
+            return self._image
+        return self._source.load(self._locator)[1]
+
+    @property
+    def description(self) -> str:
+        """The food description."""
+        if self._source is None:
+            return self._description
+        return self._source.load(self._locator)[2]
+
+
+class JsonRecordSource:
+    """The text fields of the recipes in a JSON recipes file, read on demand.
+
+    A locator is the (start, end) byte offsets of a recipe object in the file.
+
+    Instance Attributes:
+        - path: the path of the recipes file
+    """
+    path: str
+
+    def __init__(self, path: str) -> None:
+        """Initialize a source reading from the recipes file at the given path."""
+        self.path = path
+
+    def load(self, locator: tuple[int, int]) -> tuple[str, str, str]:
+        """Return the (url, image, description) of the recipe at the given locator."""
+        start, end = locator
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            record = json.loads(f.read(end - start))
+        return (record.get('url'), record.get('image'), record.get('description'))
+
+
+# The sources the text fields of a _FoodVertex can be read from. Each has a load(locator) method that returns the
+# (url, image, description) of the recipe at that locator.
+RecordSource = Union[JsonRecordSource, recipe_store.RecipeStore]
 
 
 class Graph:
     """A graph used to represent recipes network.
+
+    Food vertices are keyed by the stable ids of their recipes, so foods with the same name are kept apart.
+    Option vertices are grouped by kind, but choices and edges name them by their items alone, so the items of
+    all kinds share one namespace.
+    Ingredient vertices, if the graph has them, are option vertices too: their items are canonical ingredients
+    (see the ingredients module), which are lower case, unlike the items of the other option vertices.
+
+    Instance Attributes:
+        - query_cache_size: the largest number of choice sets whose food options are kept (see get_food_options)
+        - search_index: the full-text index of the foods of this graph that search_foods answers from, or None if
+          this graph has none (see build_graph)
+        - similarity_index: the index of the features of the foods of this graph that similar_foods answers from,
+          or None if this graph has none (see index_similar_foods)
+
+    Representation Invariants:
+        - the items of the option vertices are distinct across kinds
+        - self.search_index is None or all(recipe_id in self.search_index for recipe_id in self._foods)
+        - self.similarity_index is None or all(recipe_id in self.similarity_index for recipe_id in self._foods)
     """
     # Private Instance Attributes:
-    #     - _vertices:
-    #         A collection of the vertices contained in this graph.
-    #         Maps item to _Vertex object.
-    _vertices: dict[Any, _Vertex]
+    #     - _options:
+    #         The option vertices (subcategory, difficulty, serves, times) of this graph, grouped by kind.
+    #         Maps kind to a dict mapping item to _Vertex object.
+    #     - _option_items:
+    #         Maps the item of every option vertex, of any kind, to the vertex.
+    #     - _foods:
+    #         Maps the recipe id of every food vertex to the _FoodVertex object.
+    #     - _names:
+    #         A hash index from the name of each food to the recipe ids of the foods with that name, in the order
+    #         they were added.
+    #     - _aliases:
+    #         Maps the id of each recipe that repeated another one when this graph was built (see Deduplicator)
+    #         to the recipe id of the food it was merged into.
+    #     - _dense:
+    #         Every vertex added to this graph, indexed by its dense integer id, with None for removed vertices.
+    #     - _nutrients:
+    #         The nutrients of every vertex added to this graph, indexed by its dense integer id. Option vertices
+    #         and removed foods have none.
+    #     - _postings:
+    #         An inverted index from each option vertex (subcategory, difficulty, serves, times)
+    #         to the set of food vertices adjacent to it. Maps item to a set of _FoodVertex objects.
+    #     - _ranked:
+    #         The same food vertices as _postings, kept in a list per option vertex that is
+    #         ordered by _rank_key: by rating (highest to lowest), then by name, then by recipe id.
+    #     - _unsorted:
+    #         The items of the option vertices whose list in _ranked has had foods appended since it was
+    #         last sorted. Sorting is deferred until the list is next queried. Foods added to a list that is
+    #         already sorted are inserted in place instead, so single recipes can be added cheaply.
+    #     - _ranked_foods:
+    #         Every food vertex in this graph, in the same order as the lists in _ranked.
+    #     - _ranked_foods_sorted:
+    #         Whether _ranked_foods is currently sorted.
+    #     - _version:
+    #         A number that changes every time a vertex or edge is added to or removed from this graph.
+    #     - _query_cache:
+    #         Maps the set of choices of recent calls to get_food_options to the k they were answered for
+    #         and the answer, least recently used first.
+    #     - _query_cache_version:
+    #         The _version of this graph when _query_cache was last emptied.
+    #     - _pantry_index:
+    #         The index get_pantry_options answers from, or None if it has not been built yet.
+    #     - _pantry_index_version:
+    #         The _version of this graph when _pantry_index was last brought up to date. Recipes added and
+    #         removed through add_recipe and remove_food_vertex are applied to the index, and any other change
+    #         makes it be rebuilt.
+    query_cache_size: int
+    search_index: Optional[text_search.TextIndex]
+    similarity_index: Optional[similarity.SimilarityIndex]
+    _options: dict[str, dict[Any, _Vertex]]
+    _option_items: dict[Any, _Vertex]
+    _foods: dict[Any, _FoodVertex]
+    _names: dict[str, list[Any]]
+    _aliases: dict[Any, Any]
+    _dense: list[Optional[_Vertex]]
+    _nutrients: nutrition.NutrientColumns
+    _postings: dict[Any, set[_Vertex]]
+    _ranked: dict[Any, list[_Vertex]]
+    _unsorted: set[Any]
+    _ranked_foods: list[_Vertex]
+    _ranked_foods_sorted: bool
+    _version: int
+    _query_cache: OrderedDict[frozenset, tuple[Optional[int], list[_Vertex]]]
+    _query_cache_version: int
+    _pantry_index: Optional[ingredients.PantryIndex]
+    _pantry_index_version: int
+
+    def __init__(self, query_cache_size: int = 256) -> None:
+        """Initialize an empty graph (no vertices or edges).
 
-    def __init__(self) -> None:
-        """Initialize an empty graph (no vertices or edges)."""
-        self._vertices = {}
+        Preconditions:
+            - query_cache_size >= 0
+        """
+        self.query_cache_size = query_cache_size
+        self.search_index = None
+        self.similarity_index = None
+        self._options = {}
+        self._option_items = {}
+        self._foods = {}
+        self._names = {}
+        self._aliases = {}
+        self._dense = []
+        self._nutrients = nutrition.NutrientColumns()
+        self._postings = {}
+        self._ranked = {}
+        self._unsorted = set()
+        self._ranked_foods = []
+        self._ranked_foods_sorted = True
+        self._version = 0
+        self._query_cache = OrderedDict()
+        self._query_cache_version = 0
+        self._pantry_index = None
+        self._pantry_index_version = 0
 
     def add_vertex(self, item: Any, kind: str) -> None:
-        """Add a vertex with the given item and kind to this graph.
+        """Add an option vertex with the given item and kind to this graph.
 
         The new vertex is not adjacent to any other vertices.
-        Do nothing if the given item is already in this graph.
+        Do nothing if an option vertex with the given item is already in this graph.
 
         Preconditions:
-            - kind in {'subcategory', 'difficult', 'serves', 'times'}
+            - kind in {'subcategory', 'difficult', 'serves', 'times', 'ingredient'}
+        """
+        if item not in self._option_items:
+            v = _Vertex(item, kind)
+            self._add_dense(v)
+            self._options.setdefault(v.kind, {})[item] = v
+            self._option_items[item] = v
+            self._postings[item] = set()
+            self._ranked[item] = []
+            self._version += 1
+
+    def add_food_vertex(self, item: Any, kind: str, url: Optional[str], image: Optional[str],
+                        description: Optional[str], rating: int, source: Optional[RecordSource] = None,
+                        locator: Any = None, recipe_id: Any = None,
+                        nutrients: Optional[Sequence[float]] = None) -> None:
+        """Add a food vertex with the given name, kind, url, image, description and rating to this graph.
+
+        The food is keyed by the given recipe id, which defaults to its name. Do nothing if a food with that
+        recipe id is already in this graph; foods with the same name and different recipe ids are both added.
+
+        If a source is given, the url, image and description of the food are read from it at the given locator
+        when accessed instead (see _FoodVertex). nutrients are the amounts of the food's nutrients, as returned by
+        nutrition.nutrient_values, or None if none are known.
         """
-        if item not in self._vertices:
-            self._vertices[item] = _Vertex(item, kind)
+        key = item if recipe_id is None else recipe_id
+        if key not in self._foods:
+            v = _FoodVertex(item, kind, url, image, description, rating, source, locator, key)
+            self._add_dense(v, nutrients)
+            self._foods[key] = v
+            self._names.setdefault(item, []).append(key)
+            if self._ranked_foods_sorted and self._ranked_foods:
+                bisect.insort(self._ranked_foods, v, key=_rank_key)
+            else:
+                self._ranked_foods.append(v)
+                self._ranked_foods_sorted = False
+            self._version += 1
+
+    def _add_dense(self, v: _Vertex, nutrients: Optional[Sequence[float]] = None) -> None:
+        """Give the given vertex the next dense integer id of this graph, and record its nutrients under it."""
+        v.index = len(self._dense)
+        self._dense.append(v)
+        self._nutrients.append(nutrients)
+
+    def remove_food_vertex(self, recipe_id: Any) -> None:
+        """Remove the food vertex with the given recipe id, and all of its edges, from this graph.
+
+        Its dense integer id is not reused.
+
+        Raise a ValueError if there is no food with the given recipe id in this graph.
+        """
+        v = self._foods.get(recipe_id)
+        if v is None:
+            raise ValueError
 
-    def add_food_vertex(self, item: Any, kind: str, url: str, image: str, description: str, rating: int) -> None:
-        """Add a food vertex with the given name, kind, url, image, description and rating to this graph."""
+        pantry_in_sync = self._pantry_index_in_sync()
+        for u in v.neighbours:
+            u.neighbours.discard(v)
+            self._postings[u.item].discard(v)
+            _remove_ranked(self._ranked[u.item], v, u.item not in self._unsorted)
+        v.neighbours.clear()
+        _remove_ranked(self._ranked_foods, v, self._ranked_foods_sorted)
+
+        del self._foods[recipe_id]
+        self._names[v.item].remove(recipe_id)
+        if not self._names[v.item]:
+            del self._names[v.item]
+        self._dense[v.index] = None
+        self._nutrients.forget(v.index)
+        if self.search_index is not None:
+            self.search_index.remove(recipe_id)
+        if self.similarity_index is not None:
+            self.similarity_index.remove(recipe_id)
+        self._version += 1
+        if pantry_in_sync:
+            self._pantry_index.remove(v)
+            self._pantry_index_version = self._version
+
+    def add_alias(self, alias: Any, recipe_id: Any) -> None:
+        """Record that the recipe with the id alias is the food with the given recipe id, so get_food(alias)
+        returns that food.
+
+        Raise a ValueError if there is no food with the given recipe id in this graph, or if alias is itself the
+        recipe id of a food.
+        """
+        if recipe_id not in self._foods or alias in self._foods:
+            raise ValueError
+        self._aliases[alias] = recipe_id
 
-        if item not in self._vertices:
-            self._vertices[item] = _FoodVertex(item, kind, url, image, description, rating)
+    def get_food(self, recipe_id: Any) -> _FoodVertex:
+        """Return the food vertex with the given recipe id, or the food that recipe was merged into.
 
-    def add_edge(self, item1: Any, item2: Any) -> None:
-        """Add an edge between the two vertices with the given items in this graph.
+        Raise a ValueError if there is no such food in this graph.
+        """
+        v = self._foods.get(self._aliases.get(recipe_id, recipe_id))
+        if v is None:
+            raise ValueError
+        return v
 
-        Raise a ValueError if item1 or item2 do not appear as vertices in this graph.
+    def foods_named(self, name: str) -> list[_FoodVertex]:
+        """Return the food vertices with the given name, in the order they were added."""
+        return [self._foods[recipe_id] for recipe_id in self._names.get(name, [])]
+
+    def vertex_at(self, index: int) -> _Vertex:
+        """Return the vertex with the given dense integer id.
+
+        Raise a ValueError if no vertex in this graph has that id.
+        """
+        if not 0 <= index < len(self._dense) or self._dense[index] is None:
+            raise ValueError
+        return self._dense[index]
+
+    def get_nutrients(self, recipe_id: Any) -> dict[str, float]:
+        """Return the known amounts of the nutrients of the food with the given recipe id, per serving, in kcal
+        for 'kcal' and in grams for the others.
+
+        Raise a ValueError if there is no such food in this graph.
+        """
+        return self._nutrients.row(self.get_food(recipe_id).index)
+
+    def add_recipe(self, recipe: dict) -> None:
+        """Add the food of the given recipe, and its edges to the option vertices of the recipe, to this graph.
+
+        The food is keyed by recipe_key(recipe). Only the answers of get_food_options that the new food could be
+        part of are dropped from the cache, so the cost of adding a recipe does not depend on the size of the
+        graph.
+
+        If this graph has ingredient vertices, the food is also given edges to the canonical ingredients of the
+        recipe's 'ingredients' lines, adding any ingredient vertices that are missing. If it has a search index
+        or a similarity index, the food is added to them.
+
+        Raise a ValueError if a food, or an alias, with the recipe id of the recipe is already in this graph.
 
         Preconditions:
-            - item1 != item2
+            - recipe has the fields in GRAPH_FIELDS, apart from the ones in OPTIONAL_FIELDS, which are optional
+            - every option vertex is in this graph
+        """
+        recipe_id = recipe_key(recipe)
+        if recipe_id in self._foods or recipe_id in self._aliases:
+            raise ValueError
+
+        # taken before any vertex is added, since adding one changes the version
+        in_sync = self._query_cache_version == self._version
+        pantry_in_sync = self._pantry_index_in_sync()
+        options = recipe_options(recipe)
+        if INGREDIENT in self._options:
+            options.extend(ingredients.recipe_ingredients(recipe.get('ingredients') or []))
+            for ingredient in options[4:]:
+                self.add_vertex(ingredient, INGREDIENT)
+        self.add_food_vertex(recipe['name'], FOOD, recipe.get('url'), recipe.get('image'),
+                             recipe.get('description'), recipe['rattings'], recipe_id=recipe_id,
+                             nutrients=nutrition.nutrient_values(recipe.get('nutrients')))
+        for option in options:
+            self.add_edge(recipe_id, option)
+        if self.search_index is not None:
+            self.search_index.add(recipe_id, text_search.document_terms(recipe))
+        if self.similarity_index is not None:
+            self.similarity_index.add(recipe_id, self._food_features(self._foods[recipe_id]))
+        if pantry_in_sync:
+            self._pantry_index.add(self._foods[recipe_id], options[4:])
+            self._pantry_index_version = self._version
+        if in_sync:
+            self._invalidate_queries(options)
+
+    def remove_recipe(self, recipe_id: Any) -> None:
+        """Remove the food with the given recipe id, and all of its edges, from this graph.
+
+        Like add_recipe, this only drops the cached answers of get_food_options that the food was part of.
+
+        Raise a ValueError if there is no food with the given recipe id in this graph.
         """
-        if item1 in self._vertices and item2 in self._vertices:
-            v1 = self._vertices[item1]
-            v2 = self._vertices[item2]
+        v = self._foods.get(recipe_id)
+        if v is None:
+            raise ValueError
+
+        options = [u.item for u in v.neighbours]
+        in_sync = self._query_cache_version == self._version
+        self.remove_food_vertex(recipe_id)
+        if in_sync:
+            self._invalidate_queries(options)
+
+    def update_recipe(self, recipe_id: Any, recipe: dict) -> None:
+        """Replace the food with the given recipe id by the food of the given recipe, which may have another id.
+
+        Raise a ValueError if there is no food with the given recipe id in this graph, or if the recipe has a
+        new id that another food in this graph already has.
+
+        Preconditions:
+            - recipe is a valid input to add_recipe
+        """
+        new_id = recipe_key(recipe)
+        if new_id != recipe_id and (new_id in self._foods or new_id in self._aliases):
+            raise ValueError
+        self.remove_recipe(recipe_id)
+        self.add_recipe(recipe)
+
+    def _invalidate_queries(self, options: Collection[Any]) -> None:
+        """Drop the cached answers of get_food_options that a food adjacent to exactly the given option vertices
+        could be part of, and keep the rest of the cache valid for the current version of this graph.
+
+        Preconditions:
+            - the cache was valid before the food was added to or removed from this graph
+        """
+        options = frozenset(options)
+        for key in [key for key in self._query_cache if key <= options]:
+            del self._query_cache[key]
+        self._query_cache_version = self._version
+
+    def add_edge(self, recipe_id: Any, option: Any) -> None:
+        """Add an edge between the food with the given recipe id and the option vertex with the given item in
+        this graph.
+
+        Raise a ValueError if either vertex does not appear in this graph.
+        """
+        if recipe_id in self._foods and option in self._option_items:
+            v1 = self._foods[recipe_id]
+            v2 = self._option_items[option]
 
             v1.neighbours.add(v2)
             v2.neighbours.add(v1)
+            self._version += 1
+
+            # keep the posting set and ranked list of the option vertex up to date
+            self._add_posting(option, v1)
         else:
             raise ValueError
 
-    def get_food_options(self, choices: list[str]) -> list[_Vertex]:
+    def _add_posting(self, option: Any, food: _Vertex) -> None:
+        """Record that the given food vertex is adjacent to the option vertex with the given item.
+
+        Preconditions:
+            - option in self._postings
+            - food.kind == 'food'
+        """
+        if food not in self._postings[option]:
+            self._postings[option].add(food)
+            ranked = self._ranked[option]
+            if option not in self._unsorted and ranked:
+                bisect.insort(ranked, food, key=_rank_key)
+            else:
+                ranked.append(food)
+                self._unsorted.add(option)
+
+    def get_food_options(self, choices: list[str], k: Optional[int] = 10,
+                         nutrients: Optional[dict[str, tuple[Optional[float], Optional[float]]]] = None) \
+            -> list[_Vertex]:
         """Return a list of food vertices from graph based on the given choices.
-        The list is sorted based on rating (highest to lowest).
-        If there are more than 10 only return the 10 highest rated
+        The list is sorted based on rating (highest to lowest), with ties broken by name and then by recipe id.
+        If there are more than k only return the k highest rated. If k is None, return every match.
+
+        nutrients optionally maps nutrients in nutrition.NUTRIENTS to a (low, high) range of amounts per serving,
+        in kcal for 'kcal' and in grams for the others, such as {'kcal': (None, 500), 'protein': (20, None)}.
+        Only foods with a known amount of each of them within its range, inclusive, are then returned.
+
+        The foods of the smallest chosen posting set are walked in rating order and checked against the
+        other posting sets, so the query stops as soon as it has k results. The foods in the nutrient ranges are
+        found in sorted indexes of the nutrients (see nutrition.NutrientColumns), and are walked instead if there
+        are fewer of them.
+
+        Answers without nutrients are cached by the set of choices, so their order and any repeats do not matter.
+        A cached answer is reused for any k it holds enough foods for. The cache is tagged with the version of
+        this graph, which changes with every vertex or edge added or removed. add_recipe, remove_recipe and
+        update_recipe only drop the answers whose choices are all options of the food they change, and retag the
+        rest; any other change leaves the cache out of date, and it is emptied by the next call.
+
+        Preconditions:
+            - k is None or k >= 0
+            - nutrients is None or all(nutrient in nutrition.NUTRIENTS for nutrient in nutrients)
+        """
+        if nutrients:
+            return self._find_food_options(choices, k, nutrients)
+
+        if self._query_cache_version != self._version:
+            self._query_cache.clear()
+            self._query_cache_version = self._version
+
+        key = frozenset(choices)
+        cached = self._query_cache.get(key)
+        # the cached answer is complete up to k if it was answered for at least k, or it is shorter than its k
+        if cached is not None and (cached[0] is None or (k is not None and k <= cached[0])
+                                   or len(cached[1]) < cached[0]):
+            self._query_cache.move_to_end(key)
+            return cached[1][:k]
+
+        foods = self._find_food_options(choices, k)
+        if self.query_cache_size > 0:
+            self._query_cache[key] = (k, foods)
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return foods[:k]
+
+    def get_pantry_options(self, pantry: Iterable[str], must: Iterable[str] = (), exclude: Iterable[str] = (),
+                           k: Optional[int] = 10) -> list[tuple[_FoodVertex, float]]:
+        """Return the foods that can best be cooked from the given pantry of ingredients, each with the fraction of
+        its distinct ingredients that the pantry covers.
+
+        The foods are ranked by that fraction (highest to lowest), with ties broken as in get_food_options. Only
+        foods that use an ingredient in the pantry, every ingredient in must, and no ingredient in exclude are
+        returned. A term such as 'salmon' stands for every ingredient ending in it, such as 'smoked salmon'.
+        If k is not None, only the first k foods are returned. See ingredients.PantryIndex.query.
+
+        Only foods with ingredient vertices can be found, so the graph must have been built with them (see
+        build_graph). The index this is answered from is built the first time it is used. Recipes added or removed
+        after that are applied to it, and it is only rebuilt after other changes, such as edges added on their own.
+
+        Preconditions:
+            - k is None or k >= 0
+        """
+        if not self._pantry_index_in_sync():
+            foods = self._ranked_foods_of(None)
+            self._pantry_index = ingredients.PantryIndex(
+                foods, [[u.item for u in v.neighbours if u.kind is INGREDIENT] for v in foods], _rank_key)
+            self._pantry_index_version = self._version
+        return self._pantry_index.query(pantry, must, exclude, k)
+
+    def _pantry_index_in_sync(self) -> bool:
+        """Return whether _pantry_index has been built and is up to date with this graph."""
+        return self._pantry_index is not None and self._pantry_index_version == self._version
+
+    def search_foods(self, query: str, k: Optional[int] = 10, choices: Collection[str] = (),
+                     nutrients: Optional[dict[str, tuple[Optional[float], Optional[float]]]] = None,
+                     prefix: bool = False) -> list[tuple[_FoodVertex, float]]:
+        """Return the foods whose name, description, steps or dish type best match the given text query, each with
+        its BM25 score, from the highest score to the lowest (see the text_search module).
+
+        Only foods adjacent to every option vertex in choices, and within the nutrient ranges as in
+        get_food_options, are returned. If prefix is True, the last word of the query also matches words that
+        start with it, for showing results while it is typed. If k is not None, only the first k foods are
+        returned.
+
+        The matching foods are walked from the highest score down and checked against the choices and ranges, so
+        the walk stops as soon as it has k foods.
+
+        Raise a ValueError if this graph has no search index.
+
+        Preconditions:
+            - k is None or k >= 0
+            - nutrients is None or all(nutrient in nutrition.NUTRIENTS for nutrient in nutrients)
+        """
+        if self.search_index is None:
+            raise ValueError
+        if not choices and not nutrients:
+            return [(self._foods[recipe_id], score) for recipe_id, score in self.search_index.search(query, k, prefix)]
+        if k == 0 or any(choice not in self._postings for choice in choices):
+            return []
+
+        postings = [self._postings[choice] for choice in set(choices)]
+        in_range = self._dense_mask(self._nutrients.matching(nutrients)) if nutrients else None
+        foods = []
+        for recipe_id, score in self.search_index.ranked(query, prefix, 64 if k is None else k):
+            if k is not None and len(foods) >= k:
+                break
+            v = self._foods[recipe_id]
+            if all(v in posting for posting in postings) and (in_range is None or in_range[v.index]):
+                foods.append((v, score))
+
+        return foods
+
+    def index_similar_foods(self, k: int = 10, processes: Optional[int] = None) -> int:
+        """Build the similarity index of this graph from the option and ingredient vertices adjacent to each food
+        and the words of its name and description, and precompute the k most similar foods of every food in a pool
+        of processes (see similarity.SimilarityIndex.precompute). Return the number of foods indexed.
+
+        The index is kept up to date as recipes are added and removed, but the precomputed lists of the other
+        foods only include a new food once this is called again.
+
+        Preconditions:
+            - k >= 1
+            - processes is None or processes >= 1
+        """
+        foods = [v for v in self._dense if v is not None and v.kind is FOOD]
+        self.similarity_index = similarity.SimilarityIndex.build(
+            (v.recipe_id, self._food_features(v)) for v in foods)
+        return self.similarity_index.precompute(k, processes)
+
+    def similar_foods(self, recipe_id: Any, k: int = 10) -> list[tuple[_FoodVertex, float]]:
+        """Return the k foods most like the food with the given recipe id, or the food that recipe was merged into,
+        each with its estimated Jaccard similarity to it, from the most similar to the least.
+
+        Raise a ValueError if this graph has no similarity index, or no such food.
+
+        Preconditions:
+            - k >= 0
+        """
+        v = self.get_food(recipe_id)
+        if self.similarity_index is None:
+            raise ValueError
+        return [(self._foods[other], score) for other, score in self.similarity_index.similar(v.recipe_id, k)]
+
+    def precompute_food_options(self, k: Optional[int] = 10) -> int:
+        """Answer get_food_options for every combination of one subcategory, difficulty, serves and times option,
+        so those answers are cached, and return the number of combinations.
+
+        The cache is only large enough for every combination if query_cache_size is at least the returned number.
         """
-        foods = [v for v in self._vertices.values() if v.match_choices(choices)]
+        combinations = list(itertools.product(CATEGORIES, DIFFICULTIES, SERVES, TIMES))
+        for combination in combinations:
+            self.get_food_options(list(combination), k)
+        return len(combinations)
+
+    def _find_food_options(self, choices: list[str], k: Optional[int],
+                           nutrients: Optional[dict[str, tuple[Optional[float], Optional[float]]]] = None) \
+            -> list[_Vertex]:
+        """Return the answer to get_food_options(choices, k, nutrients), without using the cache."""
+        if not choices and not nutrients:
+            return self._ranked_foods_of(None)[:k]
+
+        if any(choice not in self._postings for choice in choices):
+            return []
+
+        options = sorted(set(choices), key=lambda choice: len(self._postings[choice]))
+        in_range = None
+        if nutrients:
+            matches = self._nutrients.matching(nutrients)
+            if not options or len(matches) <= len(self._postings[options[0]]):
+                # walk the foods in the nutrient ranges in rating order, probing the posting sets
+                ranked = [self._dense[i] for i in matches.tolist()]
+                if not options and k is not None:
+                    return heapq.nsmallest(k, ranked, key=_rank_key)
+                ranked.sort(key=_rank_key)
+                return self._probe(ranked, [self._postings[choice] for choice in options], None, k)
+
+            in_range = self._dense_mask(matches)
+
+        # walk the smallest posting set in rating order, probing the others
+        others = [self._postings[choice] for choice in options[1:]]
+        return self._probe(self._ranked_foods_of(options[0]), others, in_range, k)
+
+    @staticmethod
+    def _food_features(v: _FoodVertex) -> set[str]:
+        """Return the features of the given food that its similarity to other foods is measured by."""
+        return similarity.recipe_features(f'{v.item} {v.description or ""}', [u.item for u in v.neighbours])
+
+    def _dense_mask(self, indices: np.ndarray) -> np.ndarray:
+        """Return an array of booleans, indexed by dense integer id, that is True at the given dense ids."""
+        mask = np.zeros(len(self._dense), dtype=bool)
+        mask[indices] = True
+        return mask
+
+    @staticmethod
+    def _probe(ranked: list[_Vertex], postings: list[set[_Vertex]], in_range: Optional[np.ndarray],
+               k: Optional[int]) -> list[_Vertex]:
+        """Return the first k foods of ranked that are in every one of the given posting sets and, if in_range is
+        not None, are True in in_range at their dense integer id. If k is None, return all of them.
+        """
+        foods = []
+        for v in ranked:
+            if k is not None and len(foods) >= k:
+                break
+            if all(v in posting for posting in postings) and (in_range is None or in_range[v.index]):
+                foods.append(v)
+
+        return foods
+
+    def _ranked_foods_of(self, item: Any) -> list[_Vertex]:
+        """Return the food vertices adjacent to the option vertex with the given item,
+        sorted by _rank_key.
+
+        If item is None, return every food vertex in this graph in the same order.
+        Lists that have changed since they were last sorted are sorted here, once, before being returned.
+        """
+        if item is None:
+            if not self._ranked_foods_sorted:
+                self._ranked_foods.sort(key=_rank_key)
+                self._ranked_foods_sorted = True
+            return self._ranked_foods
+
+        if item in self._unsorted:
+            self._ranked[item].sort(key=_rank_key)
+            self._unsorted.discard(item)
+        return self._ranked[item]
+
+
+def _rank_key(v: _FoodVertex) -> tuple[int, Any, Any]:
+    """Return the key that orders food vertices by rating (highest to lowest), then by name, then by recipe id."""
+    return (-v.rating, v.item, v.recipe_id)
 
-        # Ssrt the food vertices based on their rating attribute in descending order
-        foods.sort(key=lambda v: (-v.rating, v.item), reverse=False)
 
-        # Return the top 10 food vertices with highest ratings
-        return foods[:10]
+def _remove_ranked(ranked: list[_Vertex], v: _Vertex, is_sorted: bool) -> None:
+    """Remove the given food vertex from the given list of food vertices.
+
+    If the list is sorted by _rank_key, the vertex is found by binary search.
+
+    Preconditions:
+        - v in ranked
+    """
+    if is_sorted:
+        del ranked[bisect.bisect_left(ranked, _rank_key(v), key=_rank_key)]
+    else:
+        ranked.remove(v)
 
 
 def combine_times(times: dict) -> int:
@@ -170,63 +838,107 @@ def combine_times(times: dict) -> int:
     return calc_time(prep_time) + calc_time(cooking_time)
 
 
+# Matches one quantity of a duration ('1 hr', '30 mins', '1 hour'), or the separator of a range of durations.
+# A number with no unit is a number of minutes.
+_DURATION_TOKEN = re.compile(r'(?P<number>\d+)\s*(?:(?P<hours>h(?:ou)?rs?)|min(?:ute)?s?)?\b|(?P<range>-)',
+                             re.IGNORECASE)
+# Matches the text allowed between two tokens of a duration, and before the first and after the last one
+_DURATION_GAP = re.compile(r'\s*(?:,|and\b)?\s*', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=4096)
 def calc_time(time: str) -> int:
     """
     Given a string of time (ex. 4 hrs and 30 minutes), returns the number of minutes as an integer.
     If given a range such as 20 minutes - 40 minutes, it takes the longest option.
+
+    Hours may be written as 'hr', 'hrs', 'hour' or 'hours', and minutes as 'min', 'mins', 'minute' or 'minutes'.
+    The quantities may be separated by spaces, a comma or 'and'. 'No Time' (or an empty string) is 0 minutes.
+    The string is parsed in a single pass, and the results for recent strings are cached since the same few
+    strings make up most of a recipes file.
+
+    Raise a ValueError if time is not one of these forms.
+
+    >>> calc_time('1 hr and 30 mins')
+    90
+    >>> calc_time('1 hour and 5 mins')
+    65
+    >>> calc_time('2 hrs and 30 mins - 3 hrs')
+    180
+    >>> calc_time('No Time')
+    0
+    >>> calc_time('1.5 hrs')
+    Traceback (most recent call last):
+    ...
+    ValueError: '1.5 hrs' is not a duration
     """
-    if 'No Time' in time:
+    if time.strip() in {'', 'No Time'}:
         return 0
 
-    if '-' in time:
-        time = time.split(' - ')[-1]
+    longest = 0
+    total = 0
+    found = False
+    position = 0
+    for match in _DURATION_TOKEN.finditer(time):
+        if not _DURATION_GAP.fullmatch(time, position, match.start()):
+            raise ValueError(f'{time!r} is not a duration')
+        position = match.end()
+        if match['range']:
+            longest = max(longest, total)
+            total = 0
+        elif match['hours']:
+            total += 60 * int(match['number'])
+        else:
+            total += int(match['number'])
+        found = found or not match['range']
+
+    if not found or not _DURATION_GAP.fullmatch(time, position):
+        raise ValueError(f'{time!r} is not a duration')
+    return max(longest, total)
+
+
+def calc_times(times: Sequence[str]) -> np.ndarray:
+    """Return an array of the number of minutes of each of the given strings of time, as calculated by
+    calc_time.
 
-    if 'and' in time:
-        hrs, mins = time.split(' and ')[0], time.split(' and ')[1]
-        total_mins = 60 * int(hrs.split()[0]) + int(mins.split()[0])
-        return total_mins
+    Each distinct string is only parsed once, however many times it appears, and the minutes are gathered
+    straight into the array, with no list of Python ints in between.
 
-    if 'hr' in time:
-        return int(time.split()[0]) * 60
+    Raise a ValueError if one of the strings is not a duration.
 
-    return int(time.split()[0])
+    >>> calc_times(['1 hr', '10 mins', '1 hr']).tolist()
+    [60, 10, 60]
+    """
+    minutes = {time: calc_time(time) for time in set(times)}
+    return np.fromiter(map(minutes.__getitem__, times), dtype=np.int64, count=len(times))
 
 
 def add_categories(graph: Graph) -> None:
     """Add all the subcategory vertices to the given graph."""
-    categories = ['Recipes with Animal Products',
-                  'Vegan Recipes',
-                  'Vegetarian Recipes',
-                  'Meal-Specific Recipes',
-                  'Miscellaneous']
-
-    for category in categories:
-        graph.add_vertex(category, 'subcategory')
+    for category in CATEGORIES:
+        graph.add_vertex(category, SUBCATEGORY)
 
 
 def add_difficulties(graph: Graph) -> None:
     """Add all the difficulty vertices to the given graph."""
-    graph.add_vertex('Easy', 'difficult')
-    graph.add_vertex('Challenging', 'difficult')
+    for difficulty in DIFFICULTIES:
+        graph.add_vertex(difficulty, DIFFICULT)
 
 
 def add_serves(graph: Graph) -> None:
     """Add all the serves vertices to the given graph."""
-    graph.add_vertex('1 ~ 2', 'serves')
-    graph.add_vertex('3 ~ 4', 'serves')
-    graph.add_vertex('5+', 'serves')
+    for serves in SERVES:
+        graph.add_vertex(serves, SERVINGS)
 
 
 def add_times(graph: Graph) -> None:
     """Add all the times vertices to the given graph."""
-    graph.add_vertex('Quick (0 ~ 20 mins)', 'times')
-    graph.add_vertex('Moderate (20 ~ 40 mins)', 'times')
-    graph.add_vertex('Lengthy (40 ~ 60 mins)', 'times')
-    graph.add_vertex('More than 1 hr', 'times')
+    for times in TIMES:
+        graph.add_vertex(times, DURATION)
 
 
-def add_edge_category(food: str, subcategory: str, graph: Graph) -> None:
-    """Add an edge between the food vertex and the correct subcategory vertex in the given graph."""
+def category_option(subcategory: str) -> str:
+    """Return the item of the subcategory vertex that the given recipe subcategory belongs to."""
     sub_to_main = {'Chicken': 'Recipes with Animal Products',
                    'Fish and seafood': 'Recipes with Animal Products',
                    'Meat': 'Recipes with Animal Products',
@@ -239,75 +951,695 @@ def add_edge_category(food: str, subcategory: str, graph: Graph) -> None:
                    'Dinner recipes': 'Meal-Specific Recipes',
                    'Storecupboard': 'Miscellaneous',
                    'Desserts': 'Miscellaneous'}
-    graph.add_edge(food, sub_to_main[subcategory])
 
+    # recipes added through main.add_recipe are already given a subcategory vertex, sometimes spelt with spaces
+    # around the hyphen ('Meal - Specific Recipes')
+    if subcategory.replace(' - ', '-') in CATEGORIES:
+        return subcategory.replace(' - ', '-')
+    return sub_to_main[subcategory]
 
-def add_edge_difficulty(food: str, difficulty: str, graph: Graph) -> None:
-    """Add an edge between the food vertex and the correct difficulty vertex in the given graph."""
+
+def difficulty_option(difficulty: str) -> str:
+    """Return the item of the difficulty vertex that the given recipe difficulty belongs to."""
     if difficulty == 'Easy':
-        graph.add_edge(food, 'Easy')
+        return 'Easy'
     else:
-        graph.add_edge(food, 'Challenging')
+        return 'Challenging'
 
 
-def add_edge_serves(food: str, serves: int, graph: Graph) -> None:
-    """Add an edge between the food vertex and the correct serves vertex in the given graph."""
+def serves_option(serves: int) -> str:
+    """Return the item of the serves vertex that the given number of servings belongs to."""
     if serves < 3:
-        graph.add_edge(food, '1 ~ 2')
+        return '1 ~ 2'
     elif serves < 5:
-        graph.add_edge(food, '3 ~ 4')
+        return '3 ~ 4'
     else:
-        graph.add_edge(food, '5+')
+        return '5+'
 
 
-def add_edge_times(food: str, times: dict, graph: Graph) -> None:
-    """Add an edge between the food vertex and the correct times vertex in the given graph."""
-    combined_times = combine_times(times)
+def times_option(times: dict) -> str:
+    """Return the item of the times vertex that the given preparation and cooking times belong to."""
+    return minutes_option(combine_times(times))
+
+
+def minutes_option(combined_times: int) -> str:
+    """Return the item of the times vertex that the given combined preparation and cooking time, in minutes,
+    belongs to.
+    """
     if combined_times <= 20:
-        graph.add_edge(food, 'Quick (0 ~ 20 mins)')
+        return 'Quick (0 ~ 20 mins)'
     elif combined_times <= 40:
-        graph.add_edge(food, 'Moderate (20 ~ 40 mins)')
+        return 'Moderate (20 ~ 40 mins)'
     elif combined_times <= 60:
-        graph.add_edge(food, 'Lengthy (40 ~ 60 mins)')
+        return 'Lengthy (40 ~ 60 mins)'
     else:
-        graph.add_edge(food, 'More than 1 hr')
+        return 'More than 1 hr'
+
+
+def add_edge_category(food: str, subcategory: str, graph: Graph) -> None:
+    """Add an edge between the food vertex and the correct subcategory vertex in the given graph."""
+    graph.add_edge(food, category_option(subcategory))
+
+
+def add_edge_difficulty(food: str, difficulty: str, graph: Graph) -> None:
+    """Add an edge between the food vertex and the correct difficulty vertex in the given graph."""
+    graph.add_edge(food, difficulty_option(difficulty))
+
+
+def add_edge_serves(food: str, serves: int, graph: Graph) -> None:
+    """Add an edge between the food vertex and the correct serves vertex in the given graph."""
+    graph.add_edge(food, serves_option(serves))
+
+
+def add_edge_times(food: str, times: dict, graph: Graph) -> None:
+    """Add an edge between the food vertex and the correct times vertex in the given graph."""
+    graph.add_edge(food, times_option(times))
+
+
+def recipe_options(recipe: dict, minutes: Optional[int] = None) -> list[str]:
+    """Return the items of the option vertices that the food of the given recipe is adjacent to.
+
+    minutes is the combined preparation and cooking time of the recipe (see combine_times), if it is already
+    known.
+
+    Preconditions:
+        - recipe has the fields 'subcategory', 'difficult', 'serves' and 'times'
+    """
+    return [category_option(recipe['subcategory']),
+            difficulty_option(recipe['difficult']),
+            serves_option(recipe['serves']),
+            times_option(recipe['times']) if minutes is None else minutes_option(minutes)]
+
+
+def recipe_key(recipe: dict) -> Any:
+    """Return the recipe id that the food of the given recipe is keyed by: its 'id' field, or its name if it has
+    none.
+
+    >>> recipe_key({'id': 'USERADDED1', 'name': 'Toast'})
+    'USERADDED1'
+    >>> recipe_key({'id': None, 'name': 'Toast'})
+    'Toast'
+    """
+    recipe_id = recipe.get('id')
+    return recipe['name'] if recipe_id is None else recipe_id
+
+
+class Deduplicator:
+    """The stage of building a graph that recognises records repeating a recipe listed earlier.
 
+    A recipe can be listed several times, once under each of its subcategories: recipes.json has 1022 records
+    but only 911 recipes. The records of a recipe have ids of their own but the same name and url. Every builder
+    passes each record through a Deduplicator before adding it to the graph. The first record of a recipe
+    becomes its food, and each later one only adds its options to that food, with its id recorded as an alias.
 
-def build_graph(recipes_file: str) -> Graph:
+    Records with the same name and a different url, or no url, are different recipes, and get foods of their own.
+
+    Instance Attributes:
+        - records: the number of records seen
+        - aliases: maps the id of each record that repeated an earlier recipe to the id of its first record
+        - seconds: the time spent recognising repeated records, in seconds
+    """
+    # Private Instance Attributes:
+    #     - _first_ids: maps the (name, url) of each recipe seen to the id of its first record
+    records: int
+    aliases: dict[Any, Any]
+    seconds: float
+    _first_ids: dict[tuple[str, str], Any]
+
+    def __init__(self) -> None:
+        """Initialize a deduplicator that has not seen any records."""
+        self.records = 0
+        self.aliases = {}
+        self.seconds = 0.0
+        self._first_ids = {}
+
+    def first_id(self, recipe_id: Any, name: str, url: Optional[str]) -> Any:
+        """Return the recipe id of the food that the record with the given id, name and url belongs to: the id of
+        the first record of the same recipe, which is recipe_id itself if there was none.
+        """
+        start = time.perf_counter()
+        self.records += 1
+        first_id = recipe_id
+        if url is not None:
+            first_id = self._first_ids.setdefault((name, url), recipe_id)
+            if first_id != recipe_id:
+                self.aliases[recipe_id] = first_id
+        self.seconds += time.perf_counter() - start
+        return first_id
+
+    def add_aliases(self, graph: Graph) -> None:
+        """Record the aliases found by this deduplicator in the given graph."""
+        for alias, recipe_id in self.aliases.items():
+            if alias != recipe_id:
+                graph.add_alias(alias, recipe_id)
+
+
+def build_graph(recipes_file: str, lazy_text: bool = False, use_snapshot: bool = True,
+                precompute: bool = False, with_ingredients: bool = False, with_search: bool = False) -> Graph:
     """Build a recipe graph using the given recipes file.
+
+    If lazy_text is True, the url, image and description of each food are not kept in the graph. Instead, each
+    food vertex remembers where its recipe is in the file and reads them from there when they are accessed.
+
+    The file is read one recipe at a time and only the fields in GRAPH_FIELDS are kept (see iter_recipes).
+    Records that repeat a recipe are merged into one food by a Deduplicator.
+
+    If use_snapshot is True, the graph is loaded from the snapshot next to the recipes file when that snapshot
+    is up to date (see the snapshot module). Otherwise the graph is built from the recipes file and a new
+    snapshot is written for the next call. Failing to write the snapshot does not stop the graph being built.
+
+    recipes_file may also be a recipe store written by write_recipe_store. It is opened with mmap and the text
+    fields of its foods are always decoded on access, so lazy_text and use_snapshot are ignored.
+
+    If precompute is True, the top 10 foods of every combination of options are cached in the graph before it
+    is returned (see Graph.precompute_food_options).
+
+    If with_ingredients is True, the 'ingredients' lines of every recipe are normalised into canonical ingredients
+    (see the ingredients module), which become ingredient vertices adjacent to the foods that use them. They can
+    then be chosen in get_food_options like any other option, and are what get_pantry_options answers from.
+    Recipe stores do not keep ingredients, so this is ignored for them.
+
+    The 'nutrients' of every recipe are parsed once, into amounts per serving in kcal or grams (see the nutrition
+    module), and kept in typed columns that get_food_options can filter by range.
+
+    If with_search is True, the graph is given a full-text index of the fields of every recipe in
+    text_search.FIELD_WEIGHTS (see Graph.search_foods), which is kept in the snapshot with the rest of the graph.
+    Recipe stores do not keep the text of steps, so this is ignored for them too.
+    """
+    g = _load_graph(recipes_file, lazy_text, use_snapshot, with_ingredients, with_search)
+    if precompute:
+        g.precompute_food_options()
+    return g
+
+
+def _load_graph(recipes_file: str, lazy_text: bool, use_snapshot: bool, with_ingredients: bool,
+                with_search: bool) -> Graph:
+    """Return the graph build_graph builds from the given recipes file, before any food options are cached."""
+    if recipe_store.is_recipe_store(recipes_file):
+        return _graph_from_store(recipe_store.RecipeStore(recipes_file))
+
+    source = JsonRecordSource(recipes_file) if lazy_text else None
+
+    if use_snapshot:
+        names = _SNAPSHOT_COLUMNS if source is None else _LAZY_SNAPSHOT_COLUMNS
+        if with_ingredients:
+            names += ('ingredients',)
+        if with_search:
+            names += text_search.COLUMNS
+        columns = snapshot.read_snapshot(recipes_file, GRAPH_SNAPSHOT_SCHEMA, names)
+        if columns is not None:
+            return _graph_from_columns(columns, source)
+        key = snapshot.source_key(recipes_file, GRAPH_SNAPSHOT_SCHEMA)
+
+    g = Graph()
+
+    # add option vertices
+    add_categories(g)
+    add_difficulties(g)
+    add_serves(g)
+    add_times(g)
+
+    # the columns of the snapshot, with one entry per food in the order the foods were added (apart from the
+    # alias columns, which have one entry per alias)
+    columns = {name: [] for name in _SNAPSHOT_COLUMNS + (('ingredients',) if with_ingredients else ())}
+    food_index = {}
+
+    fields = GRAPH_FIELDS if source is None else LAZY_GRAPH_FIELDS
+    if with_ingredients:
+        fields += ('ingredients',)
+    if with_search:
+        fields += tuple(field for field in text_search.FIELD_WEIGHTS if field not in fields)
+    # the document_terms of the text of each food, if with_search
+    documents = {}
+    dedup = Deduplicator()
+    for line, start, end in iter_recipes(recipes_file, fields):
+        recipe_id = dedup.first_id(recipe_key(line), line['name'], line['url'])
+        nutrients = nutrition.nutrient_values(line['nutrients'])
+
+        # add the food vertex, unless the recipe was listed before
+        if source is None:
+            g.add_food_vertex(line['name'], FOOD, line['url'], line['image'], line['description'], line['rattings'],
+                              recipe_id=recipe_id, nutrients=nutrients)
+        else:
+            g.add_food_vertex(line['name'], FOOD, None, None, None, line['rattings'], source, (start, end),
+                              recipe_id, nutrients)
+
+        # create edge between food and option
+        options = recipe_options(line)
+        for option in options:
+            g.add_edge(recipe_id, option)
+
+        if with_search and recipe_id not in documents:
+            documents[recipe_id] = text_search.document_terms(line)
+
+        food_ingredients = ingredients.recipe_ingredients(line['ingredients'] or []) if with_ingredients else []
+        for ingredient in food_ingredients:
+            g.add_vertex(ingredient, INGREDIENT)
+            g.add_edge(recipe_id, ingredient)
+
+        if use_snapshot:
+            if recipe_id not in food_index:
+                food_index[recipe_id] = len(columns['names'])
+                columns['ids'].append(recipe_id)
+                columns['names'].append(line['name'])
+                columns['ratings'].append(line['rattings'])
+                columns['starts'].append(start)
+                columns['ends'].append(end)
+                columns['option_masks'].append(0)
+                columns['nutrients'].extend(nutrients)
+                for field in TEXT_FIELDS:
+                    columns[field].append(line.get(field))
+                if with_ingredients:
+                    columns['ingredients'].append([])
+            i = food_index[recipe_id]
+            for option in options:
+                columns['option_masks'][i] |= 1 << _OPTION_BITS[option]
+            if with_ingredients:
+                columns['ingredients'][i].extend(ingredient for ingredient in food_ingredients
+                                                 if ingredient not in columns['ingredients'][i])
+    dedup.add_aliases(g)
+    if with_search:
+        g.search_index = text_search.TextIndex.build(documents.items())
+
+    if use_snapshot:
+        columns['alias_ids'] = list(dedup.aliases)
+        columns['alias_targets'] = list(dedup.aliases.values())
+        columns['nutrients'] = np.array(columns['nutrients'], dtype=np.float64).tobytes()
+        if with_search:
+            columns.update(g.search_index.to_columns())
+        if source is not None:
+            # the text fields were not read, so only the lazy columns can be written
+            columns = {name: columns[name] for name in columns if name not in TEXT_FIELDS}
+        try:
+            snapshot.write_snapshot(recipes_file, key, columns)
+        except OSError:
+            pass
+
+    return g
+
+
+# The layout of graph snapshots. Change GRAPH_SNAPSHOT_SCHEMA whenever the columns or their meaning change.
+# The 'nutrients' column holds the bytes of an array of doubles with the nutrition.nutrient_values of each food,
+# one food after another. Snapshots written by builds with_ingredients also have an 'ingredients' column, with the
+# canonical ingredients of each food, and those written by builds with_search have the text_search.COLUMNS of the
+# search index.
+GRAPH_SNAPSHOT_SCHEMA = 'graph-3'
+_LAZY_SNAPSHOT_COLUMNS = ('ids', 'names', 'ratings', 'starts', 'ends', 'option_masks', 'nutrients', 'alias_ids',
+                          'alias_targets')
+_SNAPSHOT_COLUMNS = _LAZY_SNAPSHOT_COLUMNS + ('url', 'image', 'description')
+# Maps the item of each option vertex to its bit in the option masks of a snapshot
+_OPTION_BITS = {option: bit for bit, option in enumerate(CATEGORIES + DIFFICULTIES + SERVES + TIMES)}
+
+
+def _graph_from_columns(columns: dict[str, list], source: Optional[RecordSource]) -> Graph:
+    """Return the graph stored in the given snapshot columns.
+
+    If source is not None, the text fields of the foods are read from it (see build_graph).
+    """
+    g = Graph()
+    add_categories(g)
+    add_difficulties(g)
+    add_serves(g)
+    add_times(g)
+
+    nutrients = nutrition.rows_from_bytes(columns['nutrients'])
+    for i, recipe_id in enumerate(columns['ids']):
+        if source is None:
+            g.add_food_vertex(columns['names'][i], FOOD, columns['url'][i], columns['image'][i],
+                              columns['description'][i], columns['ratings'][i], recipe_id=recipe_id,
+                              nutrients=next(nutrients))
+        else:
+            g.add_food_vertex(columns['names'][i], FOOD, None, None, None, columns['ratings'][i], source,
+                              (columns['starts'][i], columns['ends'][i]), recipe_id, next(nutrients))
+
+        _add_option_edges(g, recipe_id, columns['option_masks'][i])
+        if 'ingredients' in columns:
+            for ingredient in columns['ingredients'][i]:
+                g.add_vertex(ingredient, INGREDIENT)
+                g.add_edge(recipe_id, ingredient)
+
+    for alias, recipe_id in zip(columns['alias_ids'], columns['alias_targets']):
+        g.add_alias(alias, recipe_id)
+    if text_search.COLUMNS[0] in columns:
+        g.search_index = text_search.TextIndex.from_columns(columns)
+
+    return g
+
+
+def _add_option_edges(graph: Graph, recipe_id: Any, option_mask: int) -> None:
+    """Add an edge between the food with the given recipe id and every option vertex whose bit is set in the given
+    option mask.
     """
+    for option, bit in _OPTION_BITS.items():
+        if option_mask >> bit & 1:
+            graph.add_edge(recipe_id, option)
+
+
+def write_recipe_store(recipes_file: str, store_file: str) -> int:
+    """Convert the given recipes file into a recipe store (see the recipe_store module) at store_file,
+    and return the number of recipes written.
 
+    The recipes file is read one recipe at a time.
+    """
+    recipes = ({'rating': line['rattings'],
+                'serves': line['serves'],
+                'minutes': combine_times(line['times']),
+                'option_mask': sum(1 << _OPTION_BITS[option] for option in set(recipe_options(line))),
+                **dict(zip(nutrition.NUTRIENTS, nutrition.nutrient_values(line['nutrients']))),
+                'id': str(recipe_key(line)),
+                'name': line['name'],
+                'url': line['url'],
+                'image': line['image'],
+                'description': line['description']}
+               for line, _, _ in iter_recipes(recipes_file, GRAPH_FIELDS))
+    return recipe_store.write_store(store_file, recipes)
+
+
+def _graph_from_store(store: recipe_store.RecipeStore) -> Graph:
+    """Return the graph of the recipes in the given recipe store.
+
+    Only the ids, names, urls, ratings and nutrients of the foods are decoded; their other text fields are
+    decoded from the store when they are accessed. Records that repeat a recipe are merged by a Deduplicator, as
+    in build_graph.
+    """
     g = Graph()
+    add_categories(g)
+    add_difficulties(g)
+    add_serves(g)
+    add_times(g)
+
+    dedup = Deduplicator()
+    for i in range(len(store)):
+        name = store.text('name', i)
+        recipe_id = dedup.first_id(store.text('id', i), name, store.text('url', i))
+        g.add_food_vertex(name, FOOD, None, None, None, store.number('rating', i), store, i, recipe_id,
+                          [store.number(nutrient, i) for nutrient in nutrition.NUTRIENTS])
+        _add_option_edges(g, recipe_id, store.number('option_mask', i))
+    dedup.add_aliases(g)
+
+    return g
+
+
+# The fields of a recipe that build_graph uses, those of them that lazy_text leaves in the file, and those that
+# recipes may leave out ('ingredients' is only read by builds with_ingredients, 'steps' and 'dish_type' only by builds
+# with_search, and recipes added by users have no 'nutrients'). The url is still read with
+# lazy_text, since the Deduplicator needs it.
+TEXT_FIELDS = ('url', 'image', 'description')
+GRAPH_FIELDS = ('id', 'name', 'url', 'image', 'description', 'rattings', 'subcategory', 'difficult', 'serves',
+                'times', 'nutrients')
+LAZY_GRAPH_FIELDS = tuple(field for field in GRAPH_FIELDS if field not in TEXT_FIELDS or field == 'url')
+OPTIONAL_FIELDS = TEXT_FIELDS + ('id', 'ingredients', 'nutrients', 'steps', 'dish_type')
+
+
+def iter_recipes(recipes_file: str, fields: Collection[str]) -> Iterator[tuple[dict, int, int]]:
+    """Yield each recipe in the given recipes file, projected onto the given fields, together with the start and
+    end byte offsets of the recipe in the file.
+
+    The file is parsed incrementally, one recipe at a time, so only one recipe (and one chunk of the file)
+    is held in memory at once no matter how large the file is.
+
+    Preconditions:
+        - every recipe in recipes_file has every field in fields that is not in OPTIONAL_FIELDS
+    """
+    with open(recipes_file, 'r', encoding='utf-8', newline='') as f:
+        for record, start, end in _JsonArrayReader(f):
+            yield _project(record, fields), start, end
+
+
+def _project(record: dict, fields: Collection[str]) -> dict:
+    """Return the given recipe with only the given fields.
+
+    The fields in OPTIONAL_FIELDS are None if missing (recipes added by users have no image, for example).
+    """
+    return {field: record.get(field) if field in OPTIONAL_FIELDS else record[field] for field in fields}
+
+
+class _JsonArrayReader:
+    """An iterator over the objects of a JSON array in a text file that reads the file in fixed-size chunks.
+
+    Each object is yielded together with its start and end byte offsets in the file. The file must be opened
+    with newline='' so offsets into the text map to offsets into the file.
 
-    with open(recipes_file, 'r') as f:
-        file = json.load(f)
+    If start is not 0, the file must already be positioned at that byte offset, which must be the start of an
+    object in the array. Iteration then begins with that object instead of at the start of the array.
+    """
+    # Private Instance Attributes:
+    #     - _file: the file being read
+    #     - _chunk_size: the number of characters read from _file at a time
+    #     - _buffer: the text read from _file that has not been discarded yet
+    #     - _index: the position in _buffer up to which the text has been consumed
+    #     - _byte_offset: the byte offset in _file of _buffer[_index]
+    #     - _eof: whether all of _file has been read into _buffer
+    _file: TextIO
+    _chunk_size: int
+    _buffer: str
+    _index: int
+    _byte_offset: int
+    _eof: bool
+
+    _decoder = json.JSONDecoder()
+    _whitespace = re.compile(r'\s*')
+
+    def __init__(self, file: TextIO, chunk_size: int = 1 << 16, start: int = 0) -> None:
+        self._file = file
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._index = 0
+        self._byte_offset = start
+        self._eof = False
+
+    def __iter__(self) -> Iterator[tuple[dict, int, int]]:
+        if self._byte_offset == 0:
+            if self._next_char() != '[':
+                raise ValueError(f'{self._file.name} does not contain a JSON array')
+            self._consume(self._index + 1)
+
+        while self._next_char() != ']':
+            record, end = self._decode()
+            start = self._byte_offset
+            self._consume(end)
+            yield record, start, self._byte_offset
+
+            if self._next_char() == ',':
+                self._consume(self._index + 1)
+
+    def at_separator(self) -> bool:
+        """Return whether the next character, after any whitespace, is the comma or closing bracket that follows an
+        object of the array.
+        """
+        return self._next_char() in ',]'
+
+    def _fill(self) -> bool:
+        """Discard the consumed text and read the next chunk of the file into the buffer.
+
+        Return False if the whole file has already been read.
+        """
+        if self._eof:
+            return False
+        chunk = self._file.read(self._chunk_size)
+        self._eof = chunk == ''
+        self._buffer = self._buffer[self._index:] + chunk
+        self._index = 0
+        return not self._eof
+
+    def _consume(self, end: int) -> None:
+        """Mark the buffer as consumed up to the given position."""
+        self._byte_offset += len(self._buffer[self._index:end].encode('utf-8'))
+        self._index = end
 
-        # add option vertices
-        add_categories(g)
-        add_difficulties(g)
-        add_serves(g)
-        add_times(g)
+    def _next_char(self) -> str:
+        """Consume any whitespace and return the next character, without consuming it.
 
-        for line in file:
-            # add the food vertex
-            g.add_food_vertex(line['name'], 'food', line['url'], line['image'], line['description'], line['rattings'])
+        Raise a ValueError if the file ends first.
+        """
+        while True:
+            self._consume(self._whitespace.match(self._buffer, self._index).end())
+            if self._index < len(self._buffer):
+                return self._buffer[self._index]
+            if not self._fill():
+                raise ValueError(f'{self._file.name} ended before its JSON array was closed')
+
+    def _decode(self) -> tuple[Any, int]:
+        """Decode the JSON value that starts at the current position, reading more of the file as needed.
+
+        Return the value and the position in the buffer just after it.
+        """
+        while True:
+            try:
+                return self._decoder.raw_decode(self._buffer, self._index)
+            except json.JSONDecodeError:
+                # the value may continue into the next chunk of the file
+                if not self._fill():
+                    raise
 
-            # create edge between food and option
-            add_edge_category(line['name'], line['subcategory'], g)
-            add_edge_difficulty(line['name'], line['difficult'], g)
-            add_edge_serves(line['name'], line['serves'], g)
-            add_edge_times(line['name'], line['times'], g)
+
+def build_graph_sharded(recipes_files: str | list[str], lazy_text: bool = False, processes: Optional[int] = None,
+                        shard_size: int = 1 << 23) -> Graph:
+    """Build a recipe graph from several recipes files, parsing them in parallel in a pool of processes.
+
+    recipes_files is a glob pattern or a list of paths and glob patterns, for example
+    ['recipes.json', 'recipes_user_added.json', 'recipe_book.json']. The files are split into shards of about
+    shard_size bytes, and each shard is parsed and normalised (including its times) in its own process. The
+    partial results are then merged into one graph in the order the recipes appear, so the graph is the same as
+    if the files had been read one after another by build_graph. processes is the number of processes to use,
+    defaulting to the number of CPUs. If it is 1, the shards are parsed in this process.
+
+    lazy_text is as in build_graph. Snapshots are not used.
+
+    Preconditions:
+        - processes is None or processes >= 1
+        - shard_size >= 1
+        - no recipe has a list of objects as the value of one of its fields
+    """
+    if isinstance(recipes_files, str):
+        recipes_files = [recipes_files]
+    paths = [path for pattern in recipes_files for path in (sorted(glob.glob(pattern)) or [pattern])]
+
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        shards.extend((path, start, min(start + shard_size, size), lazy_text)
+                      for start in range(0, max(size, 1), shard_size))
+
+    if processes == 1 or len(shards) == 1:
+        return _merge_shards(paths, shards, map(_parse_shard, shards), lazy_text)
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    try:
+        return _merge_shards(paths, shards, pool.map(_parse_shard, shards), lazy_text)
+    finally:
+        # the workers are stopped even if a shard fails to parse, without waiting for the shards still queued
+        pool.shutdown(cancel_futures=True)
+
+
+def _merge_shards(paths: list[str], shards: list[tuple[str, int, int, bool]], parsed_shards: Iterable[list[tuple]],
+                  lazy_text: bool) -> Graph:
+    """Return the graph of the recipes of the given shards of the given recipes files, from the _parse_shard
+    result of each shard, in the same order.
+    """
+    g = Graph()
+    add_categories(g)
+    add_difficulties(g)
+    add_serves(g)
+    add_times(g)
+
+    # records are deduplicated here, in order, since a recipe may be repeated in another shard
+    dedup = Deduplicator()
+    sources = {path: JsonRecordSource(path) for path in paths} if lazy_text else {}
+    for (path, _, _, _), foods in zip(shards, parsed_shards):
+        for recipe_id, name, url, rating, text, options, locator, nutrients in foods:
+            recipe_id = dedup.first_id(recipe_id, name, url)
+            if lazy_text:
+                g.add_food_vertex(name, FOOD, None, None, None, rating, sources[path], locator, recipe_id,
+                                  nutrients)
+            else:
+                g.add_food_vertex(name, FOOD, *text, rating, recipe_id=recipe_id, nutrients=nutrients)
+            for option in options:
+                g.add_edge(recipe_id, option)
+    dedup.add_aliases(g)
 
     return g
 
 
+# Matches the separator between two objects of a JSON array of objects
+_RECORD_SEPARATOR = re.compile(rb'}\s*,\s*{')
+
+
+def _first_record(path: str, start: int, end: int) -> Optional[int]:
+    """Return the byte offset of the first recipe of the given recipes file that is preceded by a separator (see
+    _RECORD_SEPARATOR) starting at a byte offset in [start, end), or None if there is none.
+
+    The separator can also appear inside a string, such as a description that reads '}, {'. So the text after
+    each match is only taken as a recipe if it decodes to an object with the fields every recipe has and is
+    followed by a comma or the end of the array, and the search moves on to the next match otherwise. Inside a
+    string every quote is escaped, so an object that starts inside one cannot have a field name.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        window = b''
+        position = 0
+        while True:
+            match = _RECORD_SEPARATOR.search(window, position)
+            if match is None:
+                chunk = f.read(1 << 16)
+                if not chunk:
+                    return None
+                # a separator may straddle the end of the window
+                position = max(len(window) - 2, 0)
+                window += chunk
+            elif match.start() >= end - start:
+                return None
+            elif _is_record(path, start + match.end() - 1):
+                return start + match.end() - 1
+            else:
+                position = match.start() + 1
+
+
+def _is_record(path: str, offset: int) -> bool:
+    """Return whether a recipe of the given recipes file starts at the given byte offset."""
+    required = set(GRAPH_FIELDS) - set(OPTIONAL_FIELDS)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        try:
+            f.seek(offset)
+            reader = _JsonArrayReader(f, start=offset)
+            record, _, _ = next(iter(reader))
+            return isinstance(record, dict) and required <= record.keys() and reader.at_separator()
+        except (ValueError, StopIteration):
+            # ValueError includes the UnicodeDecodeError of an offset inside a character
+            return False
+
+
+def _parse_shard(shard: tuple[str, int, int, bool]) -> list[tuple]:
+    """Parse and normalise the recipes of the given shard of a recipes file.
+
+    A shard is (path, start, end, lazy_text). It holds every recipe that is preceded by a separator (see
+    _RECORD_SEPARATOR) starting at a byte offset in [start, end), and also the first recipe of the file if
+    start is 0. Return a (recipe id, name, url, rating, (url, image, description), options, (start, end),
+    nutrients) tuple for each of these recipes in order, where the recipe id is as in recipe_key, options is as
+    in recipe_options, nutrients is as in nutrition.nutrient_values and the text is None if lazy_text is True.
+    """
+    path, start, end, lazy_text = shard
+    fields = GRAPH_FIELDS if not lazy_text else LAZY_GRAPH_FIELDS
+
+    # find the first recipe of this shard
+    first = 0
+    if start > 0:
+        first = _first_record(path, start, end)
+        if first is None:
+            return []
+
+    lines = []
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        f.seek(first)
+        for record, record_start, record_end in _JsonArrayReader(f, start=first):
+            lines.append((_project(record, fields), record_start, record_end))
+
+            # the separator after this recipe starts at its last byte
+            if record_end - 1 >= end:
+                break
+
+    # the times of the whole shard are parsed at once
+    minutes = (calc_times([line['times'].get('Preparation', '0') for line, _, _ in lines])
+               + calc_times([line['times'].get('Cooking', '0') for line, _, _ in lines]))
+
+    foods = []
+    for (line, record_start, record_end), combined_times in zip(lines, minutes.tolist()):
+        text = None if lazy_text else (line['url'], line['image'], line['description'])
+        foods.append((recipe_key(line), line['name'], line['url'], line['rattings'], text,
+                      recipe_options(line, combined_times), (record_start, record_end),
+                      nutrition.nutrient_values(line['nutrients'])))
+    return foods
+
+
 if __name__ == '__main__':
     # import doctest
     # doctest.testmod()
 
     import python_ta
     python_ta.check_all(config={
-        'extra-imports': ['json'],
-        'allowed-io': ['build_graph'],
+        'extra-imports': ['bisect', 'collections', 'concurrent.futures', 'functools', 'glob', 'heapq', 'itertools',
+                          'json', 'os', 're', 'sys', 'time', 'numpy', 'ingredients', 'nutrition', 'recipe_store',
+                          'similarity', 'snapshot', 'text_search'],
+        'allowed-io': ['iter_recipes', 'load', '_parse_shard', '_first_record', '_is_record'],
         'max-line-length': 120
     })
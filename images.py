@@ -0,0 +1,370 @@
+"""
+This Python module fetches recipe images for the interface in the background.
+
+Images are downloaded by a pool of worker threads sharing one keep-alive HTTP session, decoded and scaled to
+thumbnails off the render thread, and handed back as futures, so the interface can draw a placeholder straight
+away and swap each thumbnail in once its future is done.
+
+Thumbnails can be kept in a ThumbnailCache, which holds recently used thumbnails in memory and keeps every
+thumbnail on disk between sessions, so showing the same recipe again costs no network or decoding time.
+A ResultPrefetcher fetches the images of the results the user may be shown next before they are asked for.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import pygame
+import requests
+from requests.adapters import HTTPAdapter
+
+THUMBNAIL_SIZE = (80, 80)
+
+
+class ImageFetcher:
+    """A pool of worker threads that download images and scale them to thumbnails.
+
+    Instance Attributes:
+        - timeout: the (connect, read) timeout of each request, in seconds
+        - size: the size of the thumbnails returned by fetch
+        - cache: the cache thumbnails are looked up in and added to, or None if thumbnails are not cached
+        - fetch_seconds: the number of seconds each fetch run by the workers took, in the order they finished
+    """
+    # Private Instance Attributes:
+    #     - _session: the HTTP session shared by the workers; it keeps a pool of keep-alive connections
+    #     - _executor: the worker threads
+    #     - _in_flight: maps the url of each image being fetched to its future, so it is only fetched once
+    #     - _lock: the lock guarding _in_flight
+    timeout: tuple[float, float]
+    size: tuple[int, int]
+    cache: Optional[ThumbnailCache]
+    fetch_seconds: list[float]
+    _session: requests.Session
+    _executor: ThreadPoolExecutor
+    _in_flight: dict[str, Future]
+    _lock: threading.Lock
+
+    def __init__(self, max_workers: int = 5, timeout: tuple[float, float] = (3.05, 10.0),
+                 size: tuple[int, int] = THUMBNAIL_SIZE, cache: Optional[ThumbnailCache] = None) -> None:
+        """Initialize a fetcher with the given number of workers, request timeout, thumbnail size and cache.
+
+        Preconditions:
+            - max_workers >= 1
+        """
+        self.timeout = timeout
+        self.size = size
+        self.cache = cache
+        self.fetch_seconds = []
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-fetcher')
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url: Optional[str]) -> Future:
+        """Start fetching the image at the given url in the background.
+
+        Return a future of the image scaled to self.size, or of None if there is no url or the image could not be
+        downloaded or decoded. If the thumbnail is in the memory tier of self.cache, the future is already done.
+        If the image is already being fetched, the future of that fetch is returned.
+        """
+        if url and self.cache is not None:
+            thumbnail = self.cache.get(url)
+            if thumbnail is not None:
+                future = Future()
+                future.set_result(thumbnail)
+                return future
+
+        with self._lock:
+            if url in self._in_flight:
+                return self._in_flight[url]
+            future = self._executor.submit(self._timed_fetch, url)
+            self._in_flight[url] = future
+        future.add_done_callback(lambda _: self._finished(url))
+        return future
+
+    def _finished(self, url: Optional[str]) -> None:
+        """Forget the fetch of the image at the given url, which has just finished."""
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    def _timed_fetch(self, url: Optional[str]) -> Optional[pygame.Surface]:
+        """Return self._fetch(url), recording how long it took in self.fetch_seconds."""
+        start = time.perf_counter()
+        try:
+            return self._fetch(url)
+        finally:
+            self.fetch_seconds.append(time.perf_counter() - start)
+
+    def _fetch(self, url: Optional[str]) -> Optional[pygame.Surface]:
+        """Return the image at the given url scaled to self.size, or None if that fails.
+
+        If self.cache has a thumbnail of the url on disk that is still fresh, it is used without a request.
+        If it has one that is stale, it is revalidated with a conditional request, and is also used if the
+        request fails.
+        """
+        if not url:
+            return None
+
+        headers = {}
+        cached = None
+        if self.cache is not None:
+            cached = self.cache.read_disk(url)
+            if cached is not None:
+                thumbnail, metadata = cached
+                if time.time() - metadata['fetched_at'] < self.cache.max_age:
+                    self.cache.put(url, thumbnail)
+                    return thumbnail
+                if metadata.get('etag'):
+                    headers['If-None-Match'] = metadata['etag']
+                if metadata.get('last_modified'):
+                    headers['If-Modified-Since'] = metadata['last_modified']
+
+        try:
+            response = self._session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached is not None:
+                self.cache.revalidated(url)
+                self.cache.put(url, cached[0])
+                return cached[0]
+            response.raise_for_status()
+            thumbnail = scale_thumbnail(pygame.image.load(io.BytesIO(response.content)), self.size)
+        except (requests.RequestException, pygame.error):
+            return None if cached is None else cached[0]
+
+        if self.cache is not None:
+            self.cache.put(url, thumbnail)
+            self.cache.write_disk(url, thumbnail, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return thumbnail
+
+    def close(self) -> None:
+        """Stop the workers, without waiting for images still being fetched, and close the HTTP session."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._session.close()
+
+
+class ResultPrefetcher:
+    """Warms an ImageFetcher with the images of the results the user is likely to be shown next.
+
+    Once every choice but the last has been made, the possible results are known: one list of foods for each
+    answer to the last question. Prefetching fetches the images of the top k foods of each of these lists, so
+    that whichever answer is chosen, its results can be shown with their images straight away.
+
+    Instance Attributes:
+        - fetcher: the fetcher the images are fetched with
+        - k: the number of results shown for each answer
+    """
+    fetcher: ImageFetcher
+    k: int
+
+    def __init__(self, fetcher: ImageFetcher, k: int = 10) -> None:
+        """Initialize a prefetcher warming the given fetcher with the top k results of each answer."""
+        self.fetcher = fetcher
+        self.k = k
+
+    def prefetch(self, graph: Any, choices: list[str], last_options: list[str]) -> list[Future]:
+        """Start fetching the images of the top self.k foods of graph for choices plus each of last_options,
+        and return the futures of the fetches.
+
+        graph is a graphs.Graph or a compact_graph.CompactGraph. The queries themselves take microseconds, so
+        they are run in this thread, which keeps the graph to one thread; only the fetches run in the
+        background. Images are fetched best ranked first across all of last_options, so the first page of every
+        answer is fetched before the second page of any.
+        """
+        results = [graph.get_food_options(choices + [option], k=self.k) for option in last_options]
+
+        urls = []
+        for rank in range(self.k):
+            for foods in results:
+                if rank < len(foods) and foods[rank].image and foods[rank].image not in urls:
+                    urls.append(foods[rank].image)
+
+        return [self.fetcher.fetch(url) for url in urls]
+
+
+class ThumbnailCache:
+    """A two-tier cache of thumbnails, keyed by the url of the image they were made from.
+
+    The memory tier is a least recently used cache of decoded surfaces. The disk tier keeps each thumbnail as a
+    PNG file named after the SHA-256 hash of its url, next to a JSON file with the url's ETag and Last-Modified
+    validators and the time it was last fetched or revalidated. When the disk tier grows over max_disk_bytes,
+    the least recently used thumbnails are removed from it. The sizes and order of use of the thumbnails on disk
+    are kept in memory, seeded from the directory once when the cache is created, so a write does not have to
+    list the directory.
+
+    All methods may be called from several threads at once.
+
+    Instance Attributes:
+        - directory: the directory of the disk tier
+        - memory_items: the largest number of thumbnails kept in memory
+        - max_disk_bytes: the largest number of bytes of thumbnails kept on disk
+        - max_age: the number of seconds a thumbnail on disk is used before it is revalidated
+    """
+    # Private Instance Attributes:
+    #     - _memory: the memory tier, mapping url to thumbnail from least to most recently used
+    #     - _lock: the lock guarding _memory
+    #     - _disk_lock: the lock guarding the files in directory, _disk_sizes and _disk_bytes, so disk access
+    #       never blocks the memory tier
+    #     - _disk_sizes: maps the path of each thumbnail on disk to its size in bytes, from least to most
+    #       recently used
+    #     - _disk_bytes: the total size of the thumbnails in _disk_sizes
+    directory: str
+    memory_items: int
+    max_disk_bytes: int
+    max_age: float
+    _memory: OrderedDict[str, pygame.Surface]
+    _lock: threading.Lock
+    _disk_lock: threading.Lock
+    _disk_sizes: OrderedDict[str, int]
+    _disk_bytes: int
+
+    def __init__(self, directory: str, memory_items: int = 256, max_disk_bytes: int = 50 * 1024 * 1024,
+                 max_age: float = 7 * 24 * 60 * 60) -> None:
+        """Initialize a cache with its disk tier in the given directory, creating the directory if needed."""
+        self.directory = directory
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.max_age = max_age
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # the thumbnails already on disk, ordered by when they were last used
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.png') and not entry.name.endswith('.tmp.png'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        entries.sort()
+        self._disk_sizes = OrderedDict((path, size) for _, path, size in entries)
+        self._disk_bytes = sum(self._disk_sizes.values())
+
+    def get(self, url: str) -> Optional[pygame.Surface]:
+        """Return the thumbnail of the given url from the memory tier, or None if it is not there."""
+        with self._lock:
+            if url not in self._memory:
+                return None
+            self._memory.move_to_end(url)
+            return self._memory[url]
+
+    def put(self, url: str, thumbnail: pygame.Surface) -> None:
+        """Add the thumbnail of the given url to the memory tier, evicting the least recently used if it is full."""
+        with self._lock:
+            self._memory[url] = thumbnail
+            self._memory.move_to_end(url)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def read_disk(self, url: str) -> Optional[tuple[pygame.Surface, dict[str, Any]]]:
+        """Return the thumbnail of the given url and its metadata from the disk tier, or None if it is not there."""
+        image_path, metadata_path = self._paths(url)
+        with self._disk_lock:
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+                thumbnail = pygame.image.load(image_path)
+                # mark the thumbnail as recently used for eviction, also for the next cache over this directory
+                os.utime(image_path)
+                self._track(image_path)
+            except (OSError, ValueError, pygame.error):
+                return None
+        return thumbnail, metadata
+
+    def write_disk(self, url: str, thumbnail: pygame.Surface, etag: Optional[str],
+                   last_modified: Optional[str]) -> None:
+        """Add the thumbnail of the given url, with its validators, to the disk tier and evict thumbnails from it
+        until it is no larger than max_disk_bytes.
+        """
+        image_path, metadata_path = self._paths(url)
+        metadata = {'url': url, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()}
+        with self._disk_lock:
+            try:
+                pygame.image.save(thumbnail, image_path + '.tmp.png')
+                os.replace(image_path + '.tmp.png', image_path)
+                self._write_metadata(metadata_path, metadata)
+                self._track(image_path)
+                self._evict()
+            except (OSError, pygame.error):
+                return
+
+    def revalidated(self, url: str) -> None:
+        """Record that the thumbnail of the given url on disk was confirmed to be up to date just now."""
+        _, metadata_path = self._paths(url)
+        with self._disk_lock:
+            try:
+                with open(metadata_path, 'r') as f:
+                    metadata = json.load(f)
+                metadata['fetched_at'] = time.time()
+                self._write_metadata(metadata_path, metadata)
+            except (OSError, ValueError):
+                return
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        """Return the paths of the thumbnail and metadata files of the given url."""
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + '.png'), os.path.join(self.directory, name + '.json')
+
+    @staticmethod
+    def _write_metadata(metadata_path: str, metadata: dict[str, Any]) -> None:
+        """Replace the metadata file at the given path with the given metadata."""
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    def _track(self, image_path: str) -> None:
+        """Record the current size of the thumbnail at the given path, and that it was just used.
+
+        Preconditions:
+            - self._disk_lock is held
+        """
+        size = os.path.getsize(image_path)
+        self._disk_bytes += size - self._disk_sizes.get(image_path, 0)
+        self._disk_sizes[image_path] = size
+        self._disk_sizes.move_to_end(image_path)
+
+    def _evict(self) -> None:
+        """Remove the least recently used thumbnails from disk until the disk tier is no larger than
+        max_disk_bytes.
+
+        Preconditions:
+            - self._disk_lock is held
+        """
+        while self._disk_bytes > self.max_disk_bytes and self._disk_sizes:
+            path, size = self._disk_sizes.popitem(last=False)
+            self._disk_bytes -= size
+            for stale_path in [path, path[:-len('.png')] + '.json']:
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+
+
+def scale_thumbnail(image: pygame.Surface, size: tuple[int, int]) -> pygame.Surface:
+    """Return the given image scaled to the given size.
+
+    smoothscale only supports 24 and 32 bit images, so other images are scaled without smoothing.
+    """
+    try:
+        return pygame.transform.smoothscale(image, size)
+    except ValueError:
+        return pygame.transform.scale(image, size)
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'concurrent.futures', 'hashlib', 'io', 'json', 'os', 'threading', 'time',
+                          'pygame', 'requests', 'requests.adapters'],
+        'allowed-io': ['read_disk', 'revalidated', '_write_metadata'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,402 @@
+"""
+This Python module turns the ingredient lines of recipes into canonical ingredients, and answers "cook with what I
+have" queries over them.
+
+normalise_ingredient strips the quantities, units, preparation notes and descriptive words from an ingredient
+line, and singularises what is left, so that '250g pouch ready-to-eat quinoa (we used Merchant Gourmet)' and
+'½ cucumber, halved and sliced' become 'quinoa' and 'cucumber'. The same function normalises the terms a user
+types in, so both sides meet in the same vocabulary.
+
+A PantryIndex keeps a sorted integer posting list of foods for every canonical ingredient, and ranks foods by
+how much of their ingredient list a pantry covers.
+"""
+
+from __future__ import annotations
+from typing import Any, Callable, Iterable, Optional
+import functools
+import re
+
+import numpy as np
+
+# The characters that start a quantity, including the vulgar fractions recipes are written with
+_QUANTITY = r'[\d½¼¾⅓⅔⅛][\d½¼¾⅓⅔⅛.,/\-–]*'
+# Units and containers, which only describe how much of the ingredient there is
+_UNITS = ('g', 'kg', 'mg', 'ml', 'cl', 'l', 'litre', 'litres', 'liter', 'oz', 'lb', 'lbs', 'tbsp', 'tsp',
+          'tablespoon', 'tablespoons', 'teaspoon', 'teaspoons', 'dsp', 'cup', 'cups', 'pint', 'pints', 'cm', 'mm',
+          'inch', 'x', 'pack', 'packs', 'packet', 'packets', 'pouch', 'pouches', 'can', 'cans', 'tin', 'tins',
+          'jar', 'jars', 'bottle', 'bottles', 'bag', 'bags', 'box', 'carton', 'tub', 'tubs', 'punnet', 'punnets',
+          'handful', 'handfuls', 'pinch', 'pinches', 'bunch', 'bunches', 'sprig', 'sprigs', 'splash', 'dash',
+          'drizzle', 'knob', 'ball', 'balls', 'slice', 'slices', 'sheet', 'sheets', 'piece', 'pieces', 'stick',
+          'sticks', 'head', 'heads', 'thumb-sized', 'thumb', 'sachet', 'sachets', 'block', 'glass', 'scoop',
+          'of', 'a', 'an', 'the', 'few', 'some', 'large', 'small', 'medium', 'big', 'heaped', 'level', 'rounded',
+          'generous', 'good', 'little', 'about', 'approx', 'roughly', 'plus', 'extra')
+# Leading words made of a quantity glued to a unit, such as '250g' or '1l', or followed by one, such as '3 x'
+_LEADING_QUANTITY = re.compile(r'^(?:' + _QUANTITY + r'(?:' + '|'.join(map(re.escape, _UNITS)) + r')?(?:\s|$))+')
+# Words that describe how an ingredient is prepared or what quality it is, rather than what it is
+_DESCRIPTORS = frozenset(
+    ('fresh', 'freshly', 'chopped', 'sliced', 'diced', 'grated', 'finely', 'roughly', 'coarsely', 'thinly',
+     'thickly', 'peeled', 'beaten', 'melted', 'softened', 'crushed', 'halved', 'quartered', 'shredded', 'torn',
+     'drained', 'rinsed', 'trimmed', 'washed', 'deseeded', 'pitted', 'zested', 'juiced', 'sifted', 'cubed',
+     'ready-to-eat', 'good-quality', 'quality', 'optional', 'lightly', 'very', 'well', 'into', 'cut', 'and',
+     'for', 'to', 'serve', 'serving', 'garnish', 'more', 'needed', 'plus', 'extra', 'large', 'small', 'medium',
+     'big', 'whole', 'raw', 'ripe', 'handful', 'bunch', 'pinch', 'of', 'a', 'few', 'x')
+    + _UNITS)
+# Words that name a part of an ingredient that is sold in them, such as 'garlic cloves'
+_PART_WORDS = frozenset(('clove', 'cloves'))
+_NOT_LETTERS = re.compile(r"[^a-zà-öø-ÿ' -]+")
+
+
+@functools.lru_cache(maxsize=4096)
+def normalise_ingredient(line: str) -> Optional[str]:
+    """Return the canonical ingredient of the given ingredient line, or None if it names no ingredient.
+
+    >>> normalise_ingredient('250g pouch ready-to-eat quinoa (we used Merchant Gourmet)')
+    'quinoa'
+    >>> normalise_ingredient('½ pack dill, finely chopped')
+    'dill'
+    >>> normalise_ingredient('3 x 400g cans chopped tomatoes')
+    'tomato'
+    >>> normalise_ingredient('3 garlic cloves, 2 finely grated')
+    'garlic'
+    >>> normalise_ingredient('handful of flat-leaf parsley  or curly parsley')
+    'curly parsley'
+    >>> normalise_ingredient('Smoked salmon')
+    'smoked salmon'
+    >>> normalise_ingredient('2 tbsp') is None
+    True
+    """
+    text = re.sub(r'\([^)]*\)?', ' ', line.lower().replace('\xa0', ' '))
+    # preparation notes follow the first comma, and of several alternatives the last is the most specific
+    text = text.split(',')[0].split(' or ')[-1]
+    text = _LEADING_QUANTITY.sub('', text.strip())
+
+    words = [word.strip("-'") for word in _NOT_LETTERS.sub(' ', text).split()]
+    words = [word for word in words if word and word not in _DESCRIPTORS]
+    while words and words[-1] in _PART_WORDS:
+        words.pop()
+    if not words:
+        return None
+
+    words[-1] = _singular(words[-1])
+    return ' '.join(words)
+
+
+def _singular(word: str) -> str:
+    """Return the singular of the given English noun, by a few simple rules.
+
+    >>> [_singular(word) for word in ['onions', 'tomatoes', 'radishes', 'berries', 'leaves', 'hummus', 'peas']]
+    ['onion', 'tomato', 'radish', 'berry', 'leaf', 'hummus', 'pea']
+    """
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('ves'):
+        return word[:-3] + 'f'
+    if word.endswith(('oes', 'ches', 'shes', 'xes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def recipe_ingredients(lines: Iterable[str]) -> list[str]:
+    """Return the distinct canonical ingredients of the given ingredient lines, in the order they first appear.
+
+    >>> recipe_ingredients(['2 onions, sliced', '1 red onion', '1 large onion', '2 tbsp'])
+    ['onion', 'red onion']
+    """
+    ingredients = {}
+    for line in lines:
+        ingredient = normalise_ingredient(line)
+        if ingredient is not None:
+            ingredients[ingredient] = None
+    return list(ingredients)
+
+
+class PantryIndex:
+    """An inverted index from canonical ingredients to the foods that use them, for ranking foods by how much of
+    them a pantry covers.
+
+    Foods are numbered by their position in the list the index is built from, which should be the order their
+    ties are broken in. The posting list of each ingredient is a sorted NumPy array of the numbers of the foods
+    that use it.
+
+    Foods added after the index was built (see add) are numbered after the others, and their ingredients are kept
+    apart in dicts, so adding a food does not copy the posting lists. Their ties with other foods are broken by
+    the key the index was given. Removed foods keep their numbers, and are left out of the answers.
+
+    A term a user types (see ingredient_ids) stands for every ingredient that is the term or ends in it, so
+    'salmon' stands for 'salmon' and 'smoked salmon'.
+
+    Instance Attributes:
+        - foods: the foods of this index, in the order they are numbered
+        - ingredients: the canonical ingredients of this index, in the order they are numbered
+
+    Representation Invariants:
+        - all(np.all(np.diff(posting) > 0) for posting in self._postings)
+        - len(self._sizes) == len(self._live) >= len(self.foods)
+    """
+    # Private Instance Attributes:
+    #     - _ingredient_ids: maps each canonical ingredient to its number
+    #     - _by_last_word: maps the last word of each canonical ingredient to the numbers of those ending in it
+    #     - _postings: the posting list of each ingredient, indexed by its number
+    #     - _sizes: the number of distinct ingredients of each food, indexed by its number, with room for more foods
+    #     - _live: whether each food has not been removed, indexed by its number, with the same room
+    #     - _numbers: maps each food that has not been removed to its number
+    #     - _built: the number of foods the index was built with
+    #     - _food_ingredients: the numbers of the distinct ingredients of every food the index was built with, one
+    #       food after another
+    #     - _starts: the position in _food_ingredients of the ingredients of each food the index was built with,
+    #       indexed by its number
+    #     - _extra_postings: maps the number of each ingredient of the foods added after the index was built to the
+    #       numbers of those foods that use it, in increasing order
+    #     - _extra_ingredients: maps the number of each food added after the index was built to the numbers of its
+    #       distinct ingredients
+    #     - _key: the key that orders foods the way their ties are broken, or None if only foods in the order they
+    #       were numbered are ever compared
+    #     - _terms: maps each term looked up so far to the numbers of the ingredients it stands for
+    foods: list[Any]
+    ingredients: list[str]
+    _ingredient_ids: dict[str, int]
+    _by_last_word: dict[str, list[int]]
+    _postings: list[np.ndarray]
+    _sizes: np.ndarray
+    _live: np.ndarray
+    _numbers: dict[Any, int]
+    _built: int
+    _food_ingredients: np.ndarray
+    _starts: np.ndarray
+    _extra_postings: dict[int, list[int]]
+    _extra_ingredients: dict[int, list[int]]
+    _key: Optional[Callable[[Any], Any]]
+    _terms: dict[str, list[int]]
+
+    def __init__(self, foods: list[Any], food_ingredients: list[Iterable[str]],
+                 key: Optional[Callable[[Any], Any]] = None) -> None:
+        """Initialize an index of the given foods, where food_ingredients[i] are the canonical ingredients of
+        foods[i]. key orders the foods added later among the others, as foods is ordered.
+
+        Preconditions:
+            - len(foods) == len(food_ingredients)
+            - no food is in foods twice
+            - key is None or foods == sorted(foods, key=key)
+        """
+        self.foods = list(foods)
+        self.ingredients = []
+        self._ingredient_ids = {}
+        self._by_last_word = {}
+        self._terms = {}
+        postings = []
+        sizes = []
+        flat_ids = []
+        for food_id, ingredients in enumerate(food_ingredients):
+            ingredients = set(ingredients)
+            sizes.append(len(ingredients))
+            for ingredient in ingredients:
+                if ingredient not in self._ingredient_ids:
+                    self._new_ingredient(ingredient)
+                    postings.append([])
+                postings[self._ingredient_ids[ingredient]].append(food_id)
+                flat_ids.append(self._ingredient_ids[ingredient])
+
+        # the foods are visited in order, so every posting list is already sorted
+        self._postings = [np.array(posting, dtype=np.int32) for posting in postings]
+        self._sizes = np.array(sizes, dtype=np.int64)
+        self._live = np.ones(len(self.foods), dtype=bool)
+        self._numbers = {food: number for number, food in enumerate(self.foods)}
+        self._built = len(self.foods)
+        self._food_ingredients = np.array(flat_ids, dtype=np.int32)
+        self._starts = np.cumsum(self._sizes) - self._sizes
+        self._extra_postings = {}
+        self._extra_ingredients = {}
+        self._key = key
+
+    def __contains__(self, food: Any) -> bool:
+        """Return whether the given food is in this index and has not been removed."""
+        return food in self._numbers
+
+    def add(self, food: Any, ingredients: Iterable[str]) -> None:
+        """Add the given food, which uses the given canonical ingredients, to this index.
+
+        Preconditions:
+            - food not in self
+        """
+        number = len(self.foods)
+        if number == len(self._sizes):
+            # the sizes and live flags grow by doubling, so adding foods one at a time stays cheap
+            self._sizes = np.concatenate((self._sizes, np.zeros(max(number, 1), dtype=np.int64)))
+            self._live = np.concatenate((self._live, np.zeros(max(number, 1), dtype=bool)))
+        ids = []
+        for ingredient in set(ingredients):
+            if ingredient not in self._ingredient_ids:
+                self._new_ingredient(ingredient)
+                self._postings.append(np.zeros(0, dtype=np.int32))
+            ids.append(self._ingredient_ids[ingredient])
+            self._extra_postings.setdefault(ids[-1], []).append(number)
+
+        self.foods.append(food)
+        self._numbers[food] = number
+        self._sizes[number] = len(ids)
+        self._live[number] = True
+        self._extra_ingredients[number] = ids
+
+    def remove(self, food: Any) -> None:
+        """Remove the given food from this index. Do nothing if it is not in it."""
+        number = self._numbers.pop(food, None)
+        if number is not None:
+            self._live[number] = False
+
+    def _new_ingredient(self, ingredient: str) -> None:
+        """Give the given canonical ingredient the next ingredient number, without a posting list yet."""
+        self._ingredient_ids[ingredient] = len(self.ingredients)
+        self.ingredients.append(ingredient)
+        self._by_last_word.setdefault(ingredient.rsplit(' ', 1)[-1], []).append(len(self.ingredients) - 1)
+        # a term looked up before may stand for the new ingredient too
+        self._terms.clear()
+
+    def ingredient_ids(self, term: str) -> list[int]:
+        """Return the numbers of the ingredients the given term stands for: those equal to its canonical form, or
+        ending in it.
+        """
+        if term not in self._terms:
+            canonical = normalise_ingredient(term)
+            if canonical is None:
+                self._terms[term] = []
+            else:
+                self._terms[term] = [i for i in self._by_last_word.get(canonical.rsplit(' ', 1)[-1], [])
+                                     if self.ingredients[i] == canonical
+                                     or self.ingredients[i].endswith(' ' + canonical)]
+        return self._terms[term]
+
+    def foods_with(self, term: str) -> np.ndarray:
+        """Return the sorted numbers of the foods that use an ingredient the given term stands for."""
+        return self.foods_with_ids(self.ingredient_ids(term))
+
+    def query(self, pantry: Iterable[str], must: Iterable[str] = (), exclude: Iterable[str] = (),
+              k: Optional[int] = 10) -> list[tuple[Any, float]]:
+        """Return the foods that can best be cooked from the given pantry, with the fraction of the distinct
+        ingredients of each that the pantry covers.
+
+        Foods are ranked by that fraction (highest to lowest), with ties in the order of self.foods. Only foods
+        that use an ingredient in the pantry, every term in must, and no term in exclude are returned. The terms
+        in must count as being in the pantry. If k is not None, only the first k foods are returned.
+
+        The must terms are applied rarest first, and each only has to check the foods the earlier ones left,
+        stopping as soon as none are left. Without must terms, the covered ingredients of every food are counted
+        in one pass over the pantry's posting lists. Only the best k foods are sorted.
+
+        Preconditions:
+            - k is None or k >= 0
+        """
+        must_ids = sorted((self.ingredient_ids(term) for term in must), key=self._postings_size)
+        candidates = None
+        for ids in must_ids:
+            if candidates is None:
+                candidates = self.foods_with_ids(ids)
+            else:
+                candidates = candidates[self._count(ids, candidates) > 0]
+            if len(candidates) == 0:
+                return []
+
+        covered = sorted({i for term in pantry for i in self.ingredient_ids(term)}.union(*must_ids))
+        if not covered:
+            return []
+        if candidates is None:
+            counts = self._count(covered)
+            candidates = np.flatnonzero(counts)
+            counts = counts[candidates]
+        else:
+            counts = self._count(covered, candidates)
+        if len(self._numbers) < len(self.foods):
+            live = self._live[candidates]
+            candidates, counts = candidates[live], counts[live]
+
+        excluded = [i for term in exclude for i in self.ingredient_ids(term)]
+        if excluded:
+            keep = self._count(excluded, candidates) == 0
+            candidates, counts = candidates[keep], counts[keep]
+
+        coverage = counts / self._sizes[candidates]
+        if k is not None and k < len(candidates):
+            if k == 0:
+                return []
+            # every food in the top k covers at least the k-th highest fraction
+            threshold = np.partition(coverage, len(coverage) - k)[len(coverage) - k]
+            best = coverage >= threshold
+            candidates, coverage = candidates[best], coverage[best]
+        if self._extra_ingredients and self._key is not None:
+            # foods added after the index was built are not numbered in the order their ties are broken in
+            order = sorted(range(len(candidates)),
+                           key=lambda i: (-coverage[i], self._key(self.foods[candidates[i]])))[:k]
+        else:
+            order = np.lexsort((candidates, -coverage))[:k]
+        return [(self.foods[candidates[i]], float(coverage[i])) for i in order]
+
+    def foods_with_ids(self, ids: list[int]) -> np.ndarray:
+        """Return the sorted numbers of the foods that use one of the ingredients with the given numbers."""
+        if len(ids) == 1:
+            return self._posting(ids[0])
+        return np.flatnonzero(self._mark(ids))
+
+    def _posting(self, i: int) -> np.ndarray:
+        """Return the sorted numbers of the foods that use the ingredient with the given number, including those
+        added after this index was built.
+        """
+        if i not in self._extra_postings:
+            return self._postings[i]
+        return np.concatenate((self._postings[i], np.array(self._extra_postings[i], dtype=np.int32)))
+
+    def _postings_size(self, ids: list[int]) -> int:
+        """Return the total length of the posting lists of the ingredients with the given numbers."""
+        return sum(len(self._postings[i]) + len(self._extra_postings.get(i, ())) for i in ids)
+
+    def _mark(self, ids: list[int]) -> np.ndarray:
+        """Return a boolean array that is True at the number of every food that uses one of the ingredients
+        with the given numbers.
+        """
+        marked = np.zeros(len(self.foods), dtype=bool)
+        for i in ids:
+            marked[self._posting(i)] = True
+        return marked
+
+    def _count(self, ids: list[int], candidates: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return how many of the ingredients with the given numbers each food in the sorted array candidates
+        uses, or each food of this index if candidates is None.
+
+        This either counts every posting list of the ingredients in one pass, or looks up the ingredients of
+        each candidate, whichever reads fewer numbers.
+        """
+        if candidates is None or self._postings_size(ids) <= int(self._sizes[candidates].sum()):
+            if not ids:
+                counts = np.zeros(len(self.foods), dtype=np.int64)
+            else:
+                counts = np.bincount(np.concatenate([self._posting(i) for i in ids]), minlength=len(self.foods))
+            return counts if candidates is None else counts[candidates]
+
+        wanted = np.zeros(len(self.ingredients), dtype=bool)
+        wanted[ids] = True
+        # the candidates are sorted, so the foods added after this index was built come last
+        added = candidates[np.searchsorted(candidates, self._built):]
+        candidates = candidates[:len(candidates) - len(added)]
+        starts, sizes = self._starts[candidates], self._sizes[candidates]
+        # the positions of the ingredients of every candidate in self._food_ingredients, one candidate after another
+        offsets = np.cumsum(sizes) - sizes
+        positions = np.arange(int(sizes.sum())) + np.repeat(starts - offsets, sizes)
+        found = np.concatenate(([0], np.cumsum(wanted[self._food_ingredients[positions]])))
+        counts = found[offsets + sizes] - found[offsets]
+        if len(added) == 0:
+            return counts
+        return np.concatenate((counts, [int(wanted[self._extra_ingredients[number]].sum())
+                                        for number in added.tolist()]))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['functools', 're', 'numpy'],
+        'max-line-length': 120
+    })
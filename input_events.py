@@ -0,0 +1,135 @@
+"""
+This Python module delivers mouse input to the widgets of the interface.
+
+The main loop reads the pending pygame events once per frame and hands them to an InputDispatcher. The dispatcher
+hit-tests each mouse event against a SpatialIndex of the widgets on the active screen, and only notifies the
+widgets under the pointer. The cost of a frame therefore depends on the number of events, not on the number of
+widgets.
+
+A widget is any object with:
+    - rect: the pygame.Rect that receives its input
+    - on_enter(): called when the pointer moves onto it
+    - on_leave(): called when the pointer moves off it
+    - on_press(): called when the left mouse button is pressed over it
+    - on_release(): called when the left mouse button is released over it
+    - reset_input(): called at the start of the next dispatch after it was pressed or released, to clear any
+      state that only lasts for one frame
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable
+
+import pygame
+
+LEFT_MOUSE_BUTTON = 1
+
+
+class SpatialIndex:
+    """A uniform grid over the screen, mapping each cell to the widgets whose rects overlap it.
+
+    Instance Attributes:
+        - cell_size: the width and height of each cell, in pixels
+    """
+    # Private Instance Attributes:
+    #     - _cells: maps the (column, row) of each cell to the widgets that overlap it
+    cell_size: int
+    _cells: dict[tuple[int, int], list[Any]]
+
+    def __init__(self, widgets: Iterable[Any], cell_size: int = 64) -> None:
+        """Initialize an index of the given widgets.
+
+        Preconditions:
+            - cell_size > 0
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        for widget in widgets:
+            rect = widget.rect
+            for column in range(rect.left // cell_size, (rect.right - 1) // cell_size + 1):
+                for row in range(rect.top // cell_size, (rect.bottom - 1) // cell_size + 1):
+                    self._cells.setdefault((column, row), []).append(widget)
+
+    def at(self, pos: tuple[int, int]) -> list[Any]:
+        """Return the widgets whose rects contain the given position."""
+        cell = (pos[0] // self.cell_size, pos[1] // self.cell_size)
+        return [widget for widget in self._cells.get(cell, []) if widget.rect.collidepoint(pos)]
+
+
+class InputDispatcher:
+    """Delivers the mouse events of each frame to the widgets of the active screen.
+
+    Instance Attributes:
+        - pointer: the last known position of the mouse
+    """
+    # Private Instance Attributes:
+    #     - _index: the spatial index of the widgets of the active screen
+    #     - _hovered: the widgets under the pointer
+    #     - _notified: the widgets that were pressed or released during the last dispatch
+    pointer: tuple[int, int]
+    _index: SpatialIndex
+    _hovered: list[Any]
+    _notified: list[Any]
+
+    def __init__(self) -> None:
+        """Initialize a dispatcher with no widgets."""
+        self.pointer = pygame.mouse.get_pos()
+        self._index = SpatialIndex([])
+        self._hovered = []
+        self._notified = []
+
+    def set_widgets(self, widgets: Iterable[Any]) -> None:
+        """Make the given widgets the ones that receive input, replacing the widgets of the previous screen.
+
+        The widgets under the pointer are notified that it has entered them.
+        """
+        for widget in self._hovered:
+            widget.on_leave()
+        self._index = SpatialIndex(widgets)
+        self._hovered = self._index.at(self.pointer)
+        for widget in self._hovered:
+            widget.on_enter()
+
+    def dispatch(self, events: Iterable[pygame.event.Event]) -> None:
+        """Deliver the given events to the widgets they affect."""
+        for widget in self._notified:
+            widget.reset_input()
+        self._notified = []
+
+        for event in events:
+            if event.type == pygame.MOUSEMOTION:
+                self._move(event.pos)
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == LEFT_MOUSE_BUTTON:
+                self._move(event.pos)
+                for widget in self._hovered:
+                    widget.on_press()
+                self._notified.extend(self._hovered)
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == LEFT_MOUSE_BUTTON:
+                self._move(event.pos)
+                for widget in self._hovered:
+                    widget.on_release()
+                self._notified.extend(self._hovered)
+
+    def _move(self, pos: tuple[int, int]) -> None:
+        """Move the pointer to the given position, notifying the widgets it leaves and enters."""
+        if pos == self.pointer:
+            return
+        self.pointer = pos
+        under = self._index.at(pos)
+        for widget in self._hovered:
+            if all(widget is not other for other in under):
+                widget.on_leave()
+        for widget in under:
+            if all(widget is not other for other in self._hovered):
+                widget.on_enter()
+        self._hovered = under
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['pygame'],
+        'max-line-length': 120
+    })
@@ -1,14 +1,19 @@
 """
 Main interface of the app
 """
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
 
-import io
-import textwrap
+import time
 import webbrowser
-import requests
 import pygame
 import graphs
+import compact_graph
+import images
+import rendering
+import input_events
+import assets
+import text_rendering
+import recipe_watcher
 
 SCREEN_HEIGHT = 700
 SCREEN_WIDTH = 700
@@ -73,9 +78,29 @@ class MultipleToggle:
             button.draw()
 
 
-def run_game() -> None:
+def run_game(engine: str = 'graph', fps: int = 60, idle_fps: int = 10, atlas_size: Optional[int] = None,
+             replay: Optional[Iterable[list[pygame.event.Event]]] = None,
+             stats: Optional[rendering.RunStats] = None) -> None:
     """
     Runs the main pygame interface
+
+    engine selects the recipe network used to answer queries: 'graph' for graphs.Graph, or 'compact' for the
+    NumPy-backed compact_graph.CompactGraph.
+
+    The main loop runs at most fps frames per second, and at most idle_fps frames per second once no input has
+    arrived for a second. Only the parts of the screen that changed in a frame are redrawn.
+
+    Every image is loaded and scaled once through an assets.AssetManager. If atlas_size is given, the images are
+    packed into texture atlases of that width and height.
+
+    If replay is given, its lists of events are used as the input of successive frames instead of the events
+    pygame receives, and the interface quits once they run out. If stats is given, the time taken to build the
+    recipe network, every frame and every image fetch is recorded in it.
+
+    Preconditions:
+        - engine in {'graph', 'compact'}
+        - fps >= idle_fps >= 1
+        - atlas_size is None or atlas_size > 0
     """
     logo_img = pygame.image.load('assets/logo.png')
 
@@ -83,55 +108,80 @@ def run_game() -> None:
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption('FOOD MOOD')
     pygame.display.set_icon(logo_img)
+    regions = rendering.DirtyRegions(screen)
+    dispatcher = input_events.InputDispatcher()
+    asset_manager = assets.AssetManager(atlas_size)
+    text_cache = text_rendering.TextCache()
 
     small_font_size = 14
     medium_font_size = 20
 
     # Load the custom font
-    font_montserrat_medium = pygame.font.Font(MONTSERRAT, medium_font_size)
-    font_helvetica_small = pygame.font.Font(HELVETICA, small_font_size)
+    font_montserrat_medium = text_cache.font(MONTSERRAT, medium_font_size)
+    font_helvetica_small = text_cache.font(HELVETICA, small_font_size)
 
     # Buttons
-    next_img = pygame.image.load('assets/buttons/next_btn.png').convert_alpha()
-    food_img = pygame.image.load('assets/buttons/food_btn.png').convert_alpha()
-    food_name_img = pygame.image.load('assets/buttons/food_name_btn.png').convert_alpha()
-    food_desc_img = pygame.image.load('assets/buttons/food_desc_btn.png').convert_alpha()
-    recipe_img = pygame.image.load('assets/buttons/recipe_btn.png').convert_alpha()
-    back_img = pygame.image.load('assets/buttons/back_btn.png').convert_alpha()
-    close_img = pygame.image.load('assets/buttons/close_btn.png').convert_alpha()
-    back_img_food = pygame.image.load('assets/buttons/back_btn_food.png').convert_alpha()
-    next_img_food = pygame.image.load('assets/buttons/next_btn_food.png').convert_alpha()
+    next_img = asset_manager.image('assets/buttons/next_btn.png')
+    food_img = asset_manager.image('assets/buttons/food_btn.png')
+    food_name_img = asset_manager.image('assets/buttons/food_name_btn.png')
+    food_desc_img = asset_manager.image('assets/buttons/food_desc_btn.png')
+    recipe_img = asset_manager.image('assets/buttons/recipe_btn.png')
+    back_img = asset_manager.image('assets/buttons/back_btn.png')
+    close_img = asset_manager.image('assets/buttons/close_btn.png')
+    back_img_food = asset_manager.image('assets/buttons/back_btn_food.png')
+    next_img_food = asset_manager.image('assets/buttons/next_btn_food.png')
 
     # Buttons Hover
-    next_img_hover = pygame.image.load('assets/buttons/next_btn_hover.png').convert_alpha()
-    food_img_hover = pygame.image.load('assets/buttons/food_btn_hover.png').convert_alpha()
-    recipe_img_hover = pygame.image.load('assets/buttons/recipe_btn_hover.png').convert_alpha()
-    back_img_hover = pygame.image.load('assets/buttons/back_btn_hover.png').convert_alpha()
-    close_img_hover = pygame.image.load('assets/buttons/close_btn_hover.png').convert_alpha()
-    back_img_food_hover = pygame.image.load('assets/buttons/back_btn_food_hover.png').convert_alpha()
-    next_img_food_hover = pygame.image.load('assets/buttons/next_btn_food_hover.png').convert_alpha()
+    next_img_hover = asset_manager.image('assets/buttons/next_btn_hover.png')
+    food_img_hover = asset_manager.image('assets/buttons/food_btn_hover.png')
+    recipe_img_hover = asset_manager.image('assets/buttons/recipe_btn_hover.png')
+    back_img_hover = asset_manager.image('assets/buttons/back_btn_hover.png')
+    close_img_hover = asset_manager.image('assets/buttons/close_btn_hover.png')
+    back_img_food_hover = asset_manager.image('assets/buttons/back_btn_food_hover.png')
+    next_img_food_hover = asset_manager.image('assets/buttons/next_btn_food_hover.png')
 
     # Toggle Buttons
-    toggle_img = pygame.image.load('assets/buttons/toggle_btn.png').convert_alpha()
-    toggle_clicked_img = pygame.image.load('assets/buttons/toggle_btn_clicked.png').convert_alpha()
-    toggle_hover_img = pygame.image.load('assets/buttons/toggle_btn_hover.png').convert_alpha()
-    toggle_hover_clicked_img = pygame.image.load('assets/buttons/toggle_btn_clicked_hover.png').convert_alpha()
-
-    subcat_img = pygame.image.load('assets/subcat_bg.png')
-    difficult_img = pygame.image.load('assets/difficulty_bg.png')
-    serves_img = pygame.image.load('assets/servings_bg.png')
-    times_img = pygame.image.load('assets/time_bg.png')
-    food_bg = pygame.image.load('assets/food_bg.png')
-    last_bg = pygame.image.load('assets/last_bg.png')
-
-    bg_img2 = pygame.image.load('assets/bg_img3.png')
-    bg_img_food = pygame.image.load('assets/bg_img_food.png')
-    nofood_img = pygame.image.load('assets/nofood.png')
-    logo_home = pygame.image.load('assets/logo.png')
-    logo_home_hover = pygame.image.load('assets/logo_hover.png')
+    toggle_img = asset_manager.image('assets/buttons/toggle_btn.png')
+    toggle_clicked_img = asset_manager.image('assets/buttons/toggle_btn_clicked.png')
+    toggle_hover_img = asset_manager.image('assets/buttons/toggle_btn_hover.png')
+    toggle_hover_clicked_img = asset_manager.image('assets/buttons/toggle_btn_clicked_hover.png')
+
+    subcat_img = asset_manager.image('assets/subcat_bg.png')
+    difficult_img = asset_manager.image('assets/difficulty_bg.png')
+    serves_img = asset_manager.image('assets/servings_bg.png')
+    times_img = asset_manager.image('assets/time_bg.png')
+    food_bg = asset_manager.image('assets/food_bg.png')
+    last_bg = asset_manager.image('assets/last_bg.png')
+
+    bg_img2 = asset_manager.image('assets/bg_img3.png')
+    bg_img_food = asset_manager.image('assets/bg_img_food.png')
+    nofood_img = asset_manager.image('assets/nofood.png')
+    no_image_thumbnail = asset_manager.scaled(asset_manager.image('assets/no_image.png'), images.THUMBNAIL_SIZE)
+
+    # Recipe images are fetched in the background while the results are shown, and their thumbnails are kept
+    # between result pages and sessions
+    image_fetcher = images.ImageFetcher(cache=images.ThumbnailCache('.thumbnail_cache'))
+    result_prefetcher = images.ResultPrefetcher(image_fetcher, k=10)
+    logo_home = asset_manager.image('assets/logo.png')
+    logo_home_hover = asset_manager.image('assets/logo_hover.png')
+
+    def compose_background(image: pygame.Surface, fill: Optional[tuple[int, int, int]] = None) -> pygame.Surface:
+        """
+        returns a screen-sized background of the given image over the given fill colour
+        """
+        background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+        if fill is not None:
+            background.fill(fill)
+        background.blit(image, (0, 0))
+        return background
 
     class Button:
-        """Button Instance"""
+        """Button Instance
+
+        A button only redraws itself when its appearance changes, or when the background of the screen has been
+        drawn again since it was last drawn. Mouse input is delivered to it by the input dispatcher: clicked is
+        only True for the frame in which the button was pressed.
+        """
         name: str
         x: int
         y: int
@@ -139,43 +189,104 @@ def run_game() -> None:
         image_pressed: pygame.Surface
         scale: float
         clicked: bool
+        hovered: bool
         rect: pygame.rect
+        drawn_appearance: tuple | None
+        drawn_generation: int | None
 
         def __init__(self, name: str, x: int, y: int, image: pygame.Surface, image_pressed: pygame.Surface,
                      scale: float) -> None:
             width = image.get_width()
             height = image.get_height()
-            self.image = pygame.transform.smoothscale(image, (int(width) * scale, int(height) * scale))
-            self.image_pressed = pygame.transform.smoothscale(image_pressed,
-                                                              (int(width) * scale, int(height) * scale))
+            self.image = asset_manager.scaled(image, (int(width) * scale, int(height) * scale))
+            self.image_pressed = asset_manager.scaled(image_pressed, (int(width) * scale, int(height) * scale))
             self.rect = self.image.get_rect()
             self.rect.topleft = (x, y)
             self.clicked = False
+            self.hovered = False
             self.name = name
+            self.drawn_appearance = None
+            self.drawn_generation = None
 
         def draw(self) -> bool:
             """
-                Draws
+                Draws, and returns whether the button was pressed this frame
+            """
+            self.paint(self.hovered)
+            return self.clicked
+
+        def on_enter(self) -> None:
+            """
+            the mouse moved onto the button
+            """
+            self.hovered = True
+
+        def on_leave(self) -> None:
+            """
+            the mouse moved off the button
+            """
+            self.hovered = False
+
+        def on_press(self) -> None:
+            """
+            the mouse was pressed over the button
+            """
+            self.clicked = True
+
+        def on_release(self) -> None:
+            """
+            the mouse was released over the button
+            """
+
+        def reset_input(self) -> None:
+            """
+            the frame in which the button was pressed or released is over
+            """
+            self.clicked = False
+
+        def paint(self, hovered: bool) -> None:
+            """
+            Draws the button onto the screen if its appearance has changed since it was last drawn
+            """
+            appearance = self.appearance(hovered)
+            if appearance == self.drawn_appearance and self.drawn_generation == regions.generation:
+                return
+            bounds = self.bounds()
+            regions.restore(bounds)
+            self.blit(hovered)
+            self.drawn_appearance = appearance
+            self.drawn_generation = regions.generation
+
+        def hide(self) -> None:
             """
-            action = False
-            # get mouse position
-            pos = pygame.mouse.get_pos()
+            Removes the button from the screen, if it is drawn on the current background
+            """
+            if self.drawn_generation == regions.generation:
+                regions.restore(self.bounds())
+            self.drawn_appearance = None
+            self.drawn_generation = None
+
+        def appearance(self, hovered: bool) -> tuple:
+            """
+            returns everything the drawn button depends on
+            """
+            return (hovered,)
 
-            # check mouse is over and clicked condition
-            if self.rect.collidepoint(pos):
-                if pygame.mouse.get_pressed()[0] == 1 and self.clicked is False:
-                    self.clicked = True
-                    action = True
+        def bounds(self) -> pygame.Rect:
+            """
+            returns the area of the screen the button draws over
+            """
+            return self.rect
 
-            if pygame.mouse.get_pressed()[0] == 0:
-                self.clicked = False
-            if self.rect.collidepoint(pos):
+        def blit(self, hovered: bool) -> None:
+            """
+            Blits the button onto the screen
+            """
+            if hovered:
                 screen.blit(self.image_pressed, (self.rect.x, self.rect.y))
             else:
                 screen.blit(self.image, (self.rect.x, self.rect.y))
 
-            return action
-
     class Toggle(Button):
         """Modifided button Instance to be able to be toggled on and offs"""
         name: str
@@ -199,15 +310,12 @@ def run_game() -> None:
             self.multiple_toggle_instance = None
             width = image.get_width()
             height = image.get_height()
-            self.image = pygame.transform.smoothscale(image, (int(width * scale_norm), int(height * scale_norm)))
-            self.image_hover = pygame.transform.smoothscale(image_hover,
-                                                            (int(width * scale_norm), int(height * scale_norm)))
-            self.image_pressed = pygame.transform.smoothscale(image_pressed,
-                                                              (int(width * scale_pressed),
-                                                               int(height * scale_pressed)))
-            self.image_pressed_hover = pygame.transform.smoothscale(image_pressed_hover,
-                                                                    (int(width * scale_pressed),
-                                                                     int(height * scale_pressed)))
+            self.image = asset_manager.scaled(image, (int(width * scale_norm), int(height * scale_norm)))
+            self.image_hover = asset_manager.scaled(image_hover, (int(width * scale_norm), int(height * scale_norm)))
+            self.image_pressed = asset_manager.scaled(image_pressed,
+                                                      (int(width * scale_pressed), int(height * scale_pressed)))
+            self.image_pressed_hover = asset_manager.scaled(image_pressed_hover,
+                                                            (int(width * scale_pressed), int(height * scale_pressed)))
             self.rect = self.image.get_rect(topleft=(x, y))
             self.clicked = False
             self.click_pending = False  # To track if a click is in process
@@ -220,42 +328,45 @@ def run_game() -> None:
             self.multiple_toggle_instance = multiple_toggle_instance
 
         def draw(self) -> bool:
-            pos = pygame.mouse.get_pos()
-            mouse_pressed = pygame.mouse.get_pressed()[0]
-
-            if self.rect.collidepoint(pos) and self.multiple_toggle_instance is not None:
-                if mouse_pressed and not self.click_pending:
-                    self.click_pending = True  # Mark that a click started
-                elif not mouse_pressed and self.click_pending:
-                    # Toggle logic
-                    self.clicked = not self.clicked
-                    if self.clicked:  # If toggled, update state in MultipleToggle
-                        self.multiple_toggle_instance.update_toggle_state(self)
-                    self.click_pending = False  # Reset click tracking
-                    # print(f'{self.name} is Toggled' if self.clicked else f'{self.name} is untoggled')
-
-            if self.rect.collidepoint(pos):
-                if mouse_pressed and not self.click_pending:
-                    self.click_pending = True  # Mark that a click started
-                elif not mouse_pressed and self.click_pending:
-                    # Only toggle if the mouse was clicked and then released while over the button
-                    self.clicked = not self.clicked
-                    self.click_pending = False  # Reset click tracking
-                    # print(f'{self.name} is Toggled' if self.clicked else f'{self.name} is untoggled')
-
-            if self.rect.collidepoint(pos):
+            self.paint(self.hovered)
+            return self.clicked
+
+        def on_leave(self) -> None:
+            super().on_leave()
+            self.click_pending = False  # Cancel the click if mouse moves out
+
+        def on_press(self) -> None:
+            self.click_pending = True  # Mark that a click started
+
+        def on_release(self) -> None:
+            # Only toggle if the mouse was clicked and then released while over the button
+            if self.click_pending:
+                self.clicked = not self.clicked
+                if self.clicked and self.multiple_toggle_instance is not None:
+                    # If toggled, update state in MultipleToggle
+                    self.multiple_toggle_instance.update_toggle_state(self)
+                self.click_pending = False  # Reset click tracking
+                # print(f'{self.name} is Toggled' if self.clicked else f'{self.name} is untoggled')
+
+        def reset_input(self) -> None:
+            # the toggled state lasts until the button is toggled again
+            return None
+
+        def appearance(self, hovered: bool) -> tuple:
+            return (hovered, self.clicked)
+
+        def bounds(self) -> pygame.Rect:
+            return self.rect.union(self.image_pressed.get_rect(topleft=self.rect.topleft))
+
+        def blit(self, hovered: bool) -> None:
+            if hovered:
                 if self.clicked is False:
                     screen.blit(self.image_hover, (self.rect.x, self.rect.y))
                 else:
                     screen.blit(self.image_pressed_hover, (self.rect.x, self.rect.y))
-
             else:
-                if mouse_pressed and self.click_pending:
-                    self.click_pending = False  # Cancel the click if mouse moves out
                 screen.blit(self.image_pressed if self.clicked else self.image, self.rect)
 
-            return self.clicked
-
         def set_allowed_click(self, allow: bool) -> None:
             """
             set when a click is allowed
@@ -296,20 +407,20 @@ def run_game() -> None:
             # Initial text color
             self.current_text_color = text_color
             # Render the text
-            self.text_surface = self.font.render(self.text, True, self.current_text_color)
+            self.text_surface = text_cache.render(self.font, self.text, self.current_text_color)
             # Calculate text position to center it on the button, adjusting for the left image
             self.text_x = self.rect.x + (self.rect.width - self.text_surface.get_width()) // 2
             self.text_y = self.rect.y + (self.rect.height - self.text_surface.get_height()) // 2
 
-        def draw(self) -> bool:
-            """
-            Draws the button, text, and star rating on top of it within the button bounds.
-            Adjusts the text color based on mouse hover.
-            """  # Assuming 'screen' is defined globally
+        def bounds(self) -> pygame.Rect:
+            return self.rect.union(self.text_surface.get_rect(topleft=(self.text_x, self.text_y)))
 
-            action = super().draw()  # Call the draw method of the base class to draw the button
+        def blit(self, hovered: bool) -> None:
+            """
+            Blits the button and its text onto the screen
+            """
+            super().blit(hovered)
             screen.blit(self.text_surface, (self.text_x, self.text_y))
-            return action
 
     class TextImageButton(Button):
         """Button with text, image, and star rating that changes text color on hover."""
@@ -342,62 +453,78 @@ def run_game() -> None:
             self.text_color = text_color
             self.text_hover_color = text_hover_color
             self.rating = rating  # Integer rating from 1 to 5
-            try:
-                self.left_image = pygame.transform.smoothscale(left_image, (80, 80))
-            except ValueError:
-                self.left_image = pygame.transform.scale(left_image, (80, 80))
-                # Load the image to display to the left of the text
-            self.star_full = pygame.image.load('assets/buttons/stars_full.png')  # Load your full star image
-            self.star_empty = pygame.image.load('assets/buttons/stars_empty.png')  # Load your empty star image
+            # Load the image to display to the left of the text
+            self.left_image = images.scale_thumbnail(left_image, (80, 80))
+            self.star_full = asset_manager.image('assets/buttons/stars_full.png')  # Load your full star image
+            self.star_empty = asset_manager.image('assets/buttons/stars_empty.png')  # Load your empty star image
 
             # Initial text color
             self.current_text_color = text_color
             # Render the text
-            self.text_surface = self.font.render(self.text, True, self.current_text_color)
+            self.text_surface = text_cache.render(self.font, self.text, self.current_text_color)
             # Calculate text position to center it on the button, adjusting for the left image
             self.text_x = self.rect.x + (self.rect.width - self.text_surface.get_width()) // 2
             self.text_y = self.rect.y + (self.rect.height - self.text_surface.get_height()
                                          - self.star_full.get_height()) // 2
 
-        def draw(self) -> bool:
+        def appearance(self, hovered: bool) -> tuple:
+            return (hovered, self.left_image)
+
+        def bounds(self) -> pygame.Rect:
+            left_image_rect = self.left_image.get_rect(topleft=self.left_image_position())
+            stars_rect = pygame.Rect(self.stars_position(),
+                                     (5 * self.star_full.get_width() + 4 * 5, self.star_full.get_height()))
+            return self.rect.unionall([left_image_rect, stars_rect,
+                                       self.text_surface.get_rect(topleft=(self.text_x, self.text_y))])
+
+        def left_image_position(self) -> tuple[int, int]:
             """
-            Draws the button, text, and star rating on top of it within the button bounds.
-            Adjusts the text color based on mouse hover.
+            returns where the image to the left of the text is drawn
             """
+            left_img_x = self.text_x - self.left_image.get_width() - 30  # Adjust position as necessary
+            left_img_y = self.rect.y + (self.rect.height - self.left_image.get_height()) // 2
+            return (left_img_x, left_img_y)
 
-            action = super().draw()  # Call the draw method of the base class to draw the button
+        def stars_position(self) -> tuple[int, int]:
+            """
+            returns where the first star of the rating is drawn
+            """
+            # Center stars relative to text
+            stars_x_base = self.text_x + (self.text_surface.get_width() - 5 * self.star_full.get_width() - 4 * 5) // 2
+            star_y = self.text_y + self.text_surface.get_height() + 5  # Position stars just below the text
+            return (stars_x_base, star_y)
+
+        def blit(self, hovered: bool) -> None:
+            """
+            Blits the button, text, and star rating on top of it within the button bounds.
+            Adjusts the text color based on mouse hover.
+            """
+            super().blit(hovered)
 
             # Draw the left image to the left of the text if needed
-            left_img_x = self.text_x - self.left_image.get_width() - 30  # Adjust position as necessary
-            left_img_y = self.rect.y + (self.rect.height - self.left_image.get_height()) // 2
-            screen.blit(self.left_image, (left_img_x, left_img_y))
-
-            # Check for mouse hover to determine text color
-            pos = pygame.mouse.get_pos()
-            if self.rect.collidepoint(pos):
-                if self.current_text_color != self.text_hover_color:
-                    self.current_text_color = self.text_hover_color
-                    self.text_surface = self.font.render(self.text, True, self.current_text_color)
-            else:
-                if self.current_text_color != self.text_color:
-                    self.current_text_color = self.text_color
-                    self.text_surface = self.font.render(self.text, True, self.current_text_color)
+            screen.blit(self.left_image, self.left_image_position())
+
+            # Check for mouse hover to determine text color; both colours stay rendered in the text cache
+            self.current_text_color = self.text_hover_color if hovered else self.text_color
+            self.text_surface = text_cache.render(self.font, self.text, self.current_text_color)
 
             # Draw the text surface onto the screen at its calculated position
             screen.blit(self.text_surface, (self.text_x, self.text_y))
 
             # Render the star rating below the text
-            stars_x_base = self.text_x + (self.text_surface.get_width() - 5 * self.star_full.get_width() - 4 * 5) / 2
-            # Center stars relative to text
+            stars_x_base, star_y = self.stars_position()
             for i in range(5):
                 star_x = stars_x_base + i * (self.star_full.get_width() + 5)  # Adjust spacing as needed
-                star_y = self.text_y + self.text_surface.get_height() + 5  # Position stars just below the text
                 if i < self.rating:
                     screen.blit(self.star_full, (star_x, star_y))
                 else:
                     screen.blit(self.star_empty, (star_x, star_y))
 
-            return action
+        def set_left_image(self, left_image: pygame.Surface) -> None:
+            """
+            Replaces the image displayed to the left of the text
+            """
+            self.left_image = images.scale_thumbnail(left_image, (80, 80))
 
     class ButtonDescription(Button):
         """Extended Button class with text description capability that wraps text to fit inside the button."""
@@ -425,20 +552,17 @@ def run_game() -> None:
             self.text_color = text_color
 
             # Load the font
-            self.font = pygame.font.Font(font_path, font_size)
+            self.font = text_cache.font(font_path, font_size)
 
             # Initialize an empty list to hold rendered text surfaces and their positions
             self.text_surfaces = []
-            self.render_wrapped_text(description, 700)  # Pass the available width for text
+            # Pass the available width for text, leaving a margin on each side
+            self.render_wrapped_text(description, self.rect.width - 50)
 
         def render_wrapped_text(self, text: str, available_width: int) -> None:
             """Renders wrapped text to fit inside the button."""
-            # Estimate average character width for the current font and size
-            average_char_width = self.font.size("A")[0]
-            max_chars_per_line = max(1, available_width // average_char_width)
-
-            # Use textwrap to wrap the text based on estimated max chars per line
-            wrapped_text = textwrap.wrap(text, width=max_chars_per_line)
+            # Wrap the text by the pixel widths of its words in the current font
+            wrapped_text = text_cache.wrap(self.font, text, available_width)
 
             # Clear any existing text surfaces
             self.text_surfaces.clear()
@@ -446,27 +570,38 @@ def run_game() -> None:
             # Render each line of wrapped text and store its surface
             total_text_height = 0
             for line in wrapped_text:
-                text_surface = self.font.render(line, True, self.text_color)
+                text_surface = text_cache.render(self.font, line, self.text_color)
                 self.text_surfaces.append(text_surface)
                 total_text_height += text_surface.get_height()
 
             # Adjust starting y position to vertically center the block of text
             self.text_start_y = self.rect.y + (self.rect.height - total_text_height) // 2
 
-        def draw(self) -> bool:
+        def text_positions(self) -> list[tuple[int, int]]:
             """
-            Draws the button and the wrapped text description on top of it, ensuring it fits within the button.
+            returns where each line of wrapped text is drawn
             """
-            action = super().draw()
-
-            # Draw each line of wrapped text
+            positions = []
             current_y = self.text_start_y
             for text_surface in self.text_surfaces:
                 text_x = self.rect.x + (self.rect.width - text_surface.get_width()) // 2
-                screen.blit(text_surface, (text_x, current_y))
+                positions.append((text_x, current_y))
                 current_y += text_surface.get_height()
+            return positions
 
-            return action
+        def bounds(self) -> pygame.Rect:
+            return self.rect.unionall([text_surface.get_rect(topleft=position) for text_surface, position
+                                       in zip(self.text_surfaces, self.text_positions())])
+
+        def blit(self, hovered: bool) -> None:
+            """
+            Blits the button and the wrapped text description on top of it, ensuring it fits within the button.
+            """
+            super().blit(hovered)
+
+            # Draw each line of wrapped text
+            for text_surface, position in zip(self.text_surfaces, self.text_positions()):
+                screen.blit(text_surface, position)
 
     class ButtonWithLink(Button):
         """Button Instance"""
@@ -484,29 +619,6 @@ def run_game() -> None:
             super().__init__(name, x, y, image, image_pressed, scale)
             self.link = link
 
-        def draw(self) -> bool:
-            """
-                Draws
-            """
-            action = False
-            # get mouse position
-            pos = pygame.mouse.get_pos()
-
-            # check mouse is over and clicked ocndition
-            if self.rect.collidepoint(pos):
-                if pygame.mouse.get_pressed()[0] == 1 and self.clicked is False:
-                    self.clicked = True
-                    action = True
-
-            if pygame.mouse.get_pressed()[0] == 0:
-                self.clicked = False
-            if self.rect.collidepoint(pos):
-                screen.blit(self.image_pressed, (self.rect.x, self.rect.y))
-            else:
-                screen.blit(self.image, (self.rect.x, self.rect.y))
-
-            return action
-
         def get_link(self) -> str:
             """
             returns the link associated with the button
@@ -555,7 +667,20 @@ def run_game() -> None:
     toggle_group3 = [toggle_button13, toggle_button14, toggle_button15]
     toggle_group5 = [toggle_button21, toggle_button22, toggle_button23, toggle_button24]
 
-    all_foods = graphs.build_graph('recipes.json')
+    build_start = time.perf_counter()
+    if engine == 'compact':
+        all_foods = compact_graph.build_compact_graph('recipes.json')
+    else:
+        # only 120 combinations of choices can be made, so their answers are all cached up front
+        all_foods = graphs.build_graph('recipes.json', precompute=True)
+    if stats is not None:
+        stats.record_graph_build(time.perf_counter() - build_start)
+
+    # recipes added through main.add_recipe while the app is running are applied to the graph as they are saved
+    watcher = None
+    if engine != 'compact':
+        watcher = recipe_watcher.RecipeWatcher(all_foods, ['recipe_book.jsonl', 'recipes_user_added.json'])
+        watcher.poll()
 
     outputs = []
     recommended_foods = []
@@ -565,9 +690,23 @@ def run_game() -> None:
         Interface Instance
         """
         status: bool
+        background_image: pygame.Surface | None
 
         def __init__(self) -> None:
             self.status = True
+            self.background_image = None
+
+        def background(self) -> pygame.Surface:
+            """
+            returns the background drawn over the whole screen when the interface is entered
+            """
+            return self.background_image
+
+        def widgets(self, inputs: Any = None) -> list:
+            """
+            returns the widgets of the interface that receive mouse input, given the inputs it is run with
+            """
+            return []
 
     class MainMenu(Interface):
         """
@@ -582,14 +721,16 @@ def run_game() -> None:
             self.status = True
             self.start = False
             self.option = False
+            self.background_image = compose_background(bg_img2)
+
+        def widgets(self, inputs: Any = None) -> list:
+            return [start_button]
 
         def run(self) -> None:
             """
             runs the interface
             """
-            screen.blit(bg_img2, (0, 0))
             # screen.fill((43, 191, 27))
-
             if start_button.draw():
                 self.start = True
 
@@ -606,13 +747,15 @@ def run_game() -> None:
             self.status = True
             self.toggle = False
             self.next = False
+            self.background_image = compose_background(subcat_img, (95, 167, 118))
+
+        def widgets(self, inputs: Any = None) -> list:
+            return inputs + [next_button2]
 
         def run(self, buttons: list) -> None:
             """
             runs the interface
             """
-            screen.fill((95, 167, 118))
-            screen.blit(subcat_img, (0, 0))
             group = MultipleToggle(buttons)
             group.draw()
 
@@ -628,6 +771,8 @@ def run_game() -> None:
                 if next_button2.draw():
                     outputs.append(group.get_clicked().name)
                     self.next = True
+            else:
+                next_button2.hide()
 
     class Difficulty(Interface):
         """
@@ -642,13 +787,15 @@ def run_game() -> None:
             self.status = True
             self.toggle = False
             self.next = False
+            self.background_image = compose_background(difficult_img, (43, 191, 27))
+
+        def widgets(self, inputs: Any = None) -> list:
+            return inputs + [next_button2]
 
         def run(self, buttons: list) -> None:
             """
             runs the interface
             """
-            screen.fill((43, 191, 27))
-            screen.blit(difficult_img, (0, 0))
             group = MultipleToggle(buttons)
             group.draw()
 
@@ -664,6 +811,8 @@ def run_game() -> None:
                 if next_button2.draw():
                     outputs.append(group.get_clicked().name)
                     self.next = True
+            else:
+                next_button2.hide()
 
     class Serves(Interface):
         """
@@ -678,13 +827,15 @@ def run_game() -> None:
             self.status = True
             self.toggle = False
             self.next = False
+            self.background_image = compose_background(serves_img, (43, 191, 27))
+
+        def widgets(self, inputs: Any = None) -> list:
+            return inputs + [next_button2]
 
         def run(self, buttons: list) -> None:
             """
             runs the interface
             """
-            screen.fill((43, 191, 27))
-            screen.blit(serves_img, (0, 0))
             group = MultipleToggle(buttons)
             group.draw()
 
@@ -700,6 +851,10 @@ def run_game() -> None:
                 if next_button2.draw():
                     outputs.append(group.get_clicked().name)
                     self.next = True
+                    # only the times are left to choose, so the possible results are already known
+                    result_prefetcher.prefetch(all_foods, outputs, graphs.TIMES)
+            else:
+                next_button2.hide()
 
     class Times(Interface):
         """
@@ -714,13 +869,15 @@ def run_game() -> None:
             self.status = True
             self.toggle = False
             self.next = False
+            self.background_image = compose_background(times_img, (43, 191, 27))
+
+        def widgets(self, inputs: Any = None) -> list:
+            return inputs + [next_button2]
 
         def run(self, buttons: list) -> None:
             """
             runs the interface
             """
-            screen.fill((43, 191, 27))
-            screen.blit(times_img, (0, 0))
             group = MultipleToggle(buttons)
             group.draw()
 
@@ -735,13 +892,16 @@ def run_game() -> None:
             if self.toggle:
                 if next_button2.draw():
                     outputs.append(group.get_clicked().name)
-                    recommended_foods.extend(all_foods.get_food_options(outputs))
+                    # two pages of five foods are shown, so only the top 10 are needed
+                    recommended_foods.extend(all_foods.get_food_options(outputs, k=10))
                     print('#' * 50)
                     print('Final Choices:')
                     for output in outputs:
                         print(output)
                     print('#' * 50)
                     self.next = True
+            else:
+                next_button2.hide()
 
     class FoodDisplay(Interface):
         """Foods Interface Instance"""
@@ -760,6 +920,7 @@ def run_game() -> None:
         chosen_button: TextImageButton | None
         chosen_desc: str | None
         chosen_url: str | None
+        pending_images: list
 
         def __init__(self) -> None:
             super().__init__()
@@ -777,6 +938,18 @@ def run_game() -> None:
             self.chosen_desc = None
             self.chosen_url = None
             self.chosen_button = None
+            self.button = []
+            self.pending_images = []
+
+        def background(self) -> pygame.Surface:
+            if len(self.button) == 0:
+                background = compose_background(food_bg, (43, 191, 27))
+                background.blit(nofood_img, (0, 0))
+                return background
+            return compose_background(food_bg, (43, 191, 27))
+
+        def widgets(self, inputs: Any = None) -> list:
+            return self.button + [back_button_food, next_button_food]
 
         def make_button(self, rec_food: list) -> None:
             """
@@ -803,21 +976,26 @@ def run_game() -> None:
                 text_color = (255, 255, 255)
                 text_hover_color = (0, 0, 0)
                 rating = rec_food[i].rating
-                try:
-                    r = requests.get(rec_food[i].image)
-                    img = io.BytesIO(r.content)
-                    left_image = pygame.image.load(img)
-                except pygame.error:
-                    left_image = pygame.image.load('assets/no_image.png')
-                try:
-                    left_image = pygame.transform.smoothscale(left_image, (80, 80))
-                except ValueError:
-                    left_image = pygame.transform.scale(left_image, (80, 80))
-                temp_list.append(TextImageButton(f'food{i}', x, y, food_img, food_img_hover, 1, text,
-                                                 font_helvetica_small, text_color, text_hover_color, rating, left_image)
-                                 )
+                # show the placeholder until the image has been fetched in the background
+                button = TextImageButton(f'food{i}', x, y, food_img, food_img_hover, 1, text,
+                                         font_helvetica_small, text_color, text_hover_color, rating, no_image_thumbnail)
+                temp_list.append(button)
+                self.pending_images.append((button, image_fetcher.fetch(rec_food[i].image)))
             self.button = temp_list
 
+        def swap_in_images(self) -> None:
+            """
+            Replaces the placeholder of every button whose image has finished fetching
+            """
+            still_pending = []
+            for button, future in self.pending_images:
+                if future.done():
+                    if future.result() is not None:
+                        button.set_left_image(future.result())
+                else:
+                    still_pending.append((button, future))
+            self.pending_images = still_pending
+
         def set_num(self, num: int) -> None:
             """
             set the number of the current page of the interface
@@ -834,8 +1012,8 @@ def run_game() -> None:
             """
             runs the interface
             """
+            self.swap_in_images()
             # screen.fill((43, 191, 27))
-            screen.blit(food_bg, (0, 0))
 
             # if any(food.draw for food in self.button):
             for i in range(len(self.button)):
@@ -846,7 +1024,6 @@ def run_game() -> None:
                     self.chosen_url = rec_food[i].url
                     return True
             if len(self.button) == 0:
-                screen.blit(nofood_img, (0, 0))
                 return False
 
             if self.num > 1:
@@ -894,35 +1071,53 @@ def run_game() -> None:
         next: bool
         back: bool
         link: str
+        food: TextImageButton | None
+        food_image: pygame.Surface | None
+        food_name_btn: TextButton | None
+        food_desc: ButtonDescription | None
+        recipe: ButtonWithLink | None
 
         def __init__(self) -> None:
             super().__init__()
             self.next = False
             self.back = False
+            self.food = None
+            self.food_image = None
+            self.food_name_btn = None
+            self.food_desc = None
+            self.recipe = None
 
-        def run(self, chosen_food: TextImageButton, chosen_food_desc: str, chosen_food_url: str) -> None:
+        def set_food(self, chosen_food: TextImageButton, chosen_food_desc: str, chosen_food_url: str) -> None:
+            """
+            sets the food shown by the interface, building its widgets and background only when it changes
+            """
+            if chosen_food is self.food and chosen_food.left_image is self.food_image:
+                return
+            self.food = chosen_food
+            self.food_image = chosen_food.left_image
+            food_image_scaled = images.scale_thumbnail(self.food_image, (250, 250))
+            self.background_image = compose_background(bg_img_food, (43, 191, 27))
+            self.background_image.blit(food_image_scaled, (225, 50))
+            self.food_name_btn = TextButton('foodname', 135, 300, food_name_img, food_name_img, 1,
+                                            chosen_food.text, font_montserrat_medium, (0, 0, 0))
+            self.food_desc = ButtonDescription('Desc', 60, 350, food_desc_img, food_desc_img,
+                                               1, chosen_food_desc, HELVETICA, 14, (182, 182, 182))
+            self.recipe = ButtonWithLink('recipe link', 230, 620, recipe_img, recipe_img_hover, 1,
+                                         chosen_food_url)
+
+        def widgets(self, inputs: Any = None) -> list:
+            return [self.food_name_btn, self.food_desc, self.recipe, back_button]
+
+        def run(self) -> None:
             """
             runs the interface
             """
             # screen.fill((43, 191, 27))
-            screen.blit(bg_img_food, (0, 0))
-            food_image = chosen_food.left_image
-            try:
-                food_image_scaled = pygame.transform.smoothscale(food_image, (250, 250))
-            except ValueError:
-                food_image_scaled = pygame.transform.scale(food_image, (250, 250))
-            screen.blit(food_image_scaled, (225, 50))
-            food_name_btn = TextButton('foodname', 135, 300, food_name_img, food_name_img, 1,
-                                       chosen_food.text, font_montserrat_medium, (0, 0, 0))
-            food_desc = ButtonDescription('Desc', 60, 350, food_desc_img, food_desc_img,
-                                          1, chosen_food_desc, HELVETICA, 14, (182, 182, 182))
-            recipe = ButtonWithLink('recipe link', 230, 620, recipe_img, recipe_img_hover, 1,
-                                    chosen_food_url)
-            food_name_btn.draw()
-            food_desc.draw()
-            if recipe.draw():
+            self.food_name_btn.draw()
+            self.food_desc.draw()
+            if self.recipe.draw():
                 self.next = True
-                self.link = recipe.link
+                self.link = self.recipe.link
             if back_button.draw():
                 self.back = True
             return None
@@ -936,12 +1131,15 @@ def run_game() -> None:
         def __init__(self) -> None:
             super().__init__()
             self.next = False
+            self.background_image = compose_background(last_bg)
+
+        def widgets(self, inputs: Any = None) -> list:
+            return [close_button]
 
         def run(self) -> None:
             """
             runs the interface
             """
-            screen.blit(last_bg, (0, 0))
             if close_button.draw():
                 self.next = True
             return None
@@ -952,9 +1150,11 @@ def run_game() -> None:
         """
         active_screen: (Interface | MainMenu | Subcatergory | Difficulty
                         | Serves | Times | FoodDisplay | FoodIndividual | Closing | None)
+        drawn_screen: Interface | None
 
         def __init__(self) -> None:
             self.active_screen = None
+            self.drawn_screen = None
 
         def set_active_screen(self, current_screen: Interface) -> None:
             """
@@ -973,10 +1173,17 @@ def run_game() -> None:
             updates the current active screen
             """
             if self.active_screen:
+                if isinstance(self.active_screen, FoodIndividual):
+                    self.active_screen.set_food(inputs, input2, input3)
+                if self.active_screen is not self.drawn_screen:
+                    # the whole background is only drawn when a screen is entered, and the widgets redraw
+                    # themselves over it when they change
+                    regions.set_background(self.active_screen.background())
+                    dispatcher.set_widgets(self.active_screen.widgets(inputs))
+                    self.drawn_screen = self.active_screen
+
                 if type(self.active_screen) in {Subcatergory, Difficulty, Serves, Times, FoodDisplay}:
                     self.active_screen.run(inputs)
-                elif isinstance(self.active_screen, FoodIndividual):
-                    self.active_screen.run(inputs, input2, input3)
                 else:
                     self.active_screen.run()
 
@@ -999,13 +1206,24 @@ def run_game() -> None:
     screen_manager = ScreenManager()
     screen_manager.set_active_screen(main_menu)
 
+    scheduler = rendering.RenderScheduler(fps, idle_fps)
+    replayed_frames = None if replay is None else iter(replay)
     run = True
     while run:
-        for event in pygame.event.get():
+        frame_start = time.perf_counter()
+        if replayed_frames is None:
+            events = pygame.event.get()
+        else:
+            pygame.event.pump()
+            events = next(replayed_frames, [pygame.event.Event(pygame.QUIT)])
+        for event in events:
             if event.type == pygame.QUIT:
                 run = False  # Set run to False, to exit the main loop
+        # the events happened while the previous frame was shown, so they go to the widgets that were on it
+        dispatcher.dispatch(events)
 
         active_screen = screen_manager.get_active_screen()
+        draw_start = time.perf_counter()
 
         # Update screen based on the active screen type
         if isinstance(active_screen, Subcatergory):
@@ -1029,6 +1247,7 @@ def run_game() -> None:
                                       food_menu2.get_chosen_url())
         else:
             screen_manager.update(None)
+        draw_seconds = time.perf_counter() - draw_start
 
         # Main menu logic
         if main_menu.status and main_menu.start:
@@ -1104,9 +1323,16 @@ def run_game() -> None:
             screen_manager.set_active_screen(food_menu2)
 
         if closing_menu.next:
-            pygame.quit()
             run = False
-        pygame.display.update()
+        regions.flush()
+        if watcher is not None:
+            watcher.poll_if_due()
+        if stats is not None:
+            stats.record_frame(type(active_screen).__name__, time.perf_counter() - frame_start, draw_seconds)
+        scheduler.tick(len(events) > 0)
+    if stats is not None:
+        stats.record_image_fetches(image_fetcher.fetch_seconds)
+    image_fetcher.close()
     pygame.quit()
 
 
@@ -1117,7 +1343,9 @@ if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['textwrap', 'webbrowser', 'io', 'requests', 'pygame', 'graphs'],
+        'extra-imports': ['time', 'webbrowser', 'pygame', 'graphs', 'compact_graph', 'images',
+                          'rendering', 'input_events',
+                          'assets', 'text_rendering', 'recipe_watcher'],
         'allowed-io': ['untoggle', 'draw', 'run', 'run_game'],
         'max-line-length': 120
     })
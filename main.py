@@ -8,8 +8,11 @@ Copyright and Usage Information
 This file is Copyright (c) Aref Malekanian, Albert Jun, Ahnaf Keenan Ardhito, Alfizza Kenaz
 """
 
-import json
 import interface
+import recipe_journal
+
+RECIPE_BOOK = 'recipe_book.jsonl'
+LEGACY_RECIPE_BOOK = 'recipe_book.json'
 
 
 def valid_int_input(expected_int: list, input_quest: str) -> int:
@@ -42,44 +45,48 @@ def run_app() -> None:
     print('4. EXIT')
     temp_list = [1, 2, 3, 4]
     user_input = valid_int_input(temp_list, 'Enter a number (1 - 4): ')
+    # recipes saved before the recipe book became a journal are moved into it the first time the app runs
+    recipe_journal.RecipeJournal(RECIPE_BOOK, LEGACY_RECIPE_BOOK)
     if user_input == 1:
         interface.run_game()
         return None
     elif user_input == 2:
-        add_recipe('recipe_book.json')
+        add_recipe(RECIPE_BOOK)
         return None
     elif user_input == 3:
-        view_recipe('recipe_book.json')
+        view_recipe(RECIPE_BOOK)
         return None
     else:
         return None
 
 
-def add_recipe_ui(filename: str) -> dict:
+def add_recipe_ui() -> dict:
     """
     User interface instance of add recipe.
+
+    The recipe is returned without an id; it is given one when it is added to the recipe book.
     """
-    with open(filename, 'r') as f:
-        data = json.load(f)
-    temp_dict = {'id': f'USERADDED{int(data[-1]['id'][-1]) + 1}',
-                 'url': input('Enter a valid url: '),
+    temp_dict = {'url': input('Enter a valid url: '),
                  'name': input('Enter a valid name of the food: '),
                  'description': input('Enter a valid description of the food: '), 'author': '-',
                  'rattings': valid_int_input([1, 2, 3, 4, 5], 'Enter a valid rating of recipe (1-5): ')}
     prep_time = input('Enter the preparation time of the food (i.e. 10 mins, 1 hr and 10 mins): ')
     cook_time = input('Enter the cooking time of the food (i.e. 10 mins, 1 hr and 10 mins): ')
     temp_dict['times'] = {'Preparation': prep_time, 'Cooking': cook_time}
-    serves = ['1 ~ 2 Serves', '2 ~ 4 Serves', '5+ Serves']
+    serves = ['1 ~ 2 Serves', '3 ~ 4 Serves', '5+ Serves']
+    # the number of servings stored for each choice, which graphs.serves_option puts back in the same group
+    serves_counts = [2, 4, 5]
 
     for i in range(len(serves)):
         print(f'{i + 1}. {serves[i]}')
-    temp_dict['serves'] = valid_int_input([1, 2, 3], 'Choose one that applies(1 - 3): ')
+    serves_input = valid_int_input([1, 2, 3], 'Choose one that applies(1 - 3): ')
+    temp_dict['serves'] = serves_counts[serves_input - 1]
     difficulty = ['Easy', 'Challenging']
 
     for i in range(len(difficulty)):
         print(f'{i + 1}. {difficulty[i]}')
     difficulty_input = valid_int_input([1, 2], 'Choose difficulty(1/2): ')
-    temp_dict['difficult'] = difficulty_input
+    temp_dict['difficult'] = difficulty[difficulty_input - 1]
     temp_dict['vote_count'] = 0
     categories = ['Recipes with Animal Products',
                   'Vegan Recipes',
@@ -98,39 +105,26 @@ def add_recipe_ui(filename: str) -> dict:
 
 def add_recipe(filename: str) -> None:
     """
-    This function adds a custom recipe to the recipes file
+    This function adds a custom recipe to the recipe book journal at filename
 
     It asks the user to input the name, description, url of the website that has the recipe,
-    rating, prep / cook time, number of serves, difficulty and category of the recipe and writes it
-    into the recipe book txt file.
+    rating, prep / cook time, number of serves, difficulty and category of the recipe and appends it
+    to the recipe book, which gives it the next id.
     """
-    try:
-        # Try to open the existing file and load its contents
-        with open(filename, 'r') as f:
-            existing_data = json.load(f)
-    except FileNotFoundError:
-        # If the file doesn't exist, start with an empty list
-        existing_data = []
-    data = add_recipe_ui(filename)
-    # Add the new data to the existing data
-    existing_data.append(data)
-
-    # Save the updated data back to the JSON file
-    with open(filename, 'w') as f:
-        json.dump(existing_data, f, indent=4)
+    data = add_recipe_ui()
+    recipe_journal.RecipeJournal(filename).add(data)
 
     print()
     run_app()
 
 
 def view_recipe(filename: str) -> None:
-    """View the current user added recipes"""
-    with open(filename, 'r') as f:
-        data = json.load(f)
+    """View the current user added recipes in the recipe book journal at filename"""
+    data = recipe_journal.RecipeJournal(filename).recipes()
 
     num = 1
     for line in data:
-        print(f'{num}) {line['name']}')
+        print(f'{num}) {line["name"]}')
         num += 1
 
     question = f'Choose the recipe number you would like to view (1-{num-1}):'
@@ -152,7 +146,7 @@ def view_recipe(filename: str) -> None:
         print('=' * 50)
         print(lines['name'])
         print('=' * 50)
-        print(f'{lines['url']}')
+        print(f'{lines["url"]}')
         print(f"'{lines['description']}'")
         print(f'Ratings: {lines["rattings"]}')
         print(f'Prep Time: {lines["times"]["Preparation"]}')
@@ -0,0 +1,186 @@
+"""
+This Python module parses the nutrients of recipes, and keeps them in typed columns that can be filtered by range.
+
+Recipes list their nutrients per serving as strings, such as {'kcal': '254', 'fat': '7g', 'salt': '2.5g'}.
+parse_nutrient turns each of them into a number of kcal for energy and a number of grams for everything else.
+A NutrientColumns keeps one array of those numbers per nutrient, and sorts each array the first time it is
+filtered, so the foods in a range are found by binary search instead of by checking every food.
+"""
+
+from __future__ import annotations
+from array import array
+from typing import Any, Iterable, Optional, Sequence
+import functools
+import math
+import re
+
+import numpy as np
+
+# The nutrients recipes list, in the order of the values of nutrient_values
+NUTRIENTS = ('kcal', 'fat', 'saturates', 'carbs', 'sugars', 'fibre', 'protein', 'salt')
+
+# The number of each unit in a kcal or a gram
+_UNITS = {'kcal': 1, 'kj': 4.184, 'g': 1, 'mg': 1000, 'mcg': 1000000, 'µg': 1000000, 'ug': 1000000}
+_AMOUNT = re.compile(r'<?\s*(\d+(?:\.\d+)?)\s*([a-zµ]*)')
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_nutrient(value: Any) -> float:
+    """Return the amount in the given nutrient value, in kcal if it is an amount of energy and in grams
+    otherwise, or NaN if it is not an amount.
+
+    A value without a unit is already in kcal or grams.
+
+    >>> [parse_nutrient(value) for value in ['254', '2.5g', '350mg', '1046kJ', 'trace', 12]]
+    [254.0, 2.5, 0.35, 250.0, 0.0, 12.0]
+    >>> math.isnan(parse_nutrient('n/a'))
+    True
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = value.strip().lower()
+    if text == 'trace':
+        return 0.0
+    match = _AMOUNT.fullmatch(text)
+    if match is None or match.group(2) not in _UNITS and match.group(2) != '':
+        return math.nan
+    return round(float(match.group(1)) / _UNITS.get(match.group(2), 1), 6)
+
+
+def nutrient_values(nutrients: Optional[dict[str, Any]]) -> tuple[float, ...]:
+    """Return the amount of each nutrient in NUTRIENTS in the given nutrients of a recipe, or NaN for the ones it
+    does not list.
+
+    >>> nutrient_values({'kcal': '254', 'protein': '20g'})[:2]
+    (254.0, nan)
+    """
+    if not nutrients:
+        return (math.nan,) * len(NUTRIENTS)
+    return tuple(parse_nutrient(nutrients[nutrient]) if nutrients.get(nutrient) is not None else math.nan
+                 for nutrient in NUTRIENTS)
+
+
+class NutrientColumns:
+    """The nutrients of a sequence of items, such as the vertices of a graph by their dense ids, kept as one typed
+    array of amounts per nutrient.
+
+    Instance Attributes:
+        - columns: maps each nutrient in NUTRIENTS to an array of its amount for every item, NaN where unknown
+
+    Representation Invariants:
+        - all(len(column) == len(self) for column in self.columns.values())
+    """
+    # Private Instance Attributes:
+    #     - _sorted: maps each nutrient whose sorted index has been built to (the known amounts of it in increasing
+    #       order, the numbers of the items with those amounts). append and forget keep each index up to date by
+    #       inserting or deleting a single entry, so it is only sorted once.
+    columns: dict[str, array]
+    _sorted: dict[str, tuple[np.ndarray, np.ndarray]]
+
+    def __init__(self) -> None:
+        """Initialize columns with no items."""
+        self.columns = {nutrient: array('d') for nutrient in NUTRIENTS}
+        self._sorted = {}
+
+    def __len__(self) -> int:
+        """Return the number of items in these columns."""
+        return len(self.columns[NUTRIENTS[0]])
+
+    def append(self, values: Optional[Sequence[float]] = None) -> None:
+        """Add an item with the given amounts of the nutrients in NUTRIENTS, or no known amounts if values is None.
+        """
+        if values is None:
+            values = (math.nan,) * len(NUTRIENTS)
+        for nutrient, value in zip(NUTRIENTS, values):
+            self.columns[nutrient].append(value)
+            if not math.isnan(value) and nutrient in self._sorted:
+                amounts, items = self._sorted[nutrient]
+                # after every equal amount, since the new item has the largest number
+                position = int(np.searchsorted(amounts, value, side='right'))
+                self._sorted[nutrient] = (np.insert(amounts, position, value),
+                                          np.insert(items, position, len(self.columns[nutrient]) - 1))
+
+    def forget(self, index: int) -> None:
+        """Make every amount of the item with the given number unknown, so it is never in a range."""
+        for nutrient in NUTRIENTS:
+            value = self.columns[nutrient][index]
+            if not math.isnan(value):
+                self.columns[nutrient][index] = math.nan
+                if nutrient in self._sorted:
+                    amounts, items = self._sorted[nutrient]
+                    start = int(np.searchsorted(amounts, value, side='left'))
+                    end = int(np.searchsorted(amounts, value, side='right'))
+                    position = start + int(np.flatnonzero(items[start:end] == index)[0])
+                    self._sorted[nutrient] = (np.delete(amounts, position), np.delete(items, position))
+
+    def row(self, index: int) -> dict[str, float]:
+        """Return the known amounts of the nutrients of the item with the given number."""
+        return {nutrient: self.columns[nutrient][index] for nutrient in NUTRIENTS
+                if not math.isnan(self.columns[nutrient][index])}
+
+    def matching(self, ranges: dict[str, tuple[Optional[float], Optional[float]]]) -> np.ndarray:
+        """Return the sorted numbers of the items with a known amount of every nutrient in ranges that is within its
+        (low, high) range, inclusive. A bound of None leaves that side of the range open.
+
+        The number of items in each range is found by binary search in the sorted index of its nutrient; the
+        items of the narrowest range are then read from its index, and only they are checked against the others.
+
+        Preconditions:
+            - ranges != {}
+            - all(nutrient in NUTRIENTS for nutrient in ranges)
+        """
+        spans = []
+        for nutrient, (low, high) in ranges.items():
+            amounts, items = self._sorted_index(nutrient)
+            start = 0 if low is None else int(np.searchsorted(amounts, low, side='left'))
+            end = len(amounts) if high is None else int(np.searchsorted(amounts, high, side='right'))
+            spans.append((max(end - start, 0), nutrient, items[start:end]))
+        spans.sort(key=lambda span: span[0])
+
+        found = spans[0][2]
+        for _, nutrient, _ in spans[1:]:
+            if len(found) == 0:
+                break
+            low, high = ranges[nutrient]
+            # only the amounts of the items found so far are read, through a view that is dropped straight away
+            amounts = np.frombuffer(self.columns[nutrient], dtype=np.float64)[found]
+            # NaN is outside every range, since it compares false
+            keep = np.ones(len(found), dtype=bool)
+            if low is not None:
+                keep &= amounts >= low
+            if high is not None:
+                keep &= amounts <= high
+            found = found[keep]
+        return np.sort(found)
+
+    def _sorted_index(self, nutrient: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the known amounts of the given nutrient in increasing order, and the numbers of the items with
+        those amounts, sorting them if they have changed since they were last sorted.
+        """
+        if nutrient not in self._sorted:
+            # copied, since an array that numpy has a view of cannot grow
+            amounts = np.array(self.columns[nutrient])
+            items = np.flatnonzero(~np.isnan(amounts))
+            items = items[np.argsort(amounts[items], kind='stable')]
+            self._sorted[nutrient] = (amounts[items], items)
+        return self._sorted[nutrient]
+
+
+def rows_from_bytes(data: bytes) -> Iterable[tuple[float, ...]]:
+    """Return the rows of amounts in the given bytes of an array of doubles that holds the nutrient_values of each
+    item, item after item.
+    """
+    values = array('d')
+    values.frombytes(data)
+    return zip(*[iter(values)] * len(NUTRIENTS))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['array', 'functools', 'math', 're', 'numpy'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,284 @@
+"""
+This Python module stores the recipes that users add in an append-only journal.
+
+The journal is a JSON Lines file: each line is one JSON object recording a single change, one of
+    - {"op": "put", "recipe": {...}}: the recipe with the id in recipe['id'] was added or replaced
+    - {"op": "remove", "id": ...}: the recipe with the given id was removed
+    - {"op": "ids", "next": n}: the next id handed out is at least 'USERADDED' followed by n
+
+Adding a recipe appends one line and fsyncs it, instead of rewriting every recipe. Each line is written with a
+single write to a file opened for appending, and writers on the same machine hold an exclusive lock on a lock
+file next to the journal while they choose an id and append, so concurrent writers never lose each other's
+recipes or hand out the same id. A line left incomplete by a crash is ignored, and the next append starts on a
+new line.
+
+Replaced and removed recipes leave dead lines behind. Once there are at least compact_threshold of them and
+they outnumber the live recipes, the journal is compacted: the live recipes are written to a new file, which
+atomically replaces the journal.
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+import json
+import os
+import re
+
+try:
+    import fcntl
+except ImportError:  # fcntl is only available on Unix; elsewhere appends are not serialized between processes
+    fcntl = None
+
+ID_PREFIX = 'USERADDED'
+_ID_PATTERN = re.compile(re.escape(ID_PREFIX) + r'(\d+)$')
+
+
+class RecipeJournal:
+    """The recipes stored in a journal file.
+
+    Other processes may append to the same file; every method first reads the lines appended since the journal
+    was last read, so only new lines are parsed.
+
+    Instance Attributes:
+        - path: the path of the journal file
+        - compact_threshold: the smallest number of dead lines that leads to the journal being compacted
+
+    Representation Invariants:
+        - self.compact_threshold >= 1
+    """
+    # Private Instance Attributes:
+    #     - _recipes: maps the id of each recipe in the journal to the recipe, in the order they were first added
+    #     - _lines: the number of complete lines read from the journal file
+    #     - _next_id: the number of the next id to hand out
+    #     - _offset: the position in the journal file just after the last complete line read
+    #     - _identity: the (device, inode) of the journal file that was read, or None if there was no file
+    path: str
+    compact_threshold: int
+    _recipes: dict[str, dict]
+    _lines: int
+    _next_id: int
+    _offset: int
+    _identity: Optional[tuple[int, int]]
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None, compact_threshold: int = 64) -> None:
+        """Initialize the journal at the given path.
+
+        If there is no journal file yet but there is a file at legacy_path, a JSON array of recipes like the one
+        main.add_recipe used to rewrite, its recipes are copied into a new journal. The legacy file is left as it
+        is and is not read again.
+
+        Preconditions:
+            - compact_threshold >= 1
+        """
+        self.path = path
+        self.compact_threshold = compact_threshold
+        self._reset()
+        if legacy_path is not None and not os.path.exists(path) and os.path.exists(legacy_path):
+            with self._locked():
+                if not os.path.exists(path):
+                    self._migrate(legacy_path)
+        self._refresh()
+
+    def recipes(self) -> list[dict]:
+        """Return the recipes in this journal, in the order they were first added."""
+        self._refresh()
+        return list(self._recipes.values())
+
+    def get(self, recipe_id: str) -> Optional[dict]:
+        """Return the recipe with the given id, or None if there is none."""
+        self._refresh()
+        return self._recipes.get(recipe_id)
+
+    def add(self, recipe: dict) -> str:
+        """Add the given recipe to this journal under a new id and return the id.
+
+        Ids are 'USERADDED' followed by a number one more than the largest number handed out so far, including
+        to recipes that have since been removed. The new id is the first field of the stored recipe; any id the
+        given recipe had is replaced.
+        """
+        with self._locked():
+            self._refresh()
+            recipe_id = f'{ID_PREFIX}{self._next_id}'
+            stored = {'id': recipe_id}
+            stored.update((key, value) for key, value in recipe.items() if key != 'id')
+            self._append({'op': 'put', 'recipe': stored})
+        return recipe_id
+
+    def put(self, recipe: dict) -> None:
+        """Add the given recipe to this journal under its own id, replacing any recipe with that id.
+
+        Preconditions:
+            - 'id' in recipe
+        """
+        with self._locked():
+            self._refresh()
+            self._append({'op': 'put', 'recipe': recipe})
+
+    def remove(self, recipe_id: str) -> None:
+        """Remove the recipe with the given id from this journal.
+
+        Raise a ValueError if there is no recipe with the given id.
+        """
+        with self._locked():
+            self._refresh()
+            if recipe_id not in self._recipes:
+                raise ValueError
+            self._append({'op': 'remove', 'id': recipe_id})
+
+    def compact(self) -> None:
+        """Rewrite the journal file so that it only holds the live recipes."""
+        with self._locked():
+            self._refresh()
+            self._compact()
+
+    def _reset(self) -> None:
+        """Forget everything read from the journal file."""
+        self._recipes = {}
+        self._lines = 0
+        self._next_id = 1
+        self._offset = 0
+        self._identity = None
+
+    def _refresh(self) -> None:
+        """Read the complete lines appended to the journal file since it was last read.
+
+        If the file was replaced, for example by another process compacting it, it is read from the start.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if (stat.st_dev, stat.st_ino) != self._identity or stat.st_size < self._offset:
+            self._reset()
+            self._identity = (stat.st_dev, stat.st_ino)
+        if stat.st_size == self._offset:
+            return
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            self._lines += 1
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                # the remains of a line that a crash left incomplete
+                continue
+        self._offset += end
+
+    def _apply(self, entry: dict[str, Any]) -> None:
+        """Apply the change recorded by the given journal entry."""
+        if entry['op'] == 'put':
+            recipe = entry['recipe']
+            self._recipes[recipe['id']] = recipe
+            match = _ID_PATTERN.match(str(recipe['id']))
+            if match is not None:
+                self._next_id = max(self._next_id, int(match.group(1)) + 1)
+        elif entry['op'] == 'remove':
+            self._recipes.pop(entry['id'], None)
+        elif entry['op'] == 'ids':
+            self._next_id = max(self._next_id, entry['next'])
+
+    def _append(self, entry: dict[str, Any]) -> None:
+        """Append the given entry to the journal file, wait for it to reach the disk, and apply it.
+
+        The journal file must have just been refreshed, and the lock must be held.
+        """
+        line = json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n'
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size > self._offset:
+                # end the line that a crash left incomplete, so it does not swallow this one
+                line = b'\n' + line
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._refresh()
+
+        dead = self._lines - len(self._recipes)
+        if dead >= self.compact_threshold and dead > len(self._recipes):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Replace the journal file with one holding only the live recipes.
+
+        The journal file must have just been refreshed, and the lock must be held.
+        """
+        entries = [{'op': 'ids', 'next': self._next_id}]
+        entries.extend({'op': 'put', 'recipe': recipe} for recipe in self._recipes.values())
+        _write_lines(self.path, entries)
+        self._refresh()
+
+    def _migrate(self, legacy_path: str) -> None:
+        """Write a new journal file holding the recipes in the JSON array at legacy_path.
+
+        Recipes without an id are given new ones. The lock must be held.
+        """
+        with open(legacy_path, encoding='utf-8') as f:
+            recipes = json.load(f)
+
+        for recipe in recipes:
+            if 'id' in recipe:
+                self._apply({'op': 'put', 'recipe': recipe})
+        entries = []
+        for recipe in recipes:
+            if 'id' not in recipe:
+                recipe = {'id': f'{ID_PREFIX}{self._next_id}', **recipe}
+                self._next_id += 1
+            entries.append({'op': 'put', 'recipe': recipe})
+        _write_lines(self.path, entries)
+        self._reset()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold an exclusive lock on the lock file of this journal for the duration of a with statement.
+
+        The lock is on a separate file because compaction replaces the journal file itself.
+        """
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _write_lines(path: str, entries: list[dict[str, Any]]) -> None:
+    """Atomically replace the file at the given path with one holding the given entries, one per line."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    # make the rename itself durable, where directories can be opened
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['contextlib', 'fcntl', 'json', 'os', 're'],
+        'allowed-io': ['RecipeJournal._refresh', 'RecipeJournal._migrate', 'RecipeJournal._locked', '_write_lines'],
+        'max-line-length': 120
+    })
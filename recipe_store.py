@@ -0,0 +1,195 @@
+"""
+This Python module reads and writes recipe stores: a binary file format for large recipe corpora that is opened
+with mmap, so recipes are decoded only when they are accessed and every process that opens the same store on a
+host shares the same pages of memory.
+
+A recipe store file is laid out as:
+    - MAGIC (8 bytes)
+    - the store version and the number of recipes, as little-endian unsigned 32-bit integers
+    - the length of the section table, as a little-endian unsigned 32-bit integer
+    - the section table: UTF-8 encoded JSON mapping each section name to its offset and length
+    - the sections, each starting on an 8-byte boundary
+
+There is one fixed-width section per numeric column in NUMERIC_COLUMNS, holding one value per recipe. Each text
+column in TEXT_COLUMNS has two sections: a string heap with the UTF-8 encoded values of every recipe one after
+another, and a section of len(store) + 1 offsets into that heap, so the value of recipe i is
+heap[offsets[i]:offsets[i + 1]]. A missing value (None), such as the image of a user-added recipe, is stored as
+_MISSING, which is not valid UTF-8 and so cannot be confused with any string.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable, Optional
+from array import array
+import json
+import mmap
+import struct
+
+STORE_VERSION = 3
+MAGIC = b'FMSTORE\x00'
+_COUNTS = struct.Struct('<II')
+_TABLE_LENGTH = struct.Struct('<I')
+
+# The numeric columns of a store, with the array typecode of their values. The nutrient columns hold the amounts of
+# nutrition.NUTRIENTS per serving, in kcal or grams, or NaN if they are unknown.
+NUMERIC_COLUMNS = {'rating': 'b', 'serves': 'h', 'minutes': 'i', 'option_mask': 'H', 'kcal': 'd', 'fat': 'd',
+                   'saturates': 'd', 'carbs': 'd', 'sugars': 'd', 'fibre': 'd', 'protein': 'd', 'salt': 'd'}
+# The text columns of a store
+TEXT_COLUMNS = ('id', 'name', 'url', 'image', 'description')
+# The heap bytes of a missing text value
+_MISSING = b'\xff'
+
+
+def is_recipe_store(path: str) -> bool:
+    """Return whether the file at the given path is a recipe store."""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_store(path: str, recipes: Iterable[dict[str, Any]]) -> int:
+    """Write a recipe store of the given recipes to the given path, and return the number of recipes written.
+
+    Each recipe maps every column in NUMERIC_COLUMNS and TEXT_COLUMNS to its value, which may be None for a text
+    column.
+    """
+    numbers = {column: array(typecode) for column, typecode in NUMERIC_COLUMNS.items()}
+    heaps = {column: bytearray() for column in TEXT_COLUMNS}
+    offsets = {column: array('Q', [0]) for column in TEXT_COLUMNS}
+
+    count = 0
+    for recipe in recipes:
+        for column in NUMERIC_COLUMNS:
+            numbers[column].append(recipe[column])
+        for column in TEXT_COLUMNS:
+            heaps[column] += _MISSING if recipe[column] is None else recipe[column].encode('utf-8')
+            offsets[column].append(len(heaps[column]))
+        count += 1
+
+    sections = {column: numbers[column].tobytes() for column in NUMERIC_COLUMNS}
+    for column in TEXT_COLUMNS:
+        sections[f'{column}.offsets'] = offsets[column].tobytes()
+        sections[f'{column}.heap'] = bytes(heaps[column])
+
+    table = {}
+    position = 0
+    for name, section in sections.items():
+        table[name] = [position, len(section)]
+        position += _padded(len(section))
+    encoded_table = json.dumps(table).encode('utf-8')
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_COUNTS.pack(STORE_VERSION, count))
+        f.write(_TABLE_LENGTH.pack(len(encoded_table)))
+        f.write(encoded_table)
+        f.write(b'\x00' * (_padded(f.tell()) - f.tell()))
+        for section in sections.values():
+            f.write(section)
+            f.write(b'\x00' * (_padded(len(section)) - len(section)))
+
+    return count
+
+
+def _padded(length: int) -> int:
+    """Return the given length rounded up to a multiple of 8."""
+    return (length + 7) // 8 * 8
+
+
+class RecipeStore:
+    """A recipe store opened read-only with mmap.
+
+    Values are decoded from the mapped file every time they are accessed, and are never copied otherwise.
+    A RecipeStore can be used as the source of the text fields of a graphs._FoodVertex, with the index of the
+    recipe as the locator.
+
+    Instance Attributes:
+        - path: the path of the store file
+    """
+    # Private Instance Attributes:
+    #     - _mmap: the mapped store file
+    #     - _count: the number of recipes in the store
+    #     - _numbers: maps each numeric column to a view of its values
+    #     - _offsets: maps each text column to a view of its offsets
+    #     - _heaps: maps each text column to a view of its string heap
+    path: str
+    _mmap: mmap.mmap
+    _count: int
+    _numbers: dict[str, memoryview]
+    _offsets: dict[str, memoryview]
+    _heaps: dict[str, memoryview]
+
+    def __init__(self, path: str) -> None:
+        """Open the recipe store at the given path.
+
+        Raise a ValueError if the file is not a recipe store written by this version of the module.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f'{path} is not a recipe store')
+        position = len(MAGIC)
+        version, self._count = _COUNTS.unpack_from(self._mmap, position)
+        if version != STORE_VERSION:
+            raise ValueError(f'{path} is a version {version} recipe store, expected version {STORE_VERSION}')
+        position += _COUNTS.size
+        (table_length,) = _TABLE_LENGTH.unpack_from(self._mmap, position)
+        position += _TABLE_LENGTH.size
+        table = json.loads(bytes(view[position:position + table_length]))
+        sections_start = _padded(position + table_length)
+
+        def section(name: str) -> memoryview:
+            offset, length = table[name]
+            return view[sections_start + offset:sections_start + offset + length]
+
+        self._numbers = {column: section(column).cast(typecode) for column, typecode in NUMERIC_COLUMNS.items()}
+        self._offsets = {column: section(f'{column}.offsets').cast('Q') for column in TEXT_COLUMNS}
+        self._heaps = {column: section(f'{column}.heap') for column in TEXT_COLUMNS}
+
+    def __len__(self) -> int:
+        """Return the number of recipes in this store."""
+        return self._count
+
+    def number(self, column: str, index: int) -> float:
+        """Return the value of the given numeric column for the recipe at the given index.
+
+        Preconditions:
+            - column in NUMERIC_COLUMNS
+            - 0 <= index < len(self)
+        """
+        return self._numbers[column][index]
+
+    def text(self, column: str, index: int) -> Optional[str]:
+        """Return the value of the given text column for the recipe at the given index, or None if it is missing.
+
+        Preconditions:
+            - column in TEXT_COLUMNS
+            - 0 <= index < len(self)
+        """
+        offsets = self._offsets[column]
+        value = self._heaps[column][offsets[index]:offsets[index + 1]]
+        return None if value == _MISSING else str(value, 'utf-8')
+
+    def load(self, locator: int) -> tuple[Optional[str], Optional[str], Optional[str]]:
+        """Return the (url, image, description) of the recipe at the given index."""
+        return (self.text('url', locator), self.text('image', locator), self.text('description', locator))
+
+    def close(self) -> None:
+        """Close this store. Values can no longer be read from it."""
+        for views in [self._numbers, self._offsets, self._heaps]:
+            for view in views.values():
+                view.release()
+        self._mmap.close()
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['array', 'json', 'mmap', 'struct'],
+        'allowed-io': ['is_recipe_store', 'write_store', '__init__'],
+        'max-line-length': 120
+    })
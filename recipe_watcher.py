@@ -0,0 +1,319 @@
+"""
+This Python module keeps a recipe graph up to date with the recipe files that users add recipes to.
+
+main.add_recipe appends new recipes to a journal (see recipe_journal) while the interface may already be running.
+A RecipeWatcher notices when such a file, or a plain JSON array of recipes, changes, works out which recipes
+were added, changed or removed since it was last read, and applies only those to the graph through
+Graph.add_recipe and Graph.remove_recipe. Nothing is rebuilt, and only the cached query answers that the changed
+recipes could be part of are dropped.
+
+A journal only parses its appended lines. A JSON array has to be read again as a whole, but only the records
+between its unchanged beginning and its unchanged end are parsed and compared.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable, Iterator, Optional
+import json
+import os
+import re
+import time
+
+import graphs
+import recipe_journal
+
+
+class RecipeWatcher:
+    """Applies the changes made to some recipe files to a recipe graph.
+
+    Each recipe is identified by its 'id' field, or by its name if it has none (see graphs.recipe_key), and is
+    expected to be listed once in each file. A recipe is only added to the graph if the graph has no food with its
+    recipe id yet; recipes that are already in the graph, for example because they were also in the file the
+    graph was built from, are left alone, and are never removed by the watcher. Records that are not recipes with
+    fields of the right types (see _is_recipe) are ignored.
+
+    Instance Attributes:
+        - graph: the graph the changes are applied to
+        - paths: the paths of the recipe files being watched. Paths ending in '.jsonl' are read as recipe
+          journals, and the others as JSON arrays of recipes.
+        - interval: the smallest number of seconds between two reads of the files by poll_if_due
+    """
+    # Private Instance Attributes:
+    #     - _stamps: maps each path to the (modification time in nanoseconds, size) of the file when it was last
+    #       read, or None if there was no file
+    #     - _recipes: maps each path to a dict mapping the id of each recipe last read from that file to
+    #       (the recipe, its recipe id if this watcher added it to the graph, or None)
+    #     - _journals: maps the path of each watched journal to the journal, which only reads appended lines
+    #     - _texts: maps the path of each watched JSON array to its text when it was last read
+    #     - _spans: maps the path of each watched JSON array to the (start, end, recipe id or None if it is not a
+    #       recipe) of each record in its text when it was last read, in order
+    #     - _last_poll: the time.monotonic() of the last poll
+    graph: graphs.Graph
+    paths: list[str]
+    interval: float
+    _stamps: dict[str, Optional[tuple[int, int]]]
+    _recipes: dict[str, dict[Any, tuple[dict, Any]]]
+    _journals: dict[str, recipe_journal.RecipeJournal]
+    _texts: dict[str, str]
+    _spans: dict[str, list[tuple[int, int, Any]]]
+    _last_poll: float
+
+    def __init__(self, graph: graphs.Graph, paths: Iterable[str], interval: float = 1.0) -> None:
+        """Initialize a watcher of the given recipe files that has not read them yet.
+
+        Preconditions:
+            - interval >= 0
+        """
+        self.graph = graph
+        self.paths = list(paths)
+        self.interval = interval
+        self._stamps = {path: None for path in self.paths}
+        self._recipes = {path: {} for path in self.paths}
+        self._journals = {}
+        self._texts = {path: '' for path in self.paths}
+        self._spans = {path: [] for path in self.paths}
+        self._last_poll = float('-inf')
+
+    def poll(self) -> int:
+        """Read the watched files that have changed since they were last read, apply the recipes that were
+        added, changed or removed in them to the graph, and return the number of recipes applied.
+
+        A file that does not exist is treated as having no recipes. A file that is not valid JSON, such as one
+        that is halfway through being written, is skipped and read again on the next poll.
+        """
+        self._last_poll = time.monotonic()
+        applied = 0
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stamp = None
+            if stamp == self._stamps[path]:
+                continue
+
+            if stamp is None:
+                applied += self._apply(path, [], list(self._recipes[path]))
+                self._texts[path], self._spans[path] = '', []
+            elif path.endswith('.jsonl'):
+                if path not in self._journals:
+                    self._journals[path] = recipe_journal.RecipeJournal(path)
+                applied += self._apply_journal(path, self._journals[path].recipes())
+            else:
+                try:
+                    with open(path) as f:
+                        text = f.read()
+                    applied += self._apply_array(path, text)
+                except (FileNotFoundError, ValueError):
+                    # ValueError includes json.JSONDecodeError
+                    continue
+            self._stamps[path] = stamp
+        return applied
+
+    def poll_if_due(self) -> int:
+        """Poll the watched files if at least interval seconds have passed since the last poll, and return the
+        number of recipes applied.
+        """
+        if time.monotonic() - self._last_poll < self.interval:
+            return 0
+        return self.poll()
+
+    def _apply_journal(self, path: str, recipes: list[dict]) -> int:
+        """Apply the differences between the recipes last read from the journal at the given path and the given
+        recipes, which are all the recipes in it now, to the graph, and return the number of recipes applied.
+        """
+        old = self._recipes[path]
+        # a journal hands back the same dict for a recipe until it is replaced
+        changed = [recipe for recipe in recipes if old.get(_key(recipe), (None,))[0] is not recipe]
+        removed = old.keys() - {_key(recipe) for recipe in recipes}
+        return self._apply(path, changed, removed)
+
+    def _apply_array(self, path: str, text: str) -> int:
+        """Apply the differences between the recipes last read from the JSON array at the given path and the
+        recipes in the given text of it to the graph, and return the number of recipes applied.
+
+        The records that lie entirely within the longest common prefix or suffix of the old and the new text are
+        unchanged, and only the records between them are parsed. Raise a ValueError if the text is not a JSON
+        array, in which case nothing is applied.
+        """
+        old_text, old_spans = self._texts[path], self._spans[path]
+        prefix = _common_prefix(old_text, text)
+        suffix = _common_suffix(old_text, text, min(len(old_text), len(text)) - prefix)
+        shift = len(text) - len(old_text)
+
+        # a record that ends right at the prefix may be a number that continues in the new text
+        head = 0
+        while head < len(old_spans) and old_spans[head][1] < prefix:
+            head += 1
+        tail = len(old_spans)
+        while tail > head and old_spans[tail - 1][0] >= len(old_text) - suffix:
+            tail -= 1
+
+        if head > 0:
+            records = _array_records(text, old_spans[head - 1][1], False)
+        else:
+            start = _WHITESPACE.match(text).end()
+            if not text.startswith('[', start):
+                raise ValueError(f'{path!r} is not a JSON array')
+            records = _array_records(text, start + 1, True)
+
+        middle = []
+        for record, start, end in records:
+            if tail < len(old_spans) and start == old_spans[tail][0] + shift:
+                # the rest of the records are the unchanged ones at the end
+                break
+            if tail < len(old_spans) and start > old_spans[tail][0] + shift:
+                tail = len(old_spans)
+            middle.append((record, start, end))
+        else:
+            tail = len(old_spans)
+
+        recipes = [record for record, _, _ in middle]
+        removed = ({key for _, _, key in old_spans[head:tail]} - {_key(recipe) for recipe in recipes}) - {None}
+        applied = self._apply(path, recipes, removed)
+
+        self._texts[path] = text
+        self._spans[path] = (old_spans[:head] + [(start, end, _key(record)) for record, start, end in middle]
+                             + [(start + shift, end + shift, key) for start, end, key in old_spans[tail:]])
+        return applied
+
+    def _apply(self, path: str, recipes: Iterable[Any], removed: Iterable[Any]) -> int:
+        """Apply to the graph the given records, which may have been added or changed since the given path was
+        last read, and the removal of the recipes with the given ids from it. Return the number of recipes added,
+        changed or removed.
+        """
+        old = self._recipes[path]
+        applied = 0
+        for key in removed:
+            _, recipe_id = old.pop(key)
+            if recipe_id is not None:
+                self.graph.remove_recipe(recipe_id)
+            applied += 1
+
+        for recipe in recipes:
+            key = _key(recipe)
+            if key is None:
+                continue
+            if key in old and old[key][0] == recipe:
+                old[key] = (recipe, old[key][1])
+                continue
+
+            if key in old and old[key][1] is not None:
+                self.graph.remove_recipe(old[key][1])
+            old[key] = (recipe, self._add(recipe))
+            applied += 1
+        return applied
+
+    def _add(self, recipe: dict) -> Any:
+        """Add the given recipe to the graph and return its recipe id, or return None if it could not be added
+        because the graph already has a food with its recipe id or one of its values is not valid.
+        """
+        try:
+            self.graph.add_recipe(recipe)
+        except (KeyError, ValueError, TypeError):
+            return None
+        return graphs.recipe_key(recipe)
+
+
+_WHITESPACE = re.compile(r'\s*')
+_DECODER = json.JSONDecoder()
+
+
+def _is_recipe(record: Any) -> bool:
+    """Return whether the given record of a recipe file is a recipe whose fields have the types that
+    Graph.add_recipe expects.
+
+    >>> _is_recipe({'id': 'USERADDED1', 'name': 'Toast', 'rattings': 4, 'subcategory': 'Breakfast recipes',
+    ...             'difficult': 'Easy', 'serves': 1, 'times': {'Preparation': '5 mins'}})
+    True
+    >>> _is_recipe({'name': 'Toast', 'rattings': 4, 'subcategory': 'Breakfast recipes', 'difficult': 'Easy',
+    ...             'serves': 'one', 'times': {'Preparation': '5 mins'}})
+    False
+    """
+    return (isinstance(record, dict)
+            and isinstance(record.get('id'), (str, int, type(None)))
+            and isinstance(record.get('name'), str)
+            and isinstance(record.get('rattings'), int)
+            and isinstance(record.get('subcategory'), str)
+            and isinstance(record.get('difficult'), str)
+            and isinstance(record.get('serves'), int)
+            and isinstance(record.get('times'), dict)
+            and all(isinstance(time_, str) for time_ in record['times'].values())
+            and all(isinstance(record.get(field), (list, type(None))) for field in ('ingredients', 'steps'))
+            and isinstance(record.get('nutrients'), (dict, type(None))))
+
+
+def _key(record: Any) -> Any:
+    """Return the recipe id of the given record of a recipe file, or None if it is not a recipe."""
+    return graphs.recipe_key(record) if _is_recipe(record) else None
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Return the length of the longest common prefix of the given strings.
+
+    >>> _common_prefix('[{"a": 1}]', '[{"a": 2}]')
+    7
+    """
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        # the first low characters are already known to be equal
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    """Return the length of the longest common suffix of the given strings that is at most limit.
+
+    >>> _common_suffix('[{"a": 1}]', '[{"b": 1}]', 10)
+    6
+    """
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _array_records(text: str, position: int, first: bool) -> Iterator[tuple[Any, int, int]]:
+    """Yield each remaining value of the JSON array in the given text after the given position, with the offsets
+    of its start and end in the text.
+
+    If first is True, position is just after the opening bracket of the array; otherwise it is just after a value
+    of the array. Raise a ValueError if the rest of the text is not the rest of a JSON array.
+
+    >>> list(_array_records('[{"a": 1}, 2]', 1, True))
+    [({'a': 1}, 1, 9), (2, 11, 12)]
+    """
+    while True:
+        position = _WHITESPACE.match(text, position).end()
+        if text.startswith(']', position):
+            break
+        if not first:
+            if not text.startswith(',', position):
+                raise ValueError(f'expected a comma at {position}')
+            position = _WHITESPACE.match(text, position + 1).end()
+        value, end = _DECODER.raw_decode(text, position)
+        yield value, position, end
+        position = end
+        first = False
+
+    if text[position + 1:].strip():
+        raise ValueError(f'unexpected text after the array at {position + 1}')
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['graphs', 'json', 'os', 're', 'recipe_journal', 'time'],
+        'allowed-io': ['RecipeWatcher.poll'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,201 @@
+"""
+This Python module contains the render loop helpers of the interface.
+
+A RenderScheduler caps the frame rate of the main loop, and lowers it further while no input arrives, so an idle
+app does not keep a CPU core busy. A DirtyRegions tracks which parts of the display changed in a frame, so that
+widgets only redraw themselves when their appearance changes and only those parts are pushed to the display.
+A RunStats records how long the frames of a run took, for benchmarking the interface.
+"""
+
+from __future__ import annotations
+from typing import Any, Iterable, Optional
+import math
+import time
+
+import pygame
+
+
+class RenderScheduler:
+    """Paces the main loop of the interface.
+
+    Instance Attributes:
+        - fps: the largest number of frames per second while the user is interacting
+        - idle_fps: the largest number of frames per second once there has been no input for idle_after seconds
+        - idle_after: the number of seconds without input after which the loop is throttled to idle_fps
+    """
+    # Private Instance Attributes:
+    #     - _clock: the clock used to wait between frames
+    #     - _last_input: the time.monotonic() of the last frame that had input
+    fps: int
+    idle_fps: int
+    idle_after: float
+    _clock: pygame.time.Clock
+    _last_input: float
+
+    def __init__(self, fps: int = 60, idle_fps: int = 10, idle_after: float = 1.0) -> None:
+        """Initialize a scheduler with the given frame rate caps.
+
+        Preconditions:
+            - fps >= idle_fps >= 1
+        """
+        self.fps = fps
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after
+        self._clock = pygame.time.Clock()
+        self._last_input = time.monotonic()
+
+    def tick(self, had_input: bool) -> int:
+        """Wait until the next frame is due and return the number of milliseconds since the previous frame.
+
+        had_input is whether the frame that just ended had any input events.
+        """
+        now = time.monotonic()
+        if had_input:
+            self._last_input = now
+
+        if now - self._last_input >= self.idle_after:
+            return self._clock.tick(self.idle_fps)
+        return self._clock.tick(self.fps)
+
+
+class DirtyRegions:
+    """The regions of the display that have changed since they were last pushed to it.
+
+    Each screen of the interface has a background, which is drawn in full when the screen is entered. After
+    that, a widget only redraws itself when its appearance changes: it restores the background under itself,
+    draws itself, and marks its area as dirty. flush then updates only the dirty areas of the display.
+
+    Instance Attributes:
+        - surface: the display surface
+        - background: the background of the current screen, or None before any screen has been drawn
+        - generation: a number that changes every time a new background is drawn, so widgets can tell that
+          they need to redraw themselves
+    """
+    # Private Instance Attributes:
+    #     - _rects: the dirty areas of the display
+    #     - _full: whether the whole display is dirty
+    surface: pygame.Surface
+    background: Optional[pygame.Surface]
+    generation: int
+    _rects: list[pygame.Rect]
+    _full: bool
+
+    def __init__(self, surface: pygame.Surface) -> None:
+        """Initialize the dirty regions of the given display surface."""
+        self.surface = surface
+        self.background = None
+        self.generation = 0
+        self._rects = []
+        self._full = True
+
+    def set_background(self, background: pygame.Surface) -> None:
+        """Draw the given background over the whole display, and make it the background that restore uses."""
+        self.background = background
+        self.surface.blit(background, (0, 0))
+        self.generation += 1
+        self._full = True
+
+    def restore(self, rect: pygame.Rect) -> None:
+        """Draw the background over the given area of the display and mark that area as dirty."""
+        if self.background is not None:
+            self.surface.blit(self.background, rect, rect)
+        self.mark(rect)
+
+    def mark(self, rect: pygame.Rect) -> None:
+        """Mark the given area of the display as dirty."""
+        if not self._full:
+            self._rects.append(pygame.Rect(rect))
+
+    def flush(self) -> None:
+        """Push the dirty areas to the display, and mark the whole display as clean."""
+        if self._full:
+            pygame.display.update()
+        elif self._rects:
+            pygame.display.update(self._rects)
+        self._rects = []
+        self._full = False
+
+
+class RunStats:
+    """Measurements of one run of the interface.
+
+    Instance Attributes:
+        - graph_build_seconds: the number of seconds taken to build the recipe network, or None if not recorded
+        - frames: the (screen, frame seconds, draw seconds) of each frame, where screen is the name of the class
+          of the active screen, frame seconds is the time spent on the frame apart from waiting for the next one,
+          and draw seconds is the part of it spent running the screen
+        - image_fetch_seconds: the number of seconds each image fetch took
+    """
+    graph_build_seconds: Optional[float]
+    frames: list[tuple[str, float, float]]
+    image_fetch_seconds: list[float]
+
+    def __init__(self) -> None:
+        """Initialize empty measurements."""
+        self.graph_build_seconds = None
+        self.frames = []
+        self.image_fetch_seconds = []
+
+    def record_graph_build(self, seconds: float) -> None:
+        """Record the time taken to build the recipe network."""
+        self.graph_build_seconds = seconds
+
+    def record_frame(self, screen: str, frame_seconds: float, draw_seconds: float) -> None:
+        """Record the time taken by a frame showing the given screen."""
+        self.frames.append((screen, frame_seconds, draw_seconds))
+
+    def record_image_fetches(self, seconds: Iterable[float]) -> None:
+        """Record the times taken by image fetches."""
+        self.image_fetch_seconds.extend(seconds)
+
+    def report(self) -> dict[str, Any]:
+        """Return a summary of these measurements that can be serialized as JSON. Times are in milliseconds,
+        except the graph build time, which is in seconds.
+        """
+        screens = {}
+        for screen, _, draw_seconds in self.frames:
+            screens.setdefault(screen, []).append(draw_seconds)
+
+        return {
+            'frames': len(self.frames),
+            'frame_ms': summarize([frame_seconds for _, frame_seconds, _ in self.frames]),
+            'draw_ms_by_screen': {screen: summarize(draws) for screen, draws in screens.items()},
+            'graph_build_s': self.graph_build_seconds,
+            'image_fetch_ms': summarize(self.image_fetch_seconds)
+        }
+
+
+def summarize(seconds: list[float]) -> dict[str, float]:
+    """Return the count, mean, 50th, 90th and 99th percentiles and maximum of the given times, in milliseconds.
+
+    Percentiles are taken by the nearest-rank method.
+
+    >>> summarize([0.001, 0.002, 0.003, 0.004])['p50']
+    2.0
+    >>> summarize([])
+    {'count': 0}
+    """
+    if not seconds:
+        return {'count': 0}
+    ordered = sorted(seconds)
+
+    def percentile(p: float) -> float:
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000, 3)
+
+    return {'count': len(ordered),
+            'mean': round(sum(ordered) / len(ordered) * 1000, 3),
+            'p50': percentile(50),
+            'p90': percentile(90),
+            'p99': percentile(99),
+            'max': round(ordered[-1] * 1000, 3)}
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['math', 'time', 'pygame'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,402 @@
+"""
+This Python module finds the recipes that are most like a given recipe, for a "more like this" list.
+
+Each recipe is described by a set of features: the option and ingredient vertices it is adjacent to in the recipe
+graph, and the words of its name and description. Features that most recipes have, such as being easy, say little
+about which recipes are alike, so like the stop words of a search engine they are left out. Two recipes are as
+similar as the Jaccard similarity of their remaining features, which a SimilarityIndex estimates from MinHash
+signatures: NUM_HASHES hash functions are applied to every feature, and a recipe keeps the smallest value of each,
+so two recipes agree on a hash with a probability equal to their similarity.
+
+To avoid comparing a recipe against every other one, the signatures are cut into NUM_BANDS bands of two hashes,
+and the recipes that agree on a whole band fall into the same bucket of that band (locality-sensitive hashing).
+Only the recipes that share a bucket with a recipe are scored against it. A batch job (SimilarityIndex.precompute)
+finds the neighbours of every recipe at once with SciPy sparse matrix products, in a pool of processes.
+"""
+
+from __future__ import annotations
+from array import array
+from typing import Any, Iterable, Optional
+import collections
+import concurrent.futures
+import functools
+import os
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+import text_search
+
+# The number of hash functions in a signature, and the number of bands of two hashes it is cut into, which is at
+# most 64. A pair of recipes with similarity s shares a bucket with probability 1 - (1 - s ** 2) ** NUM_BANDS,
+# which is above a half from a similarity of about 0.1
+NUM_HASHES = 128
+NUM_BANDS = NUM_HASHES // 2
+# The share of recipes above which a feature is too common to be kept in signatures
+MAX_FEATURE_SHARE = 0.05
+# The largest number of recipes of one bucket that are scored, so a bucket of near duplicates does not make every
+# lookup in it slow
+MAX_BUCKET = 512
+
+# The multiply-shift hash functions, ((a * x + b) mod 2 ** 64) >> 32 for a feature hashed to a 32-bit x
+_RANDOM = np.random.default_rng(111)
+_MULTIPLIERS = _RANDOM.integers(0, 1 << 63, NUM_HASHES, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_INCREMENTS = _RANDOM.integers(0, 1 << 63, NUM_HASHES, dtype=np.uint64) * np.uint64(2)
+# The most features whose hashes are worked out at once, which bounds the memory signatures take to build
+_BATCH = 1 << 13
+
+# What the processes of precompute share, set once in each of them by _start_worker
+_worker_state = {}
+
+
+def recipe_features(text: str, options: Iterable[str]) -> set[str]:
+    """Return the features of a recipe with the given name and description and the given items of the option and
+    ingredient vertices it is adjacent to.
+
+    >>> sorted(recipe_features('Smoked salmon pot', ['Easy', 'salmon']))
+    ['option Easy', 'option salmon', 'word pot', 'word salmon', 'word smoked']
+    """
+    return {'word ' + word for word in text_search.tokenise(text)} | {'option ' + option for option in options}
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _feature_hash(feature: str) -> int:
+    """Return a 32-bit hash of the given feature that is the same in every process, unlike hash."""
+    return zlib.crc32(feature.encode('utf-8'))
+
+
+def signatures(features: Iterable[Iterable[str]]) -> np.ndarray:
+    """Return the MinHash signature of each of the given sets of features, one row of NUM_HASHES 32-bit values each.
+
+    Preconditions:
+        - every set of features is non-empty
+    """
+    hashes, starts = array('Q'), array('q', [0])
+    for document in features:
+        hashes.extend(_feature_hash(feature) for feature in document)
+        starts.append(len(hashes))
+    hashes, starts = np.frombuffer(hashes, dtype=np.uint64), np.frombuffer(starts, dtype=np.int64)
+
+    rows = np.empty((len(starts) - 1, NUM_HASHES), dtype=np.uint32)
+    first = 0
+    while first < len(rows):
+        # the documents whose features make up the next batch, and at least one
+        last = max(int(np.searchsorted(starts, starts[first] + _BATCH, side='right')) - 1, first + 1)
+        values = (hashes[starts[first]:starts[last], None] * _MULTIPLIERS + _INCREMENTS) >> np.uint64(32)
+        rows[first:last] = np.minimum.reduceat(values, starts[first:last] - starts[first], axis=0)
+        first = last
+    return rows
+
+
+def band_keys(rows: np.ndarray) -> np.ndarray:
+    """Return the bucket of each band of the given signatures, one row of NUM_BANDS 64-bit keys per signature.
+
+    A key is the number of its band in the top 6 bits, followed by the first hash value of the band and the top 26
+    bits of the second, so the buckets of every band can be kept in one sorted array.
+    """
+    pairs = rows.reshape(len(rows), NUM_BANDS, 2).astype(np.uint64)
+    bands = np.arange(NUM_BANDS, dtype=np.uint64) << np.uint64(58)
+    return bands | (pairs[:, :, 0] << np.uint64(26)) | (pairs[:, :, 1] >> np.uint64(6))
+
+
+class SimilarityIndex:
+    """A locality-sensitive hashing index of the MinHash signatures of some recipes.
+
+    Documents are numbered in the order they were added, and ties between equal similarities are broken by that
+    order. The buckets of the documents the index was built with are kept sorted in arrays, and those of the
+    documents added later (see add) in a dict. Which features are too common to keep is decided when the index is
+    built.
+
+    Instance Attributes:
+        - recipe_ids: the recipe id of each document, indexed by its number, including removed documents
+        - common: the features left out of the signatures, since more than MAX_FEATURE_SHARE of the documents the
+          index was built with have them
+
+    Representation Invariants:
+        - len(self._signatures) >= len(self.recipe_ids)
+        - len(self._bucket_keys) == len(self._bucket_docs) == NUM_BANDS * self._built
+    """
+    # Private Instance Attributes:
+    #     - _numbers: maps the recipe id of each document that has not been removed to its number
+    #     - _signatures: the signature of each document, indexed by its number, with room for more documents
+    #     - _live: whether each document has not been removed, indexed by its number, with the same room
+    #     - _built: the number of documents the index was built with
+    #     - _bucket_keys: the keys of the buckets of every band of the documents the index was built with, in
+    #       increasing order
+    #     - _bucket_docs: the numbers of the documents in the same places as their keys in _bucket_keys, in
+    #       increasing order within each bucket
+    #     - _extra_buckets: maps the key of each bucket of the documents added after the index was built to their
+    #       numbers
+    #     - _neighbour_starts: the position in _neighbours of the precomputed neighbours of each document that was
+    #       in the index when precompute last ran, followed by the number of neighbours, or None if it has not run
+    #     - _neighbours: the numbers of those neighbours, document after document, most similar first
+    #     - _neighbour_scores: the estimated similarity of each neighbour in _neighbours
+    #     - _neighbour_k: the number of neighbours precompute found for each document
+    recipe_ids: list[Any]
+    common: frozenset[str]
+    _numbers: dict[Any, int]
+    _signatures: np.ndarray
+    _live: np.ndarray
+    _built: int
+    _bucket_keys: np.ndarray
+    _bucket_docs: np.ndarray
+    _extra_buckets: dict[int, list[int]]
+    _neighbour_starts: Optional[np.ndarray]
+    _neighbours: Optional[np.ndarray]
+    _neighbour_scores: Optional[np.ndarray]
+    _neighbour_k: int
+
+    def __init__(self, recipe_ids: list[Any], rows: np.ndarray, common: frozenset[str] = frozenset()) -> None:
+        """Initialize an index of the documents with the given recipe ids and signatures, in that order, whose
+        signatures leave out the given common features.
+
+        Preconditions:
+            - len(recipe_ids) == len(rows)
+            - no two documents have the same recipe id
+        """
+        self.recipe_ids = list(recipe_ids)
+        self.common = common
+        self._numbers = {recipe_id: number for number, recipe_id in enumerate(self.recipe_ids)}
+        self._signatures = rows
+        self._live = np.ones(len(rows), dtype=bool)
+        self._built = len(rows)
+
+        # the keys of a document are next to each other, so sorting them stably keeps each bucket in order
+        keys = band_keys(rows).ravel()
+        order = np.argsort(keys, kind='stable')
+        self._bucket_keys = keys[order]
+        self._bucket_docs = (order // NUM_BANDS).astype(np.int32)
+        self._extra_buckets = {}
+        self._neighbour_starts = self._neighbours = self._neighbour_scores = None
+        self._neighbour_k = 0
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple[Any, Iterable[str]]]) -> SimilarityIndex:
+        """Return an index of the given (recipe id, recipe_features of the recipe) documents.
+
+        A document whose features are all common keeps them all, so it still has a signature.
+
+        Preconditions:
+            - no two documents have the same recipe id
+            - every document has at least one feature
+        """
+        recipe_ids, features = [], []
+        for recipe_id, document in documents:
+            recipe_ids.append(recipe_id)
+            features.append(set(document))
+        doc_freqs = collections.Counter(feature for document in features for feature in document)
+        common = frozenset(feature for feature, doc_freq in doc_freqs.items()
+                           if doc_freq > MAX_FEATURE_SHARE * len(features))
+        return cls(recipe_ids, signatures((document - common) or document for document in features), common)
+
+    def __contains__(self, recipe_id: Any) -> bool:
+        """Return whether this index has a document with the given recipe id that has not been removed."""
+        return recipe_id in self._numbers
+
+    def add(self, recipe_id: Any, features: Iterable[str]) -> None:
+        """Add a document with the given recipe id and recipe_features, replacing any document with that id.
+
+        The precomputed neighbours of the other documents are still used, and it is scored alongside them when
+        they are looked up.
+
+        Preconditions:
+            - features is non-empty
+        """
+        self.remove(recipe_id)
+        number = len(self.recipe_ids)
+        if number == len(self._signatures):
+            # the signatures and live flags grow by doubling, so adding documents one at a time stays cheap
+            self._signatures = np.concatenate((self._signatures,
+                                               np.empty((max(number, 1), NUM_HASHES), dtype=np.uint32)))
+            self._live = np.concatenate((self._live, np.zeros(max(number, 1), dtype=bool)))
+        features = set(features)
+        self._signatures[number] = signatures([(features - self.common) or features])[0]
+        self._live[number] = True
+        self.recipe_ids.append(recipe_id)
+        self._numbers[recipe_id] = number
+        for key in band_keys(self._signatures[number:number + 1])[0].tolist():
+            self._extra_buckets.setdefault(key, []).append(number)
+
+    def remove(self, recipe_id: Any) -> None:
+        """Remove the document with the given recipe id from this index. Do nothing if there is none."""
+        number = self._numbers.pop(recipe_id, None)
+        if number is None:
+            return
+        self._live[number] = False
+        if number >= self._built:
+            for key in band_keys(self._signatures[number:number + 1])[0].tolist():
+                self._extra_buckets[key].remove(number)
+                if not self._extra_buckets[key]:
+                    del self._extra_buckets[key]
+
+    def similar(self, recipe_id: Any, k: int = 10) -> list[tuple[Any, float]]:
+        """Return the recipe ids of the k documents most similar to the document with the given recipe id, with
+        their estimated similarity, from the most similar to the least. The document itself is left out.
+
+        Only documents that share a bucket with it are considered. Its precomputed neighbours are used if
+        precompute last ran for at least k neighbours and none of them has been removed since; the documents added
+        since then that share a bucket with it are scored alongside them.
+
+        Preconditions:
+            - recipe_id in self
+            - k >= 0
+        """
+        if k == 0:
+            return []
+        number = self._numbers[recipe_id]
+        candidates = None
+        if self._neighbour_starts is not None and number < len(self._neighbour_starts) - 1 \
+                and k <= self._neighbour_k:
+            start, end = self._neighbour_starts[number], self._neighbour_starts[number + 1]
+            neighbours = self._neighbours[start:end]
+            if self._live[neighbours].all():
+                later = self._added_since_precompute(number)
+                if len(later) == 0:
+                    scores = self._neighbour_scores[start:end]
+                    return [(self.recipe_ids[other], score) for other, score in zip(neighbours[:k].tolist(),
+                                                                                     scores[:k].tolist())]
+                candidates = np.concatenate((neighbours, later))
+        if candidates is None:
+            candidates = self._candidates(number)
+
+        others, agreements = _best(candidates, np.count_nonzero(self._signatures[candidates]
+                                                                == self._signatures[number], axis=1), k)
+        return [(self.recipe_ids[other], agreement / NUM_HASHES)
+                for other, agreement in zip(others.tolist(), agreements.tolist())]
+
+    def precompute(self, k: int = 10, processes: Optional[int] = None, chunk_size: int = 2048) -> int:
+        """Find the k most similar documents of every document in this index, so similar answers from them, and
+        return the number of documents they were found for.
+
+        The documents are split into chunks of chunk_size, and the neighbours of each chunk are found in its own
+        process, by multiplying a sparse matrix of the buckets of the chunk by the transpose of the one of every
+        document. processes is the number of processes to use, defaulting to the number of CPUs. If it is 1, the
+        chunks are done in this process.
+
+        Preconditions:
+            - k >= 1
+            - processes is None or processes >= 1
+            - chunk_size >= 1
+        """
+        count = len(self.recipe_ids)
+        unique, buckets = np.unique(band_keys(self._signatures[:count]).ravel(), return_inverse=True)
+        total = len(unique)
+        members = sparse.csr_matrix((np.ones(len(buckets), dtype=np.int32), buckets,
+                                     np.arange(0, len(buckets) + 1, NUM_BANDS)), shape=(count, total))
+
+        # the transpose lists the documents of every bucket; removed documents are left out of it, and so are
+        # the documents of a bucket after its first MAX_BUCKET, as in the buckets similar looks in
+        order = np.argsort(buckets, kind='stable')
+        columns = buckets[order]
+        rank = np.arange(len(order)) - np.searchsorted(columns, columns)
+        keep = (rank < MAX_BUCKET) & self._live[order // NUM_BANDS]
+        bucket_members = sparse.csr_matrix((np.ones(int(keep.sum()), dtype=np.int32), order[keep] // NUM_BANDS,
+                                            np.searchsorted(columns[keep], np.arange(total + 1))),
+                                           shape=(total, count))
+
+        state = (self._signatures[:count], members, bucket_members, k)
+        chunks = [(start, min(start + chunk_size, count)) for start in range(0, count, chunk_size)]
+        if processes == 1 or len(chunks) <= 1:
+            found = [_neighbours_of(state, chunk) for chunk in chunks]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                                                        initializer=_start_worker, initargs=(state,)) as pool:
+                found = list(pool.map(_neighbours_in_worker, chunks))
+
+        counts = np.concatenate([np.zeros(1, dtype=np.int64)] + [chunk_counts for chunk_counts, _, _ in found])
+        self._neighbour_starts = np.cumsum(counts)
+        self._neighbours = np.concatenate([np.zeros(0, dtype=np.int32)] + [others for _, others, _ in found])
+        self._neighbour_scores = np.concatenate([np.zeros(0)] + [scores for _, _, scores in found])
+        self._neighbour_k = k
+        return count
+
+    def _added_since_precompute(self, number: int) -> np.ndarray:
+        """Return the numbers of the documents added since precompute last ran that share a bucket with the
+        document with the given number and have not been removed.
+
+        Preconditions:
+            - self._neighbour_starts is not None
+        """
+        if not self._extra_buckets:
+            return np.zeros(0, dtype=np.int32)
+        first = len(self._neighbour_starts) - 1
+        later = {other for key in band_keys(self._signatures[number:number + 1])[0].tolist()
+                 for other in self._extra_buckets.get(key, ()) if other >= first}
+        return np.array(sorted(later), dtype=np.int32)
+
+    def _candidates(self, number: int) -> np.ndarray:
+        """Return the numbers of the documents that share a bucket with the document with the given number and
+        have not been removed, apart from that document, in increasing order.
+        """
+        keys = band_keys(self._signatures[number:number + 1])[0]
+        low = np.searchsorted(self._bucket_keys, keys, side='left')
+        sizes = np.minimum(np.searchsorted(self._bucket_keys, keys, side='right') - low, MAX_BUCKET)
+        # the positions of the first MAX_BUCKET documents of every bucket, bucket after bucket
+        ends = np.cumsum(sizes)
+        positions = np.arange(ends[-1]) + np.repeat(low - (ends - sizes), sizes)
+        found = [self._bucket_docs[positions]]
+        if self._extra_buckets:
+            found.extend(np.array(self._extra_buckets[key], dtype=np.int32) for key in keys.tolist()
+                         if key in self._extra_buckets)
+
+        candidates = np.unique(np.concatenate(found))
+        return candidates[self._live[candidates] & (candidates != number)]
+
+
+def _start_worker(state: tuple) -> None:
+    """Keep the given state of precompute in this process, for _neighbours_in_worker."""
+    _worker_state['state'] = state
+
+
+def _neighbours_in_worker(chunk: tuple[int, int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return _neighbours_of the given chunk, with the state kept by _start_worker."""
+    return _neighbours_of(_worker_state['state'], chunk)
+
+
+def _neighbours_of(state: tuple, chunk: tuple[int, int]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the number of neighbours of each document of the given (start, end) chunk of documents, and the
+    numbers and estimated similarities of those neighbours, document after document, most similar first.
+
+    state is (the signatures of every document, the sparse matrix of the buckets of every document, the sparse
+    matrix of the documents of every bucket that are scored, the number of neighbours to find).
+    """
+    rows, members, bucket_members, k = state
+    start, end = chunk
+    # row i of the product has a nonzero for every document that shares a bucket with document start + i
+    pairs = members[start:end] @ bucket_members
+    counts = np.zeros(end - start, dtype=np.int64)
+    neighbours, scores = [], []
+    for i in range(end - start):
+        candidates = pairs.indices[pairs.indptr[i]:pairs.indptr[i + 1]]
+        candidates = candidates[candidates != start + i]
+        # comparing one signature with those of its candidates is cheaper than gathering both sides of each pair
+        others, agreements = _best(candidates, np.count_nonzero(rows[candidates] == rows[start + i], axis=1), k)
+        counts[i] = len(others)
+        neighbours.append(others.astype(np.int32))
+        scores.append(agreements / NUM_HASHES)
+    return counts, np.concatenate(neighbours or [np.zeros(0, dtype=np.int32)]), np.concatenate(scores or [[]])
+
+
+def _best(candidates: np.ndarray, agreements: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return the k of the given candidates that agree on the most hashes with a signature, and the number they
+    agree on, from the most to the fewest, with ties in increasing order of the candidates.
+    """
+    if len(candidates) > k:
+        # only the candidates that agree at least as much as the k-th best one are sorted
+        head = agreements >= np.partition(agreements, len(agreements) - k)[len(agreements) - k]
+        candidates, agreements = candidates[head], agreements[head]
+    order = np.lexsort((candidates, -agreements))[:k]
+    return candidates[order], agreements[order]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['array', 'collections', 'concurrent.futures', 'functools', 'os', 'zlib', 'numpy', 'scipy',
+                          'text_search'],
+        'max-line-length': 120
+    })
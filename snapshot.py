@@ -0,0 +1,136 @@
+"""
+This Python module reads and writes binary snapshots of data built from a source file, so that the data can be
+loaded directly on later runs instead of being rebuilt from the source.
+
+A snapshot is stored next to its source file. It is keyed on the source's path, size, modification time and
+content hash, and on a schema string chosen by the caller, so it is only used while the source and the layout
+of the data are unchanged.
+
+A snapshot file is laid out as:
+    - MAGIC (8 bytes)
+    - the length of the header, as a little-endian unsigned 32-bit integer
+    - the header: UTF-8 encoded JSON holding SNAPSHOT_VERSION, the key, and the offset and length of each column
+    - the columns, each serialized on its own with marshal
+
+Columns are read one by one, so callers only pay for the columns they ask for.
+"""
+
+from __future__ import annotations
+from typing import Any, BinaryIO, Collection, Optional
+import hashlib
+import json
+import marshal
+import os
+import struct
+
+SNAPSHOT_VERSION = 1
+MAGIC = b'FMSNAP\x00\x00'
+_HEADER_LENGTH = struct.Struct('<I')
+
+
+def snapshot_path(source_path: str) -> str:
+    """Return the path of the snapshot of the given source file."""
+    return source_path + '.snapshot'
+
+
+def source_key(source_path: str, schema: str) -> dict[str, Any]:
+    """Return the key that identifies the current contents of the given source file under the given schema."""
+    stat = os.stat(source_path)
+    digest = hashlib.sha256()
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return {'path': os.path.abspath(source_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': digest.hexdigest(),
+            'schema': schema}
+
+
+def write_snapshot(source_path: str, key: dict[str, Any], columns: dict[str, Any]) -> None:
+    """Write a snapshot of the given columns for the given source file, replacing any existing snapshot.
+
+    key should be the source_key of the source file taken before the columns were built from it, so that a
+    change to the source made in the meantime invalidates the snapshot. The snapshot is written to a temporary
+    file first and then moved into place, so a reader never sees a partially written snapshot.
+
+    Preconditions:
+        - every value in columns can be serialized with marshal
+    """
+    blobs = {name: marshal.dumps(value) for name, value in columns.items()}
+    table = {}
+    offset = 0
+    for name, blob in blobs.items():
+        table[name] = [offset, len(blob)]
+        offset += len(blob)
+
+    header = json.dumps({'version': SNAPSHOT_VERSION, 'key': key, 'columns': table}).encode('utf-8')
+    path = snapshot_path(source_path)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for blob in blobs.values():
+            f.write(blob)
+    os.replace(temp_path, path)
+
+
+def read_snapshot(source_path: str, schema: str, names: Collection[str]) -> Optional[dict[str, Any]]:
+    """Return the columns with the given names from the snapshot of the given source file.
+
+    Return None if there is no snapshot, if it was written by another version of this module or under another
+    schema, if the source file has changed since it was written, or if it does not have every requested column.
+    Return None too if the snapshot is truncated or corrupt, so the caller rebuilds the data instead.
+    """
+    try:
+        f = open(snapshot_path(source_path), 'rb')
+    except OSError:
+        return None
+
+    with f:
+        try:
+            return _read_columns(f, source_path, schema, names)
+        except (OSError, EOFError, ValueError, TypeError, KeyError, struct.error):
+            return None
+
+
+def _read_columns(f: BinaryIO, source_path: str, schema: str, names: Collection[str]) -> Optional[dict[str, Any]]:
+    """Return the columns read_snapshot returns from the given open snapshot file.
+
+    Raise an exception such as EOFError, ValueError or struct.error if the snapshot is truncated or corrupt.
+    """
+    if f.read(len(MAGIC)) != MAGIC:
+        return None
+    (header_length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+    header = json.loads(f.read(header_length))
+
+    if header['version'] != SNAPSHOT_VERSION or header['key'] != source_key(source_path, schema):
+        return None
+    if any(name not in header['columns'] for name in names):
+        return None
+
+    columns_start = f.tell()
+    columns = {}
+    for name in names:
+        offset, length = header['columns'][name]
+        f.seek(columns_start + offset)
+        blob = f.read(length)
+        if len(blob) != length:
+            raise EOFError
+        columns[name] = marshal.loads(blob)
+
+    return columns
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['hashlib', 'json', 'marshal', 'os', 'struct'],
+        'allowed-io': ['source_key', 'write_snapshot', 'read_snapshot', '_read_columns'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,126 @@
+"""
+This Python module renders the text of the interface.
+
+A TextCache shares one pygame.font.Font per font file and size, keeps the most recently used rendered lines of
+text, and memoizes how paragraphs wrap, so redrawing a widget whose text has already been shown costs no font
+rendering at all.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import pygame
+
+
+class TextCache:
+    """Shared fonts, and least recently used caches of rendered lines and wrapped paragraphs.
+
+    Instance Attributes:
+        - max_surfaces: the largest number of rendered lines kept
+        - max_wraps: the largest number of wrapped paragraphs kept
+    """
+    # Private Instance Attributes:
+    #     - _fonts: maps (font path, size) to the shared font
+    #     - _surfaces: maps (font, text, colour) to the rendered line, least recently used first
+    #     - _wraps: maps (font, text, width) to the lines the text wraps into, least recently used first
+    max_surfaces: int
+    max_wraps: int
+    _fonts: dict[tuple[str, int], pygame.font.Font]
+    _surfaces: OrderedDict[tuple[pygame.font.Font, str, tuple[int, ...]], pygame.Surface]
+    _wraps: OrderedDict[tuple[pygame.font.Font, str, int], tuple[str, ...]]
+
+    def __init__(self, max_surfaces: int = 512, max_wraps: int = 64) -> None:
+        """Initialize an empty text cache.
+
+        Preconditions:
+            - max_surfaces > 0
+            - max_wraps > 0
+        """
+        self.max_surfaces = max_surfaces
+        self.max_wraps = max_wraps
+        self._fonts = {}
+        self._surfaces = OrderedDict()
+        self._wraps = OrderedDict()
+
+    def font(self, path: str, size: int) -> pygame.font.Font:
+        """Return the shared font loaded from the given path at the given size."""
+        if (path, size) not in self._fonts:
+            self._fonts[(path, size)] = pygame.font.Font(path, size)
+        return self._fonts[(path, size)]
+
+    def render(self, font: pygame.font.Font, text: str, colour: tuple[int, ...]) -> pygame.Surface:
+        """Return the given line of text rendered antialiased in the given font and colour."""
+        key = (font, text, tuple(colour))
+        surface = _lookup(self._surfaces, key)
+        if surface is None:
+            surface = font.render(text, True, colour)
+            _store(self._surfaces, key, surface, self.max_surfaces)
+        return surface
+
+    def wrap(self, font: pygame.font.Font, text: str, width: int) -> tuple[str, ...]:
+        """Return the lines the given text wraps into so that each is at most width pixels wide in the given font.
+
+        Lines break between words. A word wider than width on its own is broken between characters.
+
+        Preconditions:
+            - width > 0
+        """
+        key = (font, text, width)
+        lines = _lookup(self._wraps, key)
+        if lines is None:
+            lines = tuple(_wrapped_lines(font, text, width))
+            _store(self._wraps, key, lines, self.max_wraps)
+        return lines
+
+
+def _lookup(cache: OrderedDict, key: Hashable) -> Any:
+    """Return the value of the given key in the given least recently used cache, or None if it is not there."""
+    value = cache.get(key)
+    if value is not None:
+        cache.move_to_end(key)
+    return value
+
+
+def _store(cache: OrderedDict, key: Hashable, value: Any, max_items: int) -> None:
+    """Store the given value in the given least recently used cache, evicting the least recently used values
+    beyond max_items.
+    """
+    cache[key] = value
+    while len(cache) > max_items:
+        cache.popitem(last=False)
+
+
+def _wrapped_lines(font: pygame.font.Font, text: str, width: int) -> list[str]:
+    """Return the lines the given text wraps into so that each is at most width pixels wide in the given font."""
+    lines = []
+    line = ''
+    for word in text.split():
+        candidate = f'{line} {word}' if line else word
+        if font.size(candidate)[0] <= width:
+            line = candidate
+            continue
+        if line:
+            lines.append(line)
+        # break the word between characters while it does not fit on a line of its own
+        while font.size(word)[0] > width and len(word) > 1:
+            end = len(word) - 1
+            while end > 1 and font.size(word[:end])[0] > width:
+                end -= 1
+            lines.append(word[:end])
+            word = word[end:]
+        line = word
+    if line:
+        lines.append(line)
+    return lines
+
+
+if __name__ == '__main__':
+    # import doctest
+    # doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'pygame'],
+        'max-line-length': 120
+    })
@@ -0,0 +1,414 @@
+"""
+This Python module is a full-text search engine for recipes: it tokenises their text, keeps an inverted index of
+the words in it, and ranks recipes against a query with BM25.
+
+Each recipe is one document made of the fields in FIELD_WEIGHTS. A word counts as many times as the weight of the
+field it appears in, so a match in the name of a recipe ranks above one in its steps. The terms of a TextIndex are
+kept in sorted order, and the postings of every term are stored one after another in NumPy arrays, each with its
+BM25 score (its impact) worked out when the index is built. Answering a query only adds up slices of those arrays.
+
+The last word of a query can also be taken as the start of a word, so results can be shown while the user is
+still typing it.
+"""
+
+from __future__ import annotations
+from array import array
+from typing import Any, Iterable, Iterator, Optional
+import bisect
+import itertools
+import re
+import unicodedata
+
+import numpy as np
+
+# The fields of a recipe that are searched, and how many times a word in each of them counts
+FIELD_WEIGHTS = {'name': 3.0, 'dish_type': 2.0, 'description': 1.0, 'steps': 1.0}
+# The BM25 parameters: how quickly repeating a word stops raising a score, and how much long documents are
+# penalised
+K1 = 1.2
+B = 0.75
+# The largest number of words the last word of a query stands for when it is taken as the start of a word
+MAX_EXPANSIONS = 50
+# The snapshot columns that TextIndex.to_columns writes
+COLUMNS = ('search_ids', 'search_terms', 'search_starts', 'search_docs', 'search_impacts', 'search_stats')
+
+_WORD = re.compile(r'[a-z0-9]+')
+_STOP_WORDS = frozenset(('a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have',
+                         'in', 'into', 'is', 'it', 'its', 'of', 'on', 'or', 'so', 'that', 'the', 'then', 'this',
+                         'to', 'with', 'you', 'your'))
+
+
+def words(text: str) -> list[str]:
+    """Return the words of the given text, in lower case and without accents.
+
+    >>> words('Crème brûlée, in 20 mins!')
+    ['creme', 'brulee', 'in', '20', 'mins']
+    """
+    text = text.lower()
+    if not text.isascii():
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def tokenise(text: str) -> list[str]:
+    """Return the words of the given text that are searched for, which leaves out common English words.
+
+    >>> tokenise('Smoked salmon, quinoa & dill lunch pot')
+    ['smoked', 'salmon', 'quinoa', 'dill', 'lunch', 'pot']
+    """
+    return [word for word in words(text) if word not in _STOP_WORDS]
+
+
+def document_terms(recipe: dict) -> dict[str, float]:
+    """Return the weighted number of times each term appears in the fields of the given recipe in FIELD_WEIGHTS.
+
+    Fields that are missing, or None, are left out, and a field holding a list of strings, such as 'steps', is
+    searched as if they were one string.
+
+    >>> document_terms({'name': 'Salmon pot', 'description': 'Easy salmon'})
+    {'salmon': 4.0, 'pot': 3.0, 'easy': 1.0}
+    """
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = recipe.get(field)
+        if isinstance(value, list):
+            value = ' '.join(value)
+        for term in tokenise(value or ''):
+            terms[term] = terms.get(term, 0.0) + weight
+    return terms
+
+
+class TextIndex:
+    """A BM25 index of the text of some recipes.
+
+    Documents are numbered in the order they were added, and ties between equal scores are broken by that order.
+    Documents added after the index was built (see add) are kept apart in dicts, and are scored with the
+    statistics of the index as it was built, so building the index again may change their scores slightly.
+
+    Instance Attributes:
+        - recipe_ids: the recipe id of each document, indexed by its number, including removed documents
+        - terms: the terms of the documents the index was built with, in sorted order
+
+    Representation Invariants:
+        - self.terms == sorted(self.terms)
+        - len(self._starts) == len(self.terms) + 1
+    """
+    # Private Instance Attributes:
+    #     - _numbers: maps the recipe id of each document that has not been removed to its number
+    #     - _starts: the position in _docs and _impacts of the postings of each term, indexed by its number in
+    #       terms, followed by the number of postings
+    #     - _docs: the numbers of the documents each term appears in, term after term, in increasing order
+    #     - _impacts: the BM25 score of each posting in _docs
+    #     - _live: whether each document the index was built with has not been removed, indexed by its number
+    #     - _average_length: the average weighted number of terms in the documents the index was built with
+    #     - _extra_terms: maps each term of the documents added after the index was built to a dict mapping the
+    #       number of each of those documents it appears in to its weighted frequency
+    #     - _extra_lengths: maps the number of each document added after the index was built to its weighted
+    #       number of terms
+    recipe_ids: list[Any]
+    terms: list[str]
+    _numbers: dict[Any, int]
+    _starts: np.ndarray
+    _docs: np.ndarray
+    _impacts: np.ndarray
+    _live: np.ndarray
+    _average_length: float
+    _extra_terms: dict[str, dict[int, float]]
+    _extra_lengths: dict[int, float]
+
+    def __init__(self, recipe_ids: list[Any], terms: list[str], starts: np.ndarray, docs: np.ndarray,
+                 impacts: np.ndarray, average_length: float) -> None:
+        """Initialize an index from its postings, as laid out by from_postings.
+
+        Preconditions:
+            - terms == sorted(terms)
+            - len(starts) == len(terms) + 1
+        """
+        self.recipe_ids = list(recipe_ids)
+        self.terms = terms
+        self._numbers = {recipe_id: number for number, recipe_id in enumerate(self.recipe_ids)}
+        self._starts = starts
+        self._docs = docs
+        self._impacts = impacts
+        self._live = np.ones(len(self.recipe_ids), dtype=bool)
+        self._average_length = average_length
+        self._extra_terms = {}
+        self._extra_lengths = {}
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple[Any, dict[str, float]]]) -> TextIndex:
+        """Return an index of the given (recipe id, document_terms of the recipe) documents.
+
+        Preconditions:
+            - no two documents have the same recipe id
+        """
+        recipe_ids = []
+        term_numbers = {}
+        term_column, doc_column, frequency_column = array('l'), array('l'), array('d')
+        for number, (recipe_id, terms) in enumerate(documents):
+            recipe_ids.append(recipe_id)
+            for term, frequency in terms.items():
+                term_column.append(term_numbers.setdefault(term, len(term_numbers)))
+                doc_column.append(number)
+                frequency_column.append(frequency)
+
+        return cls.from_postings(recipe_ids, list(term_numbers), np.array(term_column, dtype=np.int32),
+                                 np.array(doc_column, dtype=np.int32), np.array(frequency_column))
+
+    @classmethod
+    def from_postings(cls, recipe_ids: list[Any], terms: list[str], term_numbers: np.ndarray,
+                      doc_numbers: np.ndarray, frequencies: np.ndarray) -> TextIndex:
+        """Return an index of the given documents, where term terms[term_numbers[i]] appears in the document with
+        number doc_numbers[i] with the weighted frequency frequencies[i].
+
+        Every posting is sorted into place and scored at once with NumPy.
+
+        Preconditions:
+            - len(term_numbers) == len(doc_numbers) == len(frequencies)
+            - no term appears twice in the same document
+        """
+        count = len(recipe_ids)
+        lengths = np.bincount(doc_numbers, weights=frequencies, minlength=count)
+        average_length = float(lengths.mean()) if count > 0 and lengths.any() else 1.0
+
+        # renumber the terms in sorted order, so the ones that start with the same letters are next to each other
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        ranks = np.empty(len(terms), dtype=np.int32)
+        ranks[order] = np.arange(len(terms), dtype=np.int32)
+        term_numbers = ranks[term_numbers]
+
+        postings = np.lexsort((doc_numbers, term_numbers))
+        term_numbers, doc_numbers = term_numbers[postings], doc_numbers[postings]
+        frequencies = frequencies[postings]
+        doc_freqs = np.bincount(term_numbers, minlength=len(terms))
+        starts = np.concatenate(([0], np.cumsum(doc_freqs))).astype(np.int64)
+
+        impacts = _idf(doc_freqs, count)[term_numbers] * _saturation(frequencies, lengths[doc_numbers],
+                                                                      average_length)
+        return cls(recipe_ids, [terms[i] for i in order], starts, doc_numbers.astype(np.int32),
+                   impacts.astype(np.float32), average_length)
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, Any]) -> TextIndex:
+        """Return the index stored in the given snapshot columns, as written by to_columns."""
+        _, average_length = columns['search_stats']
+        return cls(columns['search_ids'], columns['search_terms'],
+                   np.frombuffer(columns['search_starts'], dtype=np.int64),
+                   np.frombuffer(columns['search_docs'], dtype=np.int32),
+                   np.frombuffer(columns['search_impacts'], dtype=np.float32), average_length)
+
+    def to_columns(self) -> dict[str, Any]:
+        """Return the snapshot columns (see COLUMNS) that hold this index, which from_columns reads back.
+
+        Preconditions:
+            - no document has been added to or removed from this index since it was built
+        """
+        return {'search_ids': self.recipe_ids,
+                'search_terms': self.terms,
+                'search_starts': self._starts.tobytes(),
+                'search_docs': self._docs.tobytes(),
+                'search_impacts': self._impacts.tobytes(),
+                'search_stats': [len(self.recipe_ids), self._average_length]}
+
+    def __contains__(self, recipe_id: Any) -> bool:
+        """Return whether this index has a document with the given recipe id that has not been removed."""
+        return recipe_id in self._numbers
+
+    def add(self, recipe_id: Any, terms: dict[str, float]) -> None:
+        """Add a document with the given recipe id and document_terms, replacing any document with that id."""
+        self.remove(recipe_id)
+        number = len(self.recipe_ids)
+        self.recipe_ids.append(recipe_id)
+        self._numbers[recipe_id] = number
+        self._extra_lengths[number] = sum(terms.values())
+        for term, frequency in terms.items():
+            self._extra_terms.setdefault(term, {})[number] = frequency
+
+    def remove(self, recipe_id: Any) -> None:
+        """Remove the document with the given recipe id from this index. Do nothing if there is none."""
+        number = self._numbers.pop(recipe_id, None)
+        if number is None:
+            return
+        if number < len(self._live):
+            self._live[number] = False
+        else:
+            del self._extra_lengths[number]
+            for term in [term for term, frequencies in self._extra_terms.items() if number in frequencies]:
+                del self._extra_terms[term][number]
+                if not self._extra_terms[term]:
+                    del self._extra_terms[term]
+
+    def search(self, query: str, k: Optional[int] = 10, prefix: bool = False) -> list[tuple[Any, float]]:
+        """Return the recipe ids of the k documents that best match the given query, with their scores, from the
+        highest score to the lowest. If k is None, return every document that matches.
+
+        A document matches if it has any of the terms of the query. If prefix is True, the last word of the query
+        also stands for the MAX_EXPANSIONS most common terms that start with it.
+
+        Preconditions:
+            - k is None or k >= 0
+        """
+        if k == 0:
+            return []
+        return list(itertools.islice(self.ranked(query, prefix, k or 64), k))
+
+    def ranked(self, query: str, prefix: bool = False, first: int = 64) -> Iterator[tuple[Any, float]]:
+        """Yield the recipe id and score of every document that matches the given query, as in search, from the
+        highest score to the lowest.
+
+        Only the best first documents are sorted before the first is yielded; the rest are sorted if more are
+        asked for, so a caller that stops early, such as one that filters the documents, does not pay for them.
+
+        Preconditions:
+            - first >= 1
+        """
+        docs, scores = self._scores(query, prefix)
+        if len(docs) > first:
+            # every document in the first few scores at least the first-highest score
+            threshold = np.partition(scores, len(scores) - first)[len(scores) - first]
+            head = scores >= threshold
+            yield from self._ordered(docs[head], scores[head])
+            docs, scores = docs[~head], scores[~head]
+        yield from self._ordered(docs, scores)
+
+    def _ordered(self, docs: np.ndarray, scores: np.ndarray) -> Iterator[tuple[Any, float]]:
+        """Yield the recipe id and score of the given documents, from the highest score to the lowest, with ties
+        in the order of their numbers.
+        """
+        for i in np.lexsort((docs, -scores)).tolist():
+            yield self.recipe_ids[docs[i]], float(scores[i])
+
+    def _scores(self, query: str, prefix: bool) -> tuple[np.ndarray, np.ndarray]:
+        """Return the numbers of the documents that match the given query and have not been removed, and their
+        scores.
+        """
+        query_words = words(query)
+        last = query_words.pop() if prefix and query_words else None
+        groups = [self._postings([term]) for term in dict.fromkeys(query_words) if term not in _STOP_WORDS]
+        if last is not None:
+            groups.append(self._best_postings(self._expand(last)))
+        if not groups:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+
+        docs = np.concatenate([group[0] for group in groups])
+        impacts = np.concatenate([group[1] for group in groups])
+        if len(docs) * 8 < len(self.recipe_ids):
+            # few postings are added up by sorting them, rather than by counting into every document
+            matched, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=impacts)
+        else:
+            totals = np.bincount(docs, weights=impacts, minlength=len(self.recipe_ids))
+            # impacts are positive, and nonzero is several times faster over booleans than over floats
+            matched = np.flatnonzero(totals > 0)
+            scores = totals[matched]
+
+        built = matched < len(self._live)
+        keep = np.ones(len(matched), dtype=bool)
+        keep[built] = self._live[matched[built]]
+        return matched[keep], scores[keep]
+
+    def _expand(self, start: str) -> list[str]:
+        """Return the MAX_EXPANSIONS terms of this index that start with the given letters and appear in the most
+        documents.
+        """
+        low = bisect.bisect_left(self.terms, start)
+        high = bisect.bisect_left(self.terms, start + '\uffff', low)
+        expansions = self.terms[low:high] + [term for term in self._extra_terms
+                                             if term.startswith(start) and self._term_number(term) is None]
+        if len(expansions) > MAX_EXPANSIONS:
+            doc_freqs = {term: self._doc_freq(term) for term in expansions}
+            expansions = sorted(expansions, key=lambda term: -doc_freqs[term])[:MAX_EXPANSIONS]
+        return expansions
+
+    def _term_number(self, term: str) -> Optional[int]:
+        """Return the number of the given term in terms, or None if this index was not built with it."""
+        i = bisect.bisect_left(self.terms, term)
+        return i if i < len(self.terms) and self.terms[i] == term else None
+
+    def _doc_freq(self, term: str) -> int:
+        """Return the number of documents the given term appears in, including removed ones."""
+        i = self._term_number(term)
+        built = 0 if i is None else int(self._starts[i + 1] - self._starts[i])
+        return built + len(self._extra_terms.get(term, ()))
+
+    def _best_postings(self, terms: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Return the document numbers and impacts of the postings of the given terms, keeping only the posting
+        with the highest impact for each document, so that a word typed in part scores a document as its best
+        completion rather than the sum of all of them.
+        """
+        postings = [self._term_postings(term) for term in terms]
+        if sum(len(docs) for docs, _ in postings) * 8 < len(self.recipe_ids):
+            docs, impacts = _concatenate(postings)
+            order = np.lexsort((-impacts, docs))
+            docs, impacts = docs[order], impacts[order]
+            first = np.ones(len(docs), dtype=bool)
+            first[1:] = docs[1:] != docs[:-1]
+            return docs[first], impacts[first]
+
+        # many postings are merged into the best impact of every document instead of being sorted; no document
+        # appears twice in the postings of one term
+        best = np.zeros(len(self.recipe_ids), dtype=np.float32)
+        for docs, impacts in postings:
+            best[docs] = np.maximum(best[docs], impacts)
+        matched = np.flatnonzero(best > 0)
+        return matched.astype(np.int32), best[matched]
+
+    def _postings(self, terms: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Return the document numbers and impacts of every posting of the given terms, including those of
+        removed documents.
+        """
+        return _concatenate([self._term_postings(term) for term in terms])
+
+    def _term_postings(self, term: str) -> tuple[np.ndarray, np.ndarray]:
+        """Return the document numbers and impacts of every posting of the given term, including those of removed
+        documents.
+        """
+        docs, impacts = [], []
+        i = self._term_number(term)
+        if i is not None:
+            docs.append(self._docs[self._starts[i]:self._starts[i + 1]])
+            impacts.append(self._impacts[self._starts[i]:self._starts[i + 1]])
+        if term in self._extra_terms:
+            extra = self._extra_terms[term]
+            docs.append(np.fromiter(extra, dtype=np.int32, count=len(extra)))
+            frequencies = np.fromiter(extra.values(), dtype=np.float64, count=len(extra))
+            lengths = np.array([self._extra_lengths[number] for number in extra])
+            idf = _idf(np.array([self._doc_freq(term)]), len(self._live) + len(self._extra_lengths))[0]
+            impacts.append((idf * _saturation(frequencies, lengths, self._average_length)).astype(np.float32))
+        return _concatenate(list(zip(docs, impacts)))
+
+
+def _idf(doc_freqs: np.ndarray, count: int) -> np.ndarray:
+    """Return the BM25 inverse document frequency of terms that appear in the given numbers of documents out of
+    count. It is always positive, so a common term never lowers a score.
+    """
+    return np.log1p((count - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+
+def _concatenate(postings: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    """Return the document numbers and impacts of the given (document numbers, impacts) postings, one after
+    another.
+    """
+    if not postings:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+    if len(postings) == 1:
+        return postings[0]
+    return np.concatenate([docs for docs, _ in postings]), np.concatenate([impacts for _, impacts in postings])
+
+
+def _saturation(frequencies: np.ndarray, lengths: np.ndarray, average_length: float) -> np.ndarray:
+    """Return the BM25 term frequency part of the scores of terms with the given weighted frequencies in
+    documents of the given weighted lengths.
+    """
+    return frequencies * (K1 + 1) / (frequencies + K1 * (1 - B + B * lengths / average_length))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'extra-imports': ['array', 'bisect', 'itertools', 're', 'unicodedata', 'numpy'],
+        'max-line-length': 120
+    })
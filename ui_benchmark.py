@@ -0,0 +1,98 @@
+"""
+This Python module benchmarks the pygame interface without a display.
+
+It runs interface.run_game under SDL's dummy video driver, replays a scripted sequence of mouse input through
+it, and reports the frame times, the draw time of each screen, the graph build time and the image fetch times
+as JSON. Running this module replays DEFAULT_SCRIPT, or the script in the JSON file given as its argument, and
+prints the report.
+
+A script is a list of steps, each one of:
+    - {"move": [x, y]}: move the mouse to (x, y)
+    - {"click": [x, y]}: move the mouse to (x, y), press the left button, and release it on the next frame
+    - {"wait": n}: let n frames pass without input
+"""
+
+from __future__ import annotations
+from typing import Any, Optional
+import json
+import os
+import sys
+
+import pygame
+
+import interface
+import rendering
+
+# Each click is followed by a few frames without input, so the screen it leads to is drawn before the next click
+_FRAMES_AFTER_CLICK = 3
+
+# Main menu -> Vegan Recipes -> Easy -> 1 ~ 2 -> Quick -> hover over the results -> the first recipe
+DEFAULT_SCRIPT = [
+    {'click': [160, 240]},
+    {'click': [110, 420]}, {'click': [510, 630]},
+    {'click': [110, 120]}, {'click': [510, 630]},
+    {'click': [110, 120]}, {'click': [510, 630]},
+    {'click': [110, 120]}, {'click': [510, 630]},
+    {'wait': 60},
+    {'move': [300, 110]}, {'wait': 2}, {'move': [300, 225]}, {'wait': 2}, {'move': [300, 340]}, {'wait': 2},
+    {'move': [300, 455]}, {'wait': 2}, {'move': [300, 570]}, {'wait': 2},
+    {'click': [60, 80]},
+    {'wait': 30}
+]
+
+
+def script_frames(script: list[dict[str, Any]]) -> list[list[pygame.event.Event]]:
+    """Return the events of each frame of the given script.
+
+    >>> frames = script_frames([{'click': [10, 20]}, {'wait': 2}])
+    >>> [[pygame.event.event_name(event.type) for event in frame] for frame in frames]
+    [['MouseMotion', 'MouseButtonDown'], ['MouseButtonUp'], [], [], [], [], []]
+    """
+    frames = []
+    for step in script:
+        if 'move' in step:
+            frames.append([_motion(step['move'])])
+        elif 'click' in step:
+            pos = tuple(step['click'])
+            frames.append([_motion(pos), pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1)])
+            frames.append([pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1)])
+            frames.extend([] for _ in range(_FRAMES_AFTER_CLICK))
+        else:
+            frames.extend([] for _ in range(step['wait']))
+    return frames
+
+
+def _motion(pos: Any) -> pygame.event.Event:
+    """Return a mouse motion event to the given position."""
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=tuple(pos), rel=(0, 0), buttons=(0, 0, 0))
+
+
+def run_benchmark(script: Optional[list[dict[str, Any]]] = None, engine: str = 'graph',
+                  fps: int = 60) -> dict[str, Any]:
+    """Replay the given script through the interface without a display, and return the report of the run.
+
+    The frame rate is capped at fps throughout, so waits in the script take real time, for images to be
+    fetched in. The report also has the number of frames replayed and the fps cap.
+
+    Preconditions:
+        - engine in {'graph', 'compact'}
+        - fps >= 1
+    """
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    # the first frame draws the main menu, so there is something on screen to receive the script's input
+    frames = [[]] + script_frames(DEFAULT_SCRIPT if script is None else script)
+    stats = rendering.RunStats()
+    interface.run_game(engine, fps=fps, idle_fps=fps, replay=frames, stats=stats)
+
+    report = stats.report()
+    report['script_frames'] = len(frames)
+    report['fps_cap'] = fps
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            print(json.dumps(run_benchmark(json.load(f)), indent=2))
+    else:
+        print(json.dumps(run_benchmark(), indent=2))